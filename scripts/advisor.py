@@ -0,0 +1,465 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a Monte Carlo bid advisor for the bidding phase of a round of Blackout (Blackout.Bid()).
+#
+# For a given player it repeatedly deals the cards he cannot see (every card except his own hand and the TrumpCard) at random to the other players (determinization), plays each such deal out quickly with a simple card play heuristic and counts the tricks he takes. The result is a distribution of the number of tricks he can expect to take from which the best legal bid (respecting the restriction on the dealer's bid) is chosen.
+#
+# The distribution only depends on the hand up to a relabelling of the non-trump suits, so results are memoized under a canonical signature of the hand in a bounded LRU cache shared by all the tables served by the process.
+#
+# For bots that must answer without any computation the file also implements an offline bid table (BidTable and buildBidTable()). Hands are reduced to coarse hand classes (see handClass()) whose expected number of tricks is estimated once from a large number of random deals and written to a flat file. At run time the file is memory-mapped (so that all the server processes share one copy through the page cache) and a bid is a single lookup.
+
+# Usage (from the terminal) to build a bid table:
+#
+# python advisor.py bids5.tbl --players 5 --deals 100000
+
+
+import mmap
+import random
+import struct
+import sys
+import threading
+
+from array import array
+
+from collections import OrderedDict
+
+from cards import *		# Access the integer card core
+
+
+
+class BidAdvisor :
+
+	'''
+	Monte Carlo bid advisor with a memoized LRU cache of results.
+
+	samples: <INT> Number of random deals of the unseen cards played out for each (uncached) query.
+
+	cacheSize: <INT> Maximum number of results kept in the cache. The least recently used result is evicted first.
+
+	Example:
+
+	advisor = BidAdvisor()
+	advice = advisor.advise( game, game.Bidder )
+	game.Bid( game.Bidder, advice[ 'bid' ] )
+	'''
+
+	def __init__( self, samples = 200, cacheSize = 10000 ) :
+
+		self.samples = samples
+		self.cacheSize = cacheSize
+
+		self._cache = OrderedDict()		# Maps hand signatures to distributions, in order of use
+		self._lock = threading.Lock()		# The advisor may be shared by tables served from several threads
+
+		self.hits = 0
+		self.misses = 0
+
+
+	def advise( self, game, player ) :
+
+		'''
+		Advises 'player' on his bid in the current round of the Blackout object 'game' (after Deal() and before the player has bid). Returns a dictionary containing:
+
+		distribution: The list of the probabilities of the player taking 0, 1, ..., numTricks tricks.
+
+		expected: The expected number of tricks.
+
+		bid: The legal bid (see Blackout.legalBids()) that maximizes the expected score, that is the legal number of tricks he is most likely to take.
+		'''
+
+		distribution = self.distribution( game.Hand[ player ], game.TrumpCard.index, game.numPlayers, ( player - game.Leader ) % game.numPlayers )
+
+		expected = 0.0
+
+		for tricks in range( len( distribution ) ) :
+
+			expected += tricks * distribution[ tricks ]
+
+		bid = max( game.legalBids( player ), key = lambda bid : distribution[ bid ] )
+
+		return { 'distribution': distribution, 'expected': expected, 'bid': bid }
+
+
+	def distribution( self, hand, trumpCard, numPlayers, position ) :
+
+		'''
+		Returns the distribution of the number of tricks taken by a player holding 'hand' (a mask) when 'trumpCard' (integer identity) was turned up, at a table of 'numPlayers' where he plays in 'position' (0 for the leader of the first trick).
+		'''
+
+		key = signature( hand, trumpCard, numPlayers, position )
+
+		with self._lock :
+
+			if key in self._cache :
+
+				self._cache[ key ] = self._cache.pop( key )		# Mark as the most recently used
+
+				self.hits += 1
+
+				return self._cache[ key ]
+
+			self.misses += 1
+
+
+		distribution = _estimate( hand, trumpCard, numPlayers, position, self.samples, random.Random( repr( key ) ) )		# Seeded by the signature so the result does not depend on the order of the queries
+
+
+		with self._lock :
+
+			self._cache[ key ] = distribution
+
+			while len( self._cache ) > self.cacheSize :
+
+				self._cache.popitem( last = False )		# Evict the least recently used result
+
+		return distribution
+
+
+
+def signature( hand, trumpCard, numPlayers, position ) :
+
+	'''
+	Returns the canonical signature of a bidding position. The trump suit is kept apart while the non-trump suits are isomorphic (which suit is which does not change the odds) so their 13-bit rank patterns are sorted.
+	'''
+
+	trump = trumpCard // NUM_RANKS
+
+	others = []
+
+	for suit in range( NUM_SUITS ) :
+
+		if suit != trump :
+
+			others.append( ( hand >> ( suit * NUM_RANKS ) ) & 0x1FFF )
+
+	others.sort()
+
+	return ( numPlayers, position, trumpCard % NUM_RANKS, ( hand >> ( trump * NUM_RANKS ) ) & 0x1FFF ) + tuple( others )
+
+
+
+def _estimate( hand, trumpCard, numPlayers, position, samples, rng ) :
+
+	'''
+	Deals the unseen cards at random 'samples' times, plays each deal out with _playout() and returns the distribution of the number of tricks taken by the player.
+	'''
+
+	numTricks = countOf( hand )
+
+	unseen = cardsOf( FULL_MASK & ~hand & ~( 1 << trumpCard ) )
+
+	trump = trumpCard // NUM_RANKS
+
+	counts = [ 0 ] * ( numTricks + 1 )
+
+	for sample in range( samples ) :
+
+		dealt = rng.sample( unseen, numTricks * ( numPlayers - 1 ) )
+
+		hands = []
+
+		for seat in range( numPlayers ) :
+
+			if seat == position :
+
+				hands.append( hand )
+
+			else :
+
+				hands.append( maskOf( dealt[ : numTricks ] ) )
+
+				dealt = dealt[ numTricks : ]
+
+		counts[ _playout( hands, trump, position ) ] += 1
+
+	return [ count / float( samples ) for count in counts ]
+
+
+
+def _playout( hands, trump, seat ) :
+
+	'''
+	Plays a round out from the first trick (led by player 0) with a simple heuristic and returns the number of tricks taken by 'seat'. The leader leads his highest card. The other players play their cheapest card that wins the trick so far if they have one and their lowest card otherwise.
+	'''
+
+	return _playoutAll( hands, trump )[ seat ]
+
+
+
+def _playoutAll( hands, trump ) :
+
+	'''
+	Plays a round out exactly as _playout() does and returns the list of the number of tricks taken by each player.
+	'''
+
+	hands = list( hands )
+
+	numPlayers = len( hands )
+
+	leader = 0
+	tricks = [ 0 ] * numPlayers
+
+	while hands[ leader ] :
+
+		led = NO_SUIT
+
+		for k in range( numPlayers ) :
+
+			player = ( leader + k ) % numPlayers
+
+			hand = hands[ player ]
+
+			if k == 0 :		# Lead the highest card (trumps count as highest)
+
+				cards = cardsOf( hand )
+
+				card = max( cards, key = lambda card : POWER[ trump ][ card // NUM_RANKS ][ card ] * NUM_RANKS + card % NUM_RANKS )
+
+				led = card // NUM_RANKS
+				power = POWER[ trump ][ led ]
+
+				winner, best = player, power[ card ]
+
+			else :
+
+				legal = hand & SUIT_MASK[ led ] or hand
+
+				cards = cardsOf( legal )
+
+				beating = [ card for card in cards if power[ card ] > best ]
+
+				if beating :
+
+					card = min( beating, key = lambda card : power[ card ] )
+
+					winner, best = player, power[ card ]
+
+				else :
+
+					card = min( cards, key = lambda card : card % NUM_RANKS )
+
+			hands[ player ] = hand & ~( 1 << card )
+
+		tricks[ winner ] += 1
+
+		leader = winner
+
+	return tricks
+
+
+
+# Offline bid table.
+#
+# The class of a hand keeps the trump suit apart and reduces every suit to its top honours and the number of its other cards (capped): the ace, king and queen of trumps plus up to 4 other trumps (40 codes), and the ace and king of a side suit plus up to 3 other cards (16 codes). The three side suits are isomorphic so their codes are sorted and packed with the combinatorial number system (816 multisets), which gives 40 * 816 hand classes.
+
+_TRUMP_CODES = 40
+_SIDE_CODES = 16
+_SIDE_CLASSES = 816		# Multisets of 3 side suit codes: C( 16 + 2, 3 )
+
+NUM_CLASSES = _TRUMP_CODES * _SIDE_CLASSES
+
+
+_TABLE_MAGIC = b'BOBT'
+_TABLE_VERSION = 1
+_TABLE_HEADER = struct.Struct( '<4sBBBx' )		# Magic, version, numPlayers, maxTricks (padded to 8 bytes)
+
+UNKNOWN = 0xFFFF		# Stored for hand classes that were not sampled often enough
+
+
+def _suitCode( ranks, top, cap ) :
+
+	'''
+	Returns the code of the 13-bit rank pattern 'ranks' of a suit keeping its 'top' highest ranks and the number of its other cards capped at 'cap'.
+	'''
+
+	honours = ranks >> ( NUM_RANKS - top )
+
+	return honours * ( cap + 1 ) + min( countOf( ranks & ( ( 1 << ( NUM_RANKS - top ) ) - 1 ) ), cap )
+
+
+
+def handClass( hand, trump ) :
+
+	'''
+	Returns the class (an integer from 0 to NUM_CLASSES - 1) of 'hand' (a mask) when 'trump' (a suit index) is trumps.
+	'''
+
+	others = []
+
+	for suit in range( NUM_SUITS ) :
+
+		if suit != trump :
+
+			others.append( _suitCode( ( hand >> ( suit * NUM_RANKS ) ) & 0x1FFF, 2, 3 ) )
+
+	others.sort()
+
+	a, b, c = others
+
+	side = a + ( b + 1 ) * b // 2 + ( c + 2 ) * ( c + 1 ) * c // 6		# Rank of the multiset in the combinatorial number system
+
+	return _suitCode( ( hand >> ( trump * NUM_RANKS ) ) & 0x1FFF, 3, 4 ) * _SIDE_CLASSES + side
+
+
+
+def _tableIndex( numPlayers, numTricks, position, cls ) :
+
+	return ( ( numTricks - 1 ) * numPlayers + position ) * NUM_CLASSES + cls
+
+
+
+class BidTable :
+
+	'''
+	Read-only, memory-mapped bid table written by buildBidTable().
+
+	Example:
+
+	table = BidTable( 'bids5.tbl' )
+	advice = table.advise( game, game.Bidder )
+
+	if advice is not None :
+
+		game.Bid( game.Bidder, advice[ 'bid' ] )
+	'''
+
+	def __init__( self, path ) :
+
+		with open( path, 'rb' ) as f :
+
+			self._map = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+
+		magic, version, self.numPlayers, self.maxTricks = _TABLE_HEADER.unpack_from( self._map, 0 )
+
+		if magic != _TABLE_MAGIC or version != _TABLE_VERSION :
+
+			self._map.close()
+
+			raise ValueError( 'ERROR: %s is not a version %d bid table.' % ( path, _TABLE_VERSION ) )
+
+
+	def close( self ) :
+
+		self._map.close()
+
+
+	def expected( self, hand, trump, numTricks, position ) :
+
+		'''
+		Returns the expected number of tricks taken with 'hand' (a mask) when 'trump' (a suit index) is trumps in a round of 'numTricks' tricks played from 'position' (0 for the leader of the first trick), or None if the hand class was not sampled often enough when the table was built.
+		'''
+
+		value = struct.unpack_from( '<H', self._map, _TABLE_HEADER.size + 2 * _tableIndex( self.numPlayers, numTricks, position, handClass( hand, trump ) ) )[0]
+
+		if value == UNKNOWN :
+
+			return None
+
+		return value / 256.0
+
+
+	def advise( self, game, player ) :
+
+		'''
+		Advises 'player' on his bid in the current round of the Blackout object 'game'. Returns a dictionary containing the expected number of tricks ('expected') and the legal bid closest to it ('bid'), or None if the table has no entry for the hand (fall back on BidAdvisor in that case).
+		'''
+
+		if game.numPlayers != self.numPlayers or not 1 <= game.numTricks <= self.maxTricks :
+
+			raise ValueError( 'ERROR: The bid table was built for %d players and up to %d tricks, not %d players and %d tricks.' % ( self.numPlayers, self.maxTricks, game.numPlayers, game.numTricks ) )
+
+		expected = self.expected( game.Hand[ player ], game.TrumpCard.index // NUM_RANKS, game.numTricks, ( player - game.Leader ) % game.numPlayers )
+
+		if expected is None :
+
+			return None
+
+		bid = min( game.legalBids( player ), key = lambda bid : abs( bid - expected ) )
+
+		return { 'expected': expected, 'bid': bid }
+
+
+
+def buildBidTable( path, numPlayers, maxTricks = 7, deals = 100000, seed = 0, minSamples = 10 ) :
+
+	'''
+	Builds the bid table for games of 'numPlayers' and writes it to 'path'. For each number of tricks from 1 to 'maxTricks' it plays out 'deals' random deals with _playoutAll() and averages the number of tricks taken by every hand class from every position. Classes seen fewer than 'minSamples' times are stored as UNKNOWN.
+	'''
+
+	from blackout import dealMany		# Imported here so that the advisor itself only depends on the card core
+
+	size = maxTricks * numPlayers * NUM_CLASSES
+
+	sums = array( 'I', [ 0 ] ) * size
+	counts = array( 'I', [ 0 ] ) * size
+
+	for numTricks in range( 1, maxTricks + 1 ) :
+
+		shuffled, hands, trumps = dealMany( deals, numPlayers, numTricks, 0, seed )		# The dealer is player 0 so player 1 leads
+
+		for ii in range( deals ) :
+
+			trump = int( trumps[ ii ] ) // NUM_RANKS
+
+			order = [ int( hands[ ii ][ ( 1 + k ) % numPlayers ] ) for k in range( numPlayers ) ]		# In order of play from the leader
+
+			tricks = _playoutAll( order, trump )
+
+			for position in range( numPlayers ) :
+
+				index = _tableIndex( numPlayers, numTricks, position, handClass( order[ position ], trump ) )
+
+				sums[ index ] += tricks[ position ]
+				counts[ index ] += 1
+
+
+	values = array( 'H', [ UNKNOWN ] ) * size
+
+	for index in range( size ) :
+
+		if counts[ index ] >= minSamples :
+
+			values[ index ] = int( round( 256.0 * sums[ index ] / counts[ index ] ) )
+
+	if sys.byteorder != 'little' :
+
+		values.byteswap()
+
+	with open( path, 'wb' ) as f :
+
+		f.write( _TABLE_HEADER.pack( _TABLE_MAGIC, _TABLE_VERSION, numPlayers, maxTricks ) )
+
+		values.tofile( f )
+
+
+
+if __name__ == '__main__' :
+
+	import argparse
+
+	parser = argparse.ArgumentParser( description = 'Build an offline bid table for Blackout.' )
+
+	parser.add_argument( 'path', help = 'File to write the table to' )
+	parser.add_argument( '--players', type = int, default = 5, help = 'Number of players' )
+	parser.add_argument( '--max-tricks', type = int, default = 7, help = 'Maximum number of tricks in a round' )
+	parser.add_argument( '--deals', type = int, default = 100000, help = 'Number of random deals per number of tricks' )
+	parser.add_argument( '--seed', type = int, default = 0, help = 'Seed of the random deals' )
+
+	args = parser.parse_args()
+
+	buildBidTable( args.path, args.players, min( args.max_tricks, 51 // args.players ), args.deals, args.seed )
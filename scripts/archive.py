@@ -0,0 +1,383 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a columnar archive of finished games of Blackout for analysis.
+#
+# An archive is a directory holding games of one size (numPlayers and maxTricks). Every column is a flat file of fixed-size little-endian records, one per game, appended to as games finish:
+#
+# hands: The hands dealt in each round as masks (uint64, numRounds x numPlayers per game).
+# trumpCard: The integer identity of the trump card turned up in each round (uint8, numRounds per game).
+# dealer: The dealer of each round (uint8, numRounds per game).
+# bids, tricks, points: Blackout.Bids, Blackout.Tricks and Blackout.Points (int8, uint8 and uint8, numRounds x numPlayers per game).
+#
+# The columns of a game are written one after the other, so a writer that crashes can leave the first columns one game longer than the others. The reader only uses the games complete in every column and the writer truncates the columns to those games when it opens the archive, so that the next game appended is aligned in every column again. An archive has a single writer at a time.
+#
+# The reader memory-maps the columns so that queries over millions of games only touch the pages they need. With NumPy the columns are numpy.memmap arrays of shape ( games, numRounds[, numPlayers ] ) and the queries are vectorized, a chunk of games at a time so that the temporary arrays stay small. Without NumPy they are memoryviews of the same shape.
+
+
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+
+from cards import *		# Access the integer card core
+
+
+# NumPy is optional (see blackout.py).
+
+try :
+
+	import numpy
+
+except ImportError :
+
+	numpy = None
+
+
+
+ARCHIVE_VERSION = 1
+
+_META = struct.Struct( '<BBB' )		# Version, numPlayers, maxTricks
+
+
+# The columns: ( name, typecode of the array module, whether there is one entry per player in each round ):
+
+COLUMNS = ( ( 'hands', 'Q', True ), ( 'trumpCard', 'B', False ), ( 'dealer', 'B', False ), ( 'bids', 'b', True ), ( 'tricks', 'B', True ), ( 'points', 'B', True ) )
+
+
+
+def _meta( path ) :
+
+	'''
+	Reads the size of the games in the archive at 'path'. Returns ( numPlayers, maxTricks ) or None if there is no archive there yet.
+	'''
+
+	name = os.path.join( path, 'meta' )
+
+	if not os.path.exists( name ) :
+
+		return None
+
+	with open( name, 'rb' ) as f :
+
+		data = f.read()
+
+	if len( data ) != _META.size or bytearray( data[ :1 ] )[0] != ARCHIVE_VERSION :
+
+		raise ValueError( 'ERROR: %s is not a version %d Blackout archive.' % ( path, ARCHIVE_VERSION ) )
+
+	return _META.unpack( data )[ 1: ]
+
+
+
+def _size( name ) :
+
+	return os.path.getsize( name ) if os.path.exists( name ) else 0
+
+
+
+def _records( numPlayers, numRounds ) :
+
+	'''
+	Returns the size in bytes of the record of a game in each column of COLUMNS.
+	'''
+
+	return [ array( typecode ).itemsize * numRounds * ( numPlayers if perPlayer else 1 ) for name, typecode, perPlayer in COLUMNS ]
+
+
+
+def _complete( path, records ) :
+
+	'''
+	Returns the number of games written completely to every column of the archive at 'path'.
+	'''
+
+	return min( _size( os.path.join( path, name ) ) // record for ( name, typecode, perPlayer ), record in zip( COLUMNS, records ) )
+
+
+
+class ArchiveWriter :
+
+	'''
+	Appends finished games to the archive in the directory 'path' (created if need be). Every game in an archive has the same numPlayers and maxTricks.
+
+	Since a Blackout object only holds the cards of the current round, the writer must be shown the deal of every round with recordDeal() (right after Blackout.Deal()). The finished game is then written with append(). The games in progress are identified by the caller's own game IDs (e.g. the table or registry key), and a game that is abandoned before it finishes must be dropped with drop().
+
+	Example:
+
+	writer = ArchiveWriter( 'games', 5, 7 )
+
+	while not game.isOver() :
+
+		game.Deal()
+		writer.recordDeal( gameId, game )
+		...
+
+	writer.append( gameId, game )
+	'''
+
+	def __init__( self, path, numPlayers, maxTricks = 7 ) :
+
+		maxTricks = min( maxTricks, 51 // numPlayers )		# As clamped by Blackout.__init__()
+
+		if not os.path.isdir( path ) :
+
+			os.makedirs( path )
+
+		meta = _meta( path )
+
+		if meta is None :
+
+			with open( os.path.join( path, 'meta' ), 'wb' ) as f :
+
+				f.write( _META.pack( ARCHIVE_VERSION, numPlayers, maxTricks ) )
+
+		elif meta != ( numPlayers, maxTricks ) :
+
+			raise ValueError( 'ERROR: The archive at %s holds games of %d players and %d tricks.' % ( path, meta[0], meta[1] ) )
+
+		self.path = path
+		self.numPlayers = numPlayers
+		self.maxTricks = maxTricks
+
+
+		# Drop what a crashed writer wrote of a game to some of the columns only:
+
+		records = _records( numPlayers, 2 * maxTricks - 1 )
+
+		games = _complete( path, records )
+
+		for ( name, typecode, perPlayer ), record in zip( COLUMNS, records ) :
+
+			if _size( os.path.join( path, name ) ) > games * record :
+
+				with open( os.path.join( path, name ), 'r+b' ) as f :
+
+					f.truncate( games * record )
+
+		self._deals = {}		# Maps the ID of each game in progress to the columns of the rounds dealt so far
+
+
+	def recordDeal( self, gameId, game ) :
+
+		'''
+		Records the hands, trump card and dealer of the round just dealt in 'game', the game in progress 'gameId'.
+		'''
+
+		deals = self._deals.setdefault( gameId, ( array( 'Q' ), array( 'B' ), array( 'B' ) ) )
+
+		deals[0].extend( game.Hand )
+		deals[1].append( game.TrumpCard.index )
+		deals[2].append( game.Dealer )
+
+
+	def drop( self, gameId ) :
+
+		'''
+		Forgets the deals recorded for the game in progress 'gameId', which will not be appended (e.g. it was abandoned).
+		'''
+
+		self._deals.pop( gameId, None )
+
+
+	def append( self, gameId, game ) :
+
+		'''
+		Appends the finished 'game' (every round of which was shown to recordDeal() under 'gameId') to the archive. Raises ValueError if the game is not finished, is not of the size of the archive or was not shown to recordDeal() for every round.
+		'''
+
+		if not game.isOver() :
+
+			raise ValueError( 'ERROR: Only finished games can be archived.' )
+
+		if ( game.numPlayers, game.maxTricks ) != ( self.numPlayers, self.maxTricks ) :
+
+			raise ValueError( 'ERROR: The game is not of the size of the archive.' )
+
+		if gameId not in self._deals :
+
+			raise ValueError( 'ERROR: No deal was recorded for the game %r.' % ( gameId, ) )
+
+		if len( self._deals[ gameId ][2] ) != game.numRounds :
+
+			raise ValueError( 'ERROR: recordDeal() was not called for every round.' )
+
+		hands, trumpCard, dealer = self._deals.pop( gameId )
+
+		for name, column in zip( [ name for name, typecode, perPlayer in COLUMNS ], [ hands, trumpCard, dealer, game.Bids, game.Tricks, game.Points ] ) :
+
+			if column.itemsize > 1 and sys.byteorder != 'little' :
+
+				column = array( column.typecode, column )
+				column.byteswap()
+
+			with open( os.path.join( self.path, name ), 'ab' ) as f :
+
+				column.tofile( f )
+
+
+
+class ArchiveReader :
+
+	'''
+	Read-only view of the archive in the directory 'path' as it was when opened. Every column in COLUMNS is available as an attribute of the same name (see the module description for their shapes).
+
+	Example:
+
+	archive = ArchiveReader( 'games' )
+	archive.bidAccuracyBySeat()
+	'''
+
+	def __init__( self, path ) :
+
+		meta = _meta( path )
+
+		if meta is None :
+
+			raise ValueError( 'ERROR: There is no archive at %s.' % path )
+
+		self.numPlayers, self.maxTricks = meta
+		self.numRounds = 2 * self.maxTricks - 1
+
+		self._maps = []
+
+		records = _records( self.numPlayers, self.numRounds )
+
+		self.games = _complete( path, records )		# A writer may be appending a game while we open the columns so only complete games are used
+
+		for ( name, typecode, perPlayer ), record in zip( COLUMNS, records ) :
+
+			shape = ( self.numRounds, self.numPlayers ) if perPlayer else ( self.numRounds, )
+
+			setattr( self, name, self._map( os.path.join( path, name ), typecode, ( self.games, ) + shape, record ) )
+
+
+	def _map( self, name, typecode, shape, record ) :
+
+		if numpy is not None :
+
+			dtype = numpy.dtype( typecode ).newbyteorder( '<' )
+
+			if shape[0] == 0 :
+
+				return numpy.zeros( shape, dtype )
+
+			return numpy.memmap( name, dtype, 'r', shape = shape )
+
+		if shape[0] == 0 :
+
+			return memoryview( array( typecode ) )
+
+		with open( name, 'rb' ) as f :
+
+			data = mmap.mmap( f.fileno(), shape[0] * record, access = mmap.ACCESS_READ )
+
+		view = memoryview( data )
+
+		self._maps.append( ( data, view ) )
+
+		return view.cast( typecode, shape )		# Native byte order (the archive is little-endian)
+
+
+	def close( self ) :
+
+		'''
+		Releases the memory maps (for the fallback views without NumPy; numpy.memmap arrays are released when they are deleted).
+		'''
+
+		for name, typecode, perPlayer in COLUMNS :
+
+			column = getattr( self, name )
+
+			if isinstance( column, memoryview ) :
+
+				column.release()
+
+		for data, view in self._maps :
+
+			view.release()
+			data.close()
+
+		self._maps = []
+
+
+	def __len__( self ) :
+
+		return self.games
+
+
+	def bidAccuracyBySeat( self, chunk = 65536 ) :
+
+		'''
+		Returns a list with, for every seat relative to the dealer (0 for the dealer, 1 for the player to his left who bids first and so on), the fraction of the rounds in the archive in which the player in that seat took exactly the number of tricks he bid.
+
+		chunk: <INT> Number of games processed at once with NumPy.
+		'''
+
+		n = self.numPlayers
+
+		if self.games == 0 :
+
+			return [ 0.0 ] * n
+
+		if numpy is not None :
+
+			counts = numpy.zeros( n )
+
+			for start in range( 0, self.games, chunk ) :
+
+				stop = min( start + chunk, self.games )
+
+				made = numpy.asarray( self.bids[ start : stop ] ) == numpy.asarray( self.tricks[ start : stop ] ).astype( numpy.int8 )		# Shape ( games, rounds, players )
+
+				seat = ( numpy.arange( n ) - numpy.asarray( self.dealer[ start : stop ] )[ :, :, None ] ) % n		# The seat relative to the dealer of every entry
+
+				counts += numpy.bincount( seat.ravel(), weights = made.ravel(), minlength = n )
+
+			return list( counts / float( self.games * self.numRounds ) )
+
+
+		counts = [ 0 ] * n
+
+		for game in range( self.games ) :
+
+			for r in range( self.numRounds ) :
+
+				dealer = self.dealer[ game, r ]
+
+				for player in range( n ) :
+
+					if self.bids[ game, r, player ] == self.tricks[ game, r, player ] :
+
+						counts[ ( player - dealer ) % n ] += 1
+
+		return [ count / float( self.games * self.numRounds ) for count in counts ]
+
+
+	def trumpSuits( self ) :
+
+		'''
+		Returns the trump suit index of every round of every game (shape ( games, numRounds )).
+		'''
+
+		if numpy is not None :
+
+			return numpy.asarray( self.trumpCard ) // NUM_RANKS
+
+		return [ [ self.trumpCard[ game, r ] // NUM_RANKS for r in range( self.numRounds ) ] for game in range( self.games ) ]
@@ -0,0 +1,385 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements benchmarks for the Blackout kernel.
+#
+# The micro-benchmarks time the hot paths of the kernel (comparing cards, dealing, bidding, playing a card, evaluating a trick, scoring a round, iterating over the players) and the macro-benchmarks time full games for 3 to 8 players and measure the memory held by a live game. The supervisor benchmarks measure how the throughput of the sharded hosting (shards.Supervisor) scales with the number of worker processes on CPU-bound requests (whole games played on the workers) and report the speedup over 1 worker. Every result is the best of several repeats to reduce the noise of the machine.
+#
+# The results can be written to a JSON file and compared with a stored baseline, flagging the benchmarks that got slower (or bigger) by more than a tolerance.
+
+# Usage (from the terminal):
+#
+# python benchmarks.py
+# python benchmarks.py --json baseline.json		# Store a baseline
+# python benchmarks.py --compare baseline.json		# Exits with status 1 if anything regressed
+
+
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+
+from blackout import *		# Access the Blackout class
+
+import simulate		# Access the playing policies and playGame()
+import sampler		# Access HandSampler
+import shards		# Access Supervisor
+
+
+
+def memoryPerGame( numPlayers = 5, maxTricks = 7, games = 1000 ) :
+
+	'''
+	Returns the average number of bytes allocated per live game, measured with tracemalloc over 'games' Blackout objects created as callers do (without a generator) that have each been dealt the largest round (maxTricks cards per player).
+	'''
+
+	tracemalloc.start()
+
+	try :
+
+		start = tracemalloc.get_traced_memory()[0]
+
+		tables = []
+
+		for ii in range( games ) :
+
+			game = Blackout( numPlayers, maxTricks )
+
+			game.numTricks = game.maxTricks
+
+			game.Deal()
+
+			tables.append( game )
+
+		used = tracemalloc.get_traced_memory()[0] - start
+
+	finally :
+
+		tracemalloc.stop()
+
+	return used / float( games )
+
+
+
+def _best( func, number, repeat ) :
+
+	'''
+	Returns the best time in seconds of one call of 'func' over 'repeat' runs of 'number' calls.
+	'''
+
+	return min( timeit.repeat( func, number = number, repeat = repeat ) ) / number
+
+
+
+def _bestOver( setup, action, number, repeat ) :
+
+	'''
+	Returns the best time in seconds of one call of 'action' on the objects returned by 'setup', which builds them (untimed) for every one of 'repeat' runs of 'number' calls. Used for the actions that change the state of a game.
+	'''
+
+	best = None
+
+	for ii in range( repeat ) :
+
+		items = setup( number )
+
+		start = timeit.default_timer()
+
+		for item in items :
+
+			action( item )
+
+		elapsed = ( timeit.default_timer() - start ) / number
+
+		best = elapsed if best is None else min( best, elapsed )
+
+	return best
+
+
+
+def _dealt( numPlayers, numTricks, seed ) :
+
+	'''
+	Returns the snapshot of a game of 'numPlayers' dealt a round of 'numTricks' tricks.
+	'''
+
+	game = Blackout( numPlayers, rng = random.Random( seed ) )
+
+	game.numTricks = numTricks
+
+	game.Deal()
+
+	return game.toBytes()
+
+
+
+def _playedTo( snapshot, moves ) :
+
+	'''
+	Returns the snapshot of the game 'snapshot' after its bids and 'moves' cards (each the lowest legal card) have been played.
+	'''
+
+	game = Blackout.fromBytes( snapshot )
+
+	for player in circGen( game.numPlayers, game.Leader ) :
+
+		game.Bid( player, game.legalBids( player )[0] )
+
+	for ii in range( moves ) :
+
+		if game.Current == game.Leader and None not in game.currentTrick :
+
+			game.evalTrick()
+
+		game.Move( game.Current, cardsOf( game.legalMoves( game.Current ) )[0] )
+
+	return game.toBytes()
+
+
+
+def microBenchmarks( number = 10000, repeat = 5 ) :
+
+	'''
+	Returns a dictionary of the time in seconds of one call of each hot path of the kernel (5 players).
+	'''
+
+	results = {}
+
+	rng = random.Random( 0 )
+
+	precedence = Precedence( Suit.Heart, Suit.Spade )
+	pairs = [ ( Blackout.Deck[ rng.randrange( NUM_CARDS ) ], Blackout.Deck[ rng.randrange( NUM_CARDS ) ] ) for ii in range( 100 ) ]
+
+	results[ 'Card.__gt__' ] = _best( lambda : [ a > b for a, b in pairs ], number // 100, repeat ) / len( pairs )
+	results[ 'Card.beats' ] = _best( lambda : [ a.beats( b, precedence ) for a, b in pairs ], number // 100, repeat ) / len( pairs )
+
+	results[ 'circGen' ] = _best( lambda : list( circGen( 5, 3 ) ), number, repeat )
+
+	game = Blackout( 5, rng = random.Random( 0 ) )
+	game.numTricks = game.maxTricks
+
+	results[ 'Deal' ] = _best( game.Deal, number, repeat )
+
+
+	dealt = _dealt( 5, 7, 1 )
+
+	def bidAll( game ) :
+
+		for player in circGen( 5, game.Leader ) :
+
+			game.Bid( player, 0 )
+
+	results[ 'Bid' ] = _bestOver( lambda count : [ Blackout.fromBytes( dealt ) for ii in range( count ) ], bidAll, number // 10, repeat ) / 5
+
+
+	bidded = _playedTo( dealt, 0 )
+
+	def moveAll( game ) :		# Plays the first trick
+
+		for player in circGen( 5, game.Leader ) :
+
+			game.Move( player, cardsOf( game.legalMoves( player ) )[0] )
+
+	results[ 'Move' ] = _bestOver( lambda count : [ Blackout.fromBytes( bidded ) for ii in range( count ) ], moveAll, number // 10, repeat ) / 5
+
+
+	full = _playedTo( dealt, 5 )		# One complete trick on the table
+
+	results[ 'evalTrick' ] = _bestOver( lambda count : [ Blackout.fromBytes( full ) for ii in range( count ) ], Blackout.evalTrick, number, repeat )
+
+
+	played = _playedTo( dealt, 35 )		# Every trick played but the last one evaluated
+
+	def finish( game ) :
+
+		game.evalTrick()
+
+		return game
+
+	results[ 'postRound' ] = _bestOver( lambda count : [ finish( Blackout.fromBytes( played ) ) for ii in range( count ) ], Blackout.postRound, number, repeat )
+
+
+	hidden = sampler.HandSampler( Blackout.fromBytes( _playedTo( dealt, 12 ) ), 0 )		# Player 0's view after two tricks and two cards
+
+	results[ 'HandSampler.sample' ] = _best( lambda : hidden.sample( rng ), number // 10, repeat )
+	results[ 'HandSampler.sampleMany' ] = _best( lambda : hidden.sampleMany( 1000, 0 ), max( number // 1000, 1 ), repeat ) / 1000		# Per deal
+
+	return results
+
+
+
+def macroBenchmarks( games = 200, repeat = 3 ) :
+
+	'''
+	Returns a dictionary of the time in seconds of a full game (random bids and cards, maxTricks 7) for 3 to 8 players (without validation, as simulate.playGame() runs them, and once for 5 players with STRICT validation) and of the memory in bytes per live game.
+	'''
+
+	results = {}
+
+	for numPlayers in range( 3, 9 ) :
+
+		rng = random.Random( numPlayers )
+
+		results[ 'game/%d players' % numPlayers ] = _best( lambda : simulate.playGame( numPlayers, 7, simulate.randomBid, simulate.randomPlay, rng ), games, repeat )
+
+	rng = random.Random( 5 )
+
+	results[ 'game/5 players strict' ] = _best( lambda : simulate.playGame( 5, 7, simulate.randomBid, simulate.randomPlay, rng, STRICT ), games, repeat )		# The cost of the checks
+
+	for numPlayers in range( 3, 9 ) :
+
+		results[ 'memory/%d players' % numPlayers ] = memoryPerGame( numPlayers )
+
+	return results
+
+
+
+def supervisorBenchmarks( games = 400, repeat = 3, workers = None ) :
+
+	'''
+	Returns a dictionary of the time in seconds per game of a batch of 'games' CPU-bound requests (each request plays a whole 5 players game on its worker, see shards._worker) run through a Supervisor with each number of 'workers' (by default 1, 2, 4 and the number of cores). The time includes the pipes and pickling, so it shows how far the work scales with the number of cores (see supervisorSpeedups()).
+	'''
+
+	if workers is None :
+
+		workers = sorted( { 1, 2, 4, multiprocessing.cpu_count() } )
+
+	batch = [ ( 'game-%d' % ii, '_playGame', ( 5, 7, ii ) ) for ii in range( games ) ]
+
+	results = {}
+
+	for numWorkers in workers :
+
+		supervisor = shards.Supervisor( numWorkers, numShards = 64 )
+
+		try :
+
+			results[ 'supervisor/%d workers' % numWorkers ] = _best( lambda : supervisor.execute( batch ), 1, repeat ) / games
+
+		finally :
+
+			supervisor.close()
+
+	return results
+
+
+
+def supervisorSpeedups( results ) :
+
+	'''
+	Returns a dictionary mapping every number of workers timed by supervisorBenchmarks() in 'results' to its speedup over 1 worker (higher is better). The speedup cannot exceed the number of cores of the machine.
+	'''
+
+	base = results.get( 'supervisor/1 workers' )
+
+	speedups = {}
+
+	for name, value in results.items() :
+
+		if base and name.startswith( 'supervisor/' ) :
+
+			speedups[ int( name.split( '/' )[1].split()[0] ) ] = base / value
+
+	return speedups
+
+
+
+def runAll( quick = False ) :
+
+	'''
+	Runs every benchmark and returns the report: a dictionary with the 'results' (the name of each benchmark mapped to its time in seconds or, for memory, its size in bytes; lower is better for all of them) and a description of the machine.
+	'''
+
+	results = {}
+
+	results.update( microBenchmarks( 1000 if quick else 10000 ) )
+	results.update( macroBenchmarks( 20 if quick else 200 ) )
+	results.update( supervisorBenchmarks( 100 if quick else 400 ) )
+
+	return { 'results': results, 'python': platform.python_version(), 'implementation': platform.python_implementation(), 'machine': platform.machine(), 'numpy': numpy is not None }
+
+
+
+def compare( report, baseline, tolerance = 0.1 ) :
+
+	'''
+	Compares a report with a baseline report (see runAll()). Returns the list of the regressions: ( name, baseline value, new value ) for every benchmark more than 'tolerance' (a fraction) worse than in the baseline.
+	'''
+
+	regressions = []
+
+	for name, old in sorted( baseline[ 'results' ].items() ) :
+
+		new = report[ 'results' ].get( name )
+
+		if new is not None and new > old * ( 1 + tolerance ) :
+
+			regressions.append( ( name, old, new ) )
+
+	return regressions
+
+
+
+if __name__ == '__main__' :
+
+	import argparse
+
+	parser = argparse.ArgumentParser( description = 'Benchmark the Blackout kernel.' )
+
+	parser.add_argument( '--json', help = 'File to write the results to' )
+	parser.add_argument( '--compare', help = 'Baseline results (written by --json) to compare with' )
+	parser.add_argument( '--tolerance', type = float, default = 0.1, help = 'Fraction by which a benchmark may be worse than the baseline' )
+	parser.add_argument( '--quick', action = 'store_true', help = 'Fewer iterations' )
+
+	args = parser.parse_args()
+
+	report = runAll( args.quick )
+
+	for name, value in sorted( report[ 'results' ].items() ) :
+
+		if name.startswith( 'memory' ) :
+
+			print( '%-24s %10d bytes' % ( name, value ) )
+
+		else :
+
+			print( '%-24s %10.2f us' % ( name, value * 1e6 ) )
+
+	for numWorkers, speedup in sorted( supervisorSpeedups( report[ 'results' ] ).items() ) :
+
+		print( 'speedup with %d workers: %.2fx on %d cores' % ( numWorkers, speedup, multiprocessing.cpu_count() ) )
+
+	if args.json :
+
+		with open( args.json, 'w' ) as f :
+
+			json.dump( report, f, indent = 2, sort_keys = True )
+
+	if args.compare :
+
+		with open( args.compare ) as f :
+
+			regressions = compare( report, json.load( f ), args.tolerance )
+
+		for name, old, new in regressions :
+
+			print( 'REGRESSION: %s went from %g to %g' % ( name, old, new ) )
+
+		sys.exit( 1 if regressions else 0 )
@@ -18,12 +18,68 @@
 
 # This file implements the Blackout class which can be considered the Kernel of the Blackout web-application (being implemented using Django). The purpose of the class is to implement an entire game of Blackout in an abstract fashion which can then be interfaced using the designed class API to play the game either by a terminal or the internet via a web server.
 
-# In conjunction with the Blackout class we construct a number of classes to represent card suits, ranks and the cards themselves. These classes implement a lot of the precedence functionality of the cards including trump and which suit was led in a hand which will simplify the logic and implementation of the actual Blackout class
+# In conjunction with the Blackout class we construct a number of classes to represent card suits, ranks and the cards themselves. These classes implement a lot of the precedence functionality of the cards including trump and which suit was led in a hand which will simplify the logic and implementation of the actual Blackout class. The trump and led suits themselves are part of the state of each Blackout instance (self.precedence) and NOT of the shared suits so that many games can be played in a single process.
 
 
+import struct		# Fixed-layout binary snapshots (see Blackout.toBytes())
+
+from array import array		# Compact typed arrays used to store the per-round player data
+
 from cards import *		# Access all the playing card implementing classes and enumerations from the cards module (custom-built)
 
 
+# NumPy is optional. It is only used to resolve large batches of tricks at once (see evalTricks()) which falls back to plain Python if NumPy is not installed.
+
+try :
+
+	import numpy
+
+except ImportError :
+
+	numpy = None
+
+
+
+# Validation levels (see Blackout.validation). The checks of the hot paths cost nothing but a comparison at the lower levels:
+
+OFF = 0		# No checks at all. Bid() and Move() accept anything and return True. For simulations whose policies only ever pick legal bids and cards.
+TRUSTED = 1		# Bid() and Move() still reject illegal bids and cards (returning False) and raise on player IDs and cards out of range, evalTrick() on an incomplete trick, but the turn order and the state of the game are not checked. For callers that enforce the turn order themselves (e.g. server.GameServer).
+STRICT = 2		# Every check. Misuse of the API raises one of the exceptions below.
+
+
+
+class BlackoutError( AssertionError ) :
+
+	'''
+	Base class of the errors raised when the API of the Blackout class is misused (at the STRICT validation level). It derives from AssertionError, which these checks used to raise, so that existing callers catching AssertionError keep working.
+	'''
+
+class IllegalPlayerError( BlackoutError ) :
+
+	'''
+	A player ID outside 0 to numPlayers - 1.
+	'''
+
+class IllegalCardError( BlackoutError ) :
+
+	'''
+	A card index outside 0 to 51.
+	'''
+
+class OutOfTurnError( BlackoutError ) :
+
+	'''
+	A player bidding or playing out of turn.
+	'''
+
+class GameStateError( BlackoutError ) :
+
+	'''
+	A call made in the wrong phase of the game (bidding beyond full circle, evaluating an incomplete trick, playing on after the game has ended, ...).
+	'''
+
+
+
 class Blackout :
 
 	'''
@@ -46,27 +102,45 @@ class Blackout :
 	(f) You get 10 points for making your bid and one point for each trick you take regardless of whether you bid or not.
 	'''
 
-	def __init__( self, numPlayers, maxTricks = 7 ) :
+	__slots__ = ( 'numPlayers', 'maxTricks', 'numRounds', 'rng', 'Round', 'Dealer', 'Bidder', 'Current', 'Leader', 'numTricks', 'precedence', 'currentTrick', 'Hand', 'Bids', 'Tricks', 'Points', 'TrumpCard', 'trump', 'ledSuit', 'undoStack', 'undoTop', 'trickStack', 'trickTop', 'version', 'validation', 'Played', 'Remaining', 'Voids' )		# No per-instance dictionary. Many thousands of games can be held in memory at once.
+
+
+	Deck = DECK		# The deck is the immutable tuple of Card objects shared by all games (see cards.DECK) so that each card in the deck is associated with a unique integer from 0 to 51
+
+
+	def __init__( self, numPlayers, maxTricks = 7, rng = None, validation = STRICT ) :
 
 		'''
 		Class constructor. Every instance of the game must of course know the number of players.
 
 		The maxTricks value with default value of 7 is the max. no. of tricks the game increases up to before decreasing again. The constructor will check whether the value passed is feasible.
+
+		rng: <random.Random> Optional random number generator used to shuffle the deck. Passing a seeded generator makes the deals of the game reproducible. By default the randomly seeded generator of the random module, shared by all such games, is used: a random.Random object holds about 2.5 KB of state, more than the rest of a game.
+
+		validation: <INT> How much checking Bid(), Move(), evalTrick() and postRound() do: STRICT (default), TRUSTED or OFF (see the module level constants).
 		'''
 
 		assert 0 < maxTricks < 14, 'ERROR: maxTricks must be an integer between 1 and 13'
 
 
-		if numPlayers * maxTricks > 52 :		# The number of players and maxTricks is so high that the deck doesn't contain enough cards to go on
+		if numPlayers * maxTricks >= 52 :		# The number of players and maxTricks is so high that the deck doesn't contain enough cards to go on
 
-			# We must decrease maxTricks so that the game can be played with a single deck
+			# We must decrease maxTricks so that the game can be played with a single deck, keeping at least one card over to determine the trump
 
-			maxTricks = 52 / numPlayers		# Integer division
+			maxTricks = 51 // numPlayers		# Integer division
 
 
 		self.numPlayers = numPlayers
 		self.maxTricks = maxTricks
 
+		self.numRounds = 2 * maxTricks - 1		# The number of tricks goes up from 1 to maxTricks and back down to 1
+
+		if rng is None :
+
+			import random as rng		# The module's functions use its shared generator, which is also re-seeded in the child after a fork
+
+		self.rng = rng
+
 		self.Round = 1		# Declare it to be the first round
 
 		self.Dealer = 0		# Player 0 will be the dealer
@@ -79,34 +153,53 @@ class Blackout :
 
 		self.numTricks = 1		# There will be 1 trick in the first round
 
+		self.precedence = Precedence()		# Stores which suit is trump and which suit was led in the current trick. Belongs to this game alone and is passed explicitly into card comparisons.
+
+
+		self.currentTrick = [ None ] * self.numPlayers		# Create a list which will store the cards each player plays in a single trick. None indicates that the player has not played yet. Used by evalTrick to check validity of hand played.
+
+
+		# The hand of each player, that is the cards he is holding while playing a round, is stored as a 52-bit mask (see cards.SUIT_MASK) with bit 'index' set if he holds the card self.Deck[ index ]. This makes checking, listing and removing cards constant time operations.
 
-		self.currentTrick = list( range( self.numPlayers ) )		# Create a list which will store the cards each player plays in a single trick
-		self.currentTrick[0] = None		# Store None for Leader
-		self.currentTrick[-1] = None		# Store None for player before dealer. Used by evalTrick to check validity of hand played
+		self.Hand = [ 0 ] * numPlayers
 
 
-		# We now create the deck by constructing a list of Card objects stored in a list so that each card in the deck is associated with a unique integer from 0 to 51:
+		# Prepare the data structures to store player information. Since the number of rounds is fixed in advance by maxTricks each is a single compact array with one entry per round per player, the entry for player 'ii' in round 'r' (counting from zero) being at index r * numPlayers + ii:
 
-		self.Deck = []
+		size = self.numRounds * numPlayers
 
-		for suit in [ Suit.Spade, Suit.Heart, Suit.Club, Suit.Diamond ] :
+		self.Bids = array( 'b', [ -1 ] * size )		# The bid of each player in each round. -1 indicates that the player has not bid (yet).
 
-			for rank in [ Rank.Two, Rank.Three, Rank.Four, Rank.Five, Rank.Six, Rank.Seven, Rank.Eight, Rank.Nine, Rank.Ten, Rank.Jack, Rank.Queen, Rank.King, Rank.Ace ] :
+		self.Tricks = array( 'B', [ 0 ] * size )		# The number of tricks each player won in each round
 
-				self.Deck.append( Card( suit, rank ) )		# create and append card object to self.Deck
+		self.Points = array( 'B', [ 0 ] * size )		# The points each player scored in each round (see postRound())
 
+		self.TrumpCard = None		# No cards have been dealt yet
+		self.trump = None
+		self.ledSuit = None
 
-		# Prepare a data structure to store player information:
 
-		self.Player = []
+		# The card tracker. It is kept up to date by Move() (and applyMove()/undoMove()) so that what is known about the cards in play can be queried in constant time. It describes the round being played and is cleared by postRound() (and Deal()), so that it never describes a finished round:
 
-		for ii in range( numPlayers ) :
+		self.Played = 0		# Mask of the cards played in the current round (including those on the table)
 
-			self.Player.append( { 'hand': [], 'bids': [], 'tricks': [], 'points': [] } )		# Give each player a dictionary containing empty lists which will store the following values:
+		self.Remaining = [ NUM_RANKS ] * NUM_SUITS		# The number of cards of each suit that have not been played in the current round
 
-			# hand: The current hand of the player, that is the cards he is holding while playing a round.
+		self.Voids = [ 0 ] * numPlayers		# For each player, the mask of the suits (bit 'suit') he has shown he holds none of this round by not following suit
 
-			# bids: List of 
+
+		# Undo information for applyMove()/undoMove(). Preallocated so that searching the game tree allocates nothing per move:
+
+		self.undoStack = array( 'H', [ 0 ] * NUM_CARDS )		# One entry per card played in the round (see applyMove())
+		self.undoTop = 0		# Number of entries in use
+
+		self.trickStack = array( 'B', [ 0 ] * NUM_CARDS )		# The cards of each trick resolved by applyMove(), numPlayers entries per trick (in seat order), so that undoMove() can put them back on the table
+		self.trickTop = 0
+
+
+		self.version = 0		# Incremented by every call that changes the state of the game (Deal, Bid, Move, evalTrick and postRound) so that clients can tell whether their copy is up to date (see server.py)
+
+		self.validation = validation		# May be changed at any time, e.g. to replay a trusted log OFF
 
 
 
@@ -130,7 +223,7 @@ class Blackout :
 
 		for ii in range( self.numPlayers ) :
 
-			print( '     Player %d : %s' % (ii, self.Player[ii] ) )
+			print( '     Player %d : bids: %s, tricks: %s, points: %s, hand: %s' % (ii, self.bids( ii ), self.tricks( ii ), self.points( ii ), [ self.Deck[ card ] for card in self.hand( ii ) ] ) )
 
 
 
@@ -156,7 +249,7 @@ class Blackout :
 
 		if num == 0 :
 
-			return self.numPlayers
+			return self.numPlayers - 1
 
 		else :
 
@@ -165,19 +258,19 @@ class Blackout :
 	
 
 
-	def Deal( self ) :
+	def Deal( self, shuffled = None ) :
 
 		'''
 		This method implements the cards being dealt for a new round.
+
+		shuffled: <LIST> Optional permutation of the integers 0 - 51 (for example a row of the permutations returned by dealMany()) to deal from. By default the deck is shuffled using self.rng. Dealing from a recorded permutation replays a deal exactly.
 		'''
 
 		# The first step is to shuffle the deck.
 
-		from random import shuffle
+		if shuffled is None :
 
-		shuffled = range(51)		# list of 52 integers starting at zero
-
-		shuffle( shuffled )		# self.shuffled will contain a list of integers that point to cards in self.Deck
+			shuffled = shuffleDeck( self.rng )		# shuffled will contain a list of integers that point to cards in self.Deck
 
 		
 		# Now we clear the round variables in self for the next round:
@@ -185,29 +278,61 @@ class Blackout :
 		self.clearRound()
 
 
-		# Now we populate the player hands remembering that we must keep track of the dealer and start dealing to the player with the higher integer (modelled to be the one to the left of the dealer).
+		# Now we populate the player hands remembering that we must keep track of the dealer and start dealing to the player with the higher integer (modelled to be the one to the left of the dealer). The next card from the deck will determine the trump.
 
-		index = 0
+		self.Hand, trumpCard = dealFrom( shuffled, self.numPlayers, self.numTricks, self.Dealer )
 
-		for trick in range( self.numTricks ) :		# No. of cards to be dealt out to each player
+		self.TrumpCard = self.Deck[ trumpCard ]
 
-			for player in circGen( self.Dealer + 1, self.numPlayers ) :
+		
+		# Store the trump based on the TrumpCard dealt:
 
-				self.Player[ player ][ 'hand' ].append( shuffled[ index ] )		# We keep track of the cards by referring to their index position in self.Deck and not the cards themselves
+		self.trump = self.TrumpCard.Suit
 
-				index += 1
+		self.precedence.trump = self.trump			# Tell this game's precedence context which suit has been declared trump
 
+		self.version += 1
 
-		# The next card from the deck will determine the trump:
 
-		self.TrumpCard = self.Deck[ shuffled[ index ] ]
 
-		
-		# Store the trump based on the TrumpCard dealt:
+	def clearRound( self ) :
 
-		self.trump = self.TrumpCard.Suit
+		'''
+		Clears the per-round state (player hands and the trump and led suits) in preparation for dealing a new round.
+		'''
+
+		self.precedence.clear()
+
+		self.ledSuit = None
+
+		self.Hand = [ 0 ] * self.numPlayers		# Empty hands for each player
+
+		self.undoTop = 0
+		self.trickTop = 0
+
+		self.Played = 0
+		self.Remaining = [ NUM_RANKS ] * NUM_SUITS
+		self.Voids = [ 0 ] * self.numPlayers
 
-		self.trump.trump = True			# Tell the trump suit that it has been declared trump
+		base = self._base()
+
+		for ii in range( base, base + self.numPlayers ) :
+
+			self.Bids[ ii ] = -1		# -1 indicates that the player has not bid yet in the new round
+
+			self.Tricks[ ii ] = 0		# Start counting the tricks won by each player in the new round
+
+
+
+	def _base( self ) :
+
+		'''
+		Returns the index in the per-round arrays (self.Bids, self.Tricks and self.Points) of the entry of player 0 in the current round.
+
+		Used internally.
+		'''
+
+		return ( self.Round - 1 ) * self.numPlayers
 
 
 
@@ -217,61 +342,56 @@ class Blackout :
 		'''
 		This method implements the interface for a player making a bid for a new round.
 
-		The player who is meant to be bidding is tracked and an exception is thrown if the order goes wrong. The interface to the Blackout class is required to correctly call self.Bid(). If an incorrect bid is made the method will return False to indicate so.
+		The player who is meant to be bidding is tracked and an exception (OutOfTurnError) is thrown if the order goes wrong. The interface to the Blackout class is required to correctly call self.Bid(). If an incorrect bid is made the method will return False to indicate so.
 
 		player: <INT> The ID of the player who is making the big.
 
 		bid: <INT> The number of tricks the specified player is bidding this round.
 
 
-		The method returns True is a correct bid value has been specified, it returns False otherwise. For other errors an exception is thrown.
+		The method returns True is a correct bid value has been specified, it returns False otherwise. For other errors an exception is thrown. Which of these checks are made depends on self.validation: the player ID and the legality of the bid at STRICT and TRUSTED, the other exceptions only at STRICT.
 		'''
 
 		# We check that a legal player ID has been passed
 
-		assert 0 <= player < self.numPlayers, 'ERROR: Illegal Played ID. It is required that 0 <= player <= numPlayers'
+		if self.validation and not 0 <= player < self.numPlayers :
 
+			raise IllegalPlayerError( 'ERROR: Illegal Played ID. It is required that 0 <= player <= numPlayers' )
 
-		# Check that a legal bid has been made
 
-		if bid < 0 or bid > self.numTricks :			# Incorrect bid made
+		if self.validation == STRICT :
 
-			return False
+			# Now we check that the correct player is bidding, that is the bidding order is being maintained.
 
-		
-		# Now we check that the correct player is bidding, that is the bidding order is being maintained.
+			if player != self.Bidder :
 
-		assert player == self.Bidder, 'ERROR: Player is bidding out of turn. Current player that should be bidding is Player %d' % self.Bidder
+				raise OutOfTurnError( 'ERROR: Player is bidding out of turn. Current player that should be bidding is Player %d' % self.Bidder )
 
 
-		# Since all the checks have been cleared we place the bid:
+			# We now check whether the bidding has gone beyond the full circle:
 
-		self.Player[ player ][ 'bid' ] = bid
+			if self.Bids[ self._base() + player ] != -1 :
 
+				raise GameStateError( 'ERROR: Bidding has progressed beyond full circle. More bids than players.' )
 
-		# Special care must be taken when the dealer is bidding:
 
-		if self.Bidder == self.Dealer :
+		# Check that a legal bid has been made (this includes the special restriction on the dealer's bid)
 
-			# The total number of bids must not be equal to the total number of tricks
+		if self.validation and bid not in self.legalBids( player ) :			# Incorrect bid made
 
-			totalBids = 0
+			return False
 
-			for ii in range( self.numPlayers ) :	totalBids += self.Player[ ii ][ 'bid' ]
 
-			if totalBids == self.numTrics :			# The total number of bids is equal to the number of tricks in this round.
+		# Since all the checks have been cleared we place the bid:
+
+		self.Bids[ self._base() + player ] = bid
 
-				return False
-		
 
 		# Increment the bidder:
 
 		self.Bidder = self._circInc( self.Bidder )
 
-		
-		# We now check whether the bidding has gone beyond the full circle:
-
-		assert self.Bidder != self.Leader, 'ERROR: Bidding has progressed beyond full circle. More bids than players.'
+		self.version += 1
 
 
 		# Correct bid made:
@@ -280,29 +400,74 @@ class Blackout :
 
 
 
+	def legalBids( self, player ) :
+
+		'''
+		Returns the list of bids the player is allowed to make. Any number of tricks from zero up to the number of tricks in the round is allowed except that the dealer is forced to bid such that the total number of bids is NOT equal to the number of tricks in the round.
+		'''
 
-	def Move( self, player, card_index ) :
+		bids = list( range( self.numTricks + 1 ) )
+
+		if player == self.Dealer :		# Special care must be taken when the dealer is bidding
+
+			totalBids = 0
+
+			base = self._base()
+
+			for ii in range( base, base + self.numPlayers ) :
+
+				if ii != base + player and self.Bids[ ii ] != -1 :	totalBids += self.Bids[ ii ]
+
+			if 0 <= self.numTricks - totalBids :		# The bid that would make the total equal the number of tricks is possible so we forbid it
+
+				bids.remove( self.numTricks - totalBids )
+
+		return bids
+
+
+
+	def Move( self, player, card ) :
 
 		'''
 		This method implements an interface by which the class is informed about the next move.
 
 		player: <INT> The ID of the player who is playing the card. This is checked against the internal state of the game for validity. An exception is thrown if it is invalid.
 
-		card_index: <INT> The index in self.Player[ player ][ 'hand' ] (list) which points to the card the player has chosen to play from his hand on this move.
+		card: <INT> The index in self.Deck (0 - 51) of the card the player has chosen to play from his hand on this move.
 		
 
-		This method will validate the card played by checking if the player has the card to begin with and if so whether the move is legal, that is, is he following suit if he can. Valid moves will return True, invalid ones will return False. It is the responsibility of the interfacer to check these boolean values before moving forward.
+		This method will validate the card played by checking if the player has the card to begin with and if so whether the move is legal, that is, is he following suit if he can. Valid moves will return True, invalid ones will return False. It is the responsibility of the interfacer to check these boolean values before moving forward. Use self.legalMoves() to find the valid moves beforehand.
+
+		As with Bid() the player ID, the card index and the validity of the move are checked at STRICT and TRUSTED, the turn order and the state of the game only at STRICT.
 		'''
 
-		assert player == self.Current, 'ERROR: Player making move out of turn.'
+		validation = self.validation
+
+		if validation :
+
+			if not 0 <= player < self.numPlayers :
+
+				raise IllegalPlayerError( 'ERROR: Illegal Player ID. It is required that 0 <= player < numPlayers' )
 
-		assert self.Player[ player ][ 'hand' ] != [], 'ERROR: No cards left in the players hand'
+			if not 0 <= card < NUM_CARDS :
 
-		assert card_index >= 0 and card_index < len( self.Player[ player ][ 'hand' ] ), 'ERROR: Player has issued a card index that is out of bounds of the list describing the player\'s hand'
+				raise IllegalCardError( 'ERROR: Player has issued a card index that is out of bounds of the deck' )
 
 
+		if validation == STRICT :
 
-		card = self.Deck[ self.Player[ player ][ 'hand' ][ card_index ] ]
+			if player != self.Current :
+
+				raise OutOfTurnError( 'ERROR: Player making move out of turn.' )
+
+			if self.Hand[ player ] == 0 :
+
+				raise GameStateError( 'ERROR: No cards left in the players hand' )
+
+
+		if validation and not ( self.Hand[ player ] >> card ) & 1 :		# The player does not hold the card
+
+			return False
 
 		
 		# Now we check the validity of the move:
@@ -311,63 +476,289 @@ class Blackout :
 
 			# We first check for overflow of tricks play where the tricks played have circled round and the leader is playing a card again
 
-			assert self.currentTrick[ self.Leader ] == None, 'ERROR: The leader has submitted two cards to a single trick.'
+			if validation == STRICT and self.currentTrick[ self.Leader ] is not None :
 
+				raise GameStateError( 'ERROR: The leader has submitted two cards to a single trick.' )
 
-			card.Suit.led = True		# Declare the suit played by the leader to be the suit that has been led in this trick
 
-			self.ledSuit = card.Suit	# The Object is told what suit has been led
+			self.precedence.led = self.Deck[ card ].Suit		# Declare the suit played by the leader to be the suit that has been led in this trick
 
+			self.ledSuit = self.precedence.led	# The Object is told what suit has been led
 
-		else :			# The player is NOT the leader and we have to check the validity of the move
 
-			if not card.Suit is self.ledSuit :		# Not following suit:
+		elif card // NUM_RANKS != self.precedence.ledIndex :		# The player is NOT the leader and is not following suit
 
-				# We now check if the player has a card in his hand of the suit led in which case this current move is invalid
+			# The move is invalid if the player has a card in his hand of the suit led. A single mask test tells us this.
 
-				for item in self.Player[ player ][ 'hand' ] :
+			if validation and self.Hand[ player ] & SUIT_MASK[ self.precedence.ledIndex ] :
+
+				return False
 
-					if item.suit is self.ledSuit :			# Invalid move the player had the suit led
 
-						return False
+			self.Voids[ player ] |= 1 << self.precedence.ledIndex		# The player has shown that he holds no card of the suit led
 		
 		# If execution gets here the move was valid. We prepare for the next move:
 
 		self.Current = self._circInc( self.Current )
 
 
-		# We add the played card to the sequence of cards played and remove it from the players hand all at the same time using the list's pop feature:
+		# We add the played card to the sequence of cards played and remove it from the players hand:
+
+		self.currentTrick[ player ] = card		# We store which card was played by which player
+
+		self.Hand[ player ] &= ~( 1 << card )
 
-		self.currentTrick[ player ] = self.Player[ player ][ 'hand' ].pop( card_index )		# We store which card was played by which player
+		self.Played |= 1 << card		# Update the card tracker
+
+		self.Remaining[ card // NUM_RANKS ] -= 1
+
+		self.version += 1
 
 
 		return True		# Valid move
 
 
 
+	def legalMoves( self, player ) :
+
+		'''
+		Returns the mask (see cards.SUIT_MASK) of the cards the player may legally play next: his whole hand if he is leading (or cannot follow suit) and otherwise only the cards of the suit led. Use cards.cardsOf() to convert the mask to a list of indices in self.Deck.
+		'''
+
+		hand = self.Hand[ player ]
+
+		if player == self.Leader :
+
+			return hand
+
+		follow = hand & SUIT_MASK[ self.precedence.ledIndex ]
+
+		return follow if follow else hand
+
+
+
+	def hand( self, player ) :
+
+		'''
+		Returns the list of indices in self.Deck of the cards in the player's hand in ascending order.
+		'''
+
+		return cardsOf( self.Hand[ player ] )
+
+
+
+	def isVoid( self, player, suit ) :
+
+		'''
+		Returns True if 'player' is known (from the card tracker) to hold no card of the suit with index 'suit' for the rest of the round.
+		'''
+
+		return bool( ( self.Voids[ player ] >> suit ) & 1 )
+
+
+
+	def unseen( self, player ) :
+
+		'''
+		Returns the mask of the cards 'player' has not seen this round: those neither in his hand, nor played, nor the TrumpCard. They are held by the other players or were not dealt.
+		'''
+
+		mask = FULL_MASK & ~self.Hand[ player ] & ~self.Played
+
+		if self.TrumpCard is not None :
+
+			mask &= ~( 1 << self.TrumpCard.index )
+
+		return mask
+
+
 
 	def evalTrick( self ) :
 
 		'''
-		This method first verifies that every player has played a card in the current trick and then evaluates the trick to determine the winner of the trick. It then performs certain house-keeping duties to make way for the next trick.
+		This method first verifies (at the STRICT and TRUSTED validation levels) that every player has played a card in the current trick and then evaluates the trick to determine the winner of the trick. It then performs certain house-keeping duties to make way for the next trick.
+
+		The method returns the ID of the player who won the trick. That player leads the next trick.
 		'''
 
+		if self.validation and None in self.currentTrick :
 
+			raise GameStateError( 'ERROR: Not all players have played a card in the current trick.' )
 
 
+		winner = _trickWinnerSeat( self.currentTrick, self.precedence.trumpIndex, self.precedence.ledIndex )
 
+		self.Tricks[ self._base() + winner ] += 1		# Credit the trick to the winner in the current round
 
 
+		# Prepare for the next trick which is led by the winner of this one:
 
+		self.Leader = winner
+		self.Current = winner
 
+		self.currentTrick = [ None ] * self.numPlayers
 
+		self.precedence.led = None
+		self.ledSuit = None
 
+		self.version += 1
 
+		return winner
 
-			
 
 
-	
+	# Make/unmake API for game-tree search. These methods change the state of the game in place and restore it exactly without allocating anything (they leave self.version alone). They perform NO validation: the caller is responsible for only applying legal bids and moves (see legalBids() and legalMoves()) and for undoing them in reverse order.
+
+
+	def applyBid( self, player, bid ) :
+
+		'''
+		Places the bid of 'player' (who must be self.Bidder) without any checks. Undone by undoBid().
+		'''
+
+		self.Bids[ self._base() + player ] = bid
+
+		self.Bidder = self._circInc( player )
+
+
+
+	def undoBid( self ) :
+
+		'''
+		Takes back the last bid placed.
+		'''
+
+		self.Bidder = self._circDec( self.Bidder )
+
+		self.Bids[ self._base() + self.Bidder ] = -1
+
+
+
+	def applyMove( self, player, card ) :
+
+		'''
+		Plays 'card' from the hand of 'player' (who must be self.Current) without any checks. Unlike Move(), the card that completes a trick also resolves it as evalTrick() does, so that the search never has to call evalTrick(). Undone by undoMove().
+
+		Each move pushes one entry onto self.undoStack: the card and, if the move completed a trick, ( 1 + the leader of that trick ) * 64 added to it. _VOIDED is added if the move revealed a new void (see self.Voids). The cards of a trick it resolves are pushed onto self.trickStack, since some of them may have been played with Move() before the search started.
+		'''
+
+		bit = 1 << card
+
+		suit = card // NUM_RANKS
+
+		self.Hand[ player ] &= ~bit
+
+		self.currentTrick[ player ] = card
+
+		self.Played |= bit
+		self.Remaining[ suit ] -= 1
+
+		entry = card
+
+		if player == self.Leader :
+
+			self.precedence.led = Suit.All[ suit ]
+			self.ledSuit = self.precedence.led
+
+		elif suit != self.precedence.ledIndex and not ( self.Voids[ player ] >> self.precedence.ledIndex ) & 1 :
+
+			self.Voids[ player ] |= 1 << self.precedence.ledIndex
+
+			entry += _VOIDED
+
+		self.Current = self._circInc( player )
+
+
+		if self.Current != self.Leader :		# The trick is still in progress
+
+			self.undoStack[ self.undoTop ] = entry
+
+		else :		# The trick is complete: resolve it in place
+
+			leader = self.Leader
+
+			winner = _trickWinnerSeat( self.currentTrick, self.precedence.trumpIndex, self.precedence.ledIndex )
+
+			self.Tricks[ self._base() + winner ] += 1
+
+			self.Leader = winner
+			self.Current = winner
+
+			for seat in range( self.numPlayers ) :
+
+				self.trickStack[ self.trickTop + seat ] = self.currentTrick[ seat ]
+
+				self.currentTrick[ seat ] = None
+
+			self.trickTop += self.numPlayers
+
+			self.precedence.led = None
+			self.ledSuit = None
+
+			self.undoStack[ self.undoTop ] = entry + ( 1 + leader ) * 64
+
+		self.undoTop += 1
+
+
+
+	def undoMove( self ) :
+
+		'''
+		Takes back the last move made with applyMove(), restoring the state exactly (including the trick it completed, if any).
+		'''
+
+		self.undoTop -= 1
+
+		entry = self.undoStack[ self.undoTop ]
+
+		voided = entry >= _VOIDED
+
+		entry %= _VOIDED
+
+		card = entry % 64
+
+		if entry < 64 :		# The move did not complete a trick
+
+			player = self._circDec( self.Current )
+
+			if player == self.Leader :
+
+				self.precedence.led = None
+				self.ledSuit = None
+
+		else :		# Reopen the trick: take it back from the winner and put the other cards back on the table
+
+			leader = entry // 64 - 1
+
+			self.Tricks[ self._base() + self.Leader ] -= 1
+
+			self.Leader = leader
+
+			player = ( leader + self.numPlayers - 1 ) % self.numPlayers		# The last player of the trick
+
+			self.trickTop -= self.numPlayers
+
+			for seat in range( self.numPlayers ) :
+
+				self.currentTrick[ seat ] = self.trickStack[ self.trickTop + seat ]
+
+			self.precedence.led = Suit.All[ self.currentTrick[ leader ] // NUM_RANKS ]
+			self.ledSuit = self.precedence.led
+
+		if voided :
+
+			self.Voids[ player ] &= ~( 1 << self.precedence.ledIndex )
+
+		self.currentTrick[ player ] = None
+
+		self.Hand[ player ] |= 1 << card
+
+		self.Played &= ~( 1 << card )
+		self.Remaining[ card // NUM_RANKS ] += 1
+
+		self.Current = player
+
+
 
 	def postRound( self ) :
 
@@ -375,29 +766,52 @@ class Blackout :
 		This method is intended to be called after each round is played. It is used to clear and prepare anew the various variables that are used within each round. It prepares these variables/members for the next round.
 		'''
 		
+		# We check for end of game:
+
+		if self.validation == STRICT and self.isOver() :
+
+			raise GameStateError( 'ERROR: One too many calls to postRound() have been made. The game has already ended.' )
+
+
+		# Score the round. You get 10 points for making your bid and one point for each trick you take regardless of whether you bid or not:
+
+		base = self._base()
+
+		for ii in range( base, base + self.numPlayers ) :
+
+			points = self.Tricks[ ii ]
+
+			if self.Bids[ ii ] == self.Tricks[ ii ] :
+
+				points += 10
+
+			self.Points[ ii ] = points
+
+
 		# Clear the trump and led suit indicators
 
-		self.trump.trump = False
-		self.led.led = False
+		self.precedence.clear()
 
-		# Clear the player hands
+		# Clear the player hands and the card tracker
 
-		for ii in range( self.numPlayers ) :
+		self.Hand = [ 0 ] * self.numPlayers
 
-			self.Player[ii][ 'hand' ] = []		# Clear the lists to indicate empty hands for each player
+		self.Played = 0
+		self.Remaining = [ NUM_RANKS ] * NUM_SUITS
+		self.Voids = [ 0 ] * self.numPlayers
 
 
-		# Advance the dealer, the leader and the bidder in preparation for the next round :
+		# Advance the dealer, the leader and the bidder in preparation for the next round. The player to the left of the dealer bids first and leads the first trick :
 
 		self.Dealer = self._circInc( self.Dealer )
-		self.Leader = self.Dealer
+		self.Leader = self._circInc( self.Dealer )
 		self.Bidder = self.Leader
+		self.Current = self.Leader
 
 
 		# The following values set are done at the end of each trick and must be performed before every new round since the position of the leader changes
 
-		self.currentTrick[ self.Leader ] = None		# Empty the trick played by the leader. We will use this to test for overflow of tricks played.
-		self.currentTrick[ self.Dealer ] = None		# We use this to check whether all players have played cards in a given trick
+		self.currentTrick = [ None ] * self.numPlayers		# Empty the trick. We use this to test for overflow of tricks played and to check whether all players have played cards in a given trick
 
 
 		# Advance the round number:
@@ -415,16 +829,198 @@ class Blackout :
 			
 			self.numTricks += 1
 
+		self.version += 1
 
-		# We check for end of game:
 
-		assert self.numTricks != 0, 'ERROR: One too many calls to postRound() have been made. The game has already ended.'		# numTricks decremented to zero.
 
-			
+	def isOver( self ) :
+
+		'''
+		Returns True once the last round has been played (and scored by postRound()).
+		'''
+
+		return self.Round > self.numRounds
+
+
+
+	def scores( self ) :
+
+		'''
+		Returns the list of the total points scored by each player so far.
+		'''
+
+		totals = [ 0 ] * self.numPlayers
+
+		for ii in range( len( self.Points ) ) :
+
+			totals[ ii % self.numPlayers ] += self.Points[ ii ]
+
+		return totals
+
+
+
+	def toBytes( self ) :
+
+		'''
+		Returns a compact binary snapshot of the state of the game, for example to persist it between HTTP requests. The snapshot is restored by Blackout.fromBytes(). It has a fixed layout (all integers little-endian):
 
+		(a) A header of 16 bytes: the format version (SNAPSHOT_VERSION), numPlayers, maxTricks, Round, Dealer, Bidder, Current, Leader, numTricks, the index of the TrumpCard, the indices of the trump and led suits of self.precedence (missing cards and suits are stored as 255 and NO_SUIT respectively) and self.version as an unsigned 32-bit integer.
 
+		(b) The hand of each player and the mask of the cards played in the round (self.Played) as unsigned 64-bit masks.
 
+		(c) The card each player has played in the current trick (255 if none).
 
+		(d) The suits each player is known to be void in (self.Voids), one byte per player.
+
+		(e) The Bids, Tricks and Points arrays, one byte per round per player.
+
+		The random number generator, the validation level and the undo stack of applyMove() are not part of the snapshot. A game of 5 players and 7 tricks takes 269 bytes.
+		'''
+
+		n = self.numPlayers
+
+		header = _SNAPSHOT_HEADER.pack( SNAPSHOT_VERSION, n, self.maxTricks, self.Round, self.Dealer, self.Bidder, self.Current, self.Leader, self.numTricks, 255 if self.TrumpCard is None else self.TrumpCard.index, self.precedence.trumpIndex, self.precedence.ledIndex, self.version )
+
+		hands = struct.pack( '<%dQ' % ( n + 1 ), *( self.Hand + [ self.Played ] ) )
+
+		trick = bytes( bytearray( 255 if card is None else card for card in self.currentTrick ) )
+
+		voids = bytes( bytearray( self.Voids ) )
+
+		return header + hands + trick + voids + self.Bids.tobytes() + self.Tricks.tobytes() + self.Points.tobytes()
+
+
+
+	@classmethod
+	def fromBytes( cls, data, rng = None, validation = STRICT ) :
+
+		'''
+		Restores a game from a snapshot returned by toBytes(). Raises ValueError if 'data' is not a snapshot of a supported version.
+
+		rng: <random.Random> Optional random number generator for the restored game (see __init__()). Passing a shared generator avoids seeding a new one on every restore.
+
+		validation: <INT> The validation level of the restored game (see __init__()). Like the generator it is not part of the snapshot.
+		'''
+
+		if len( data ) < _SNAPSHOT_HEADER.size or bytearray( data[ :1 ] )[0] != SNAPSHOT_VERSION :
+
+			raise ValueError( 'ERROR: Not a version %d Blackout snapshot.' % SNAPSHOT_VERSION )
+
+		format, n, maxTricks, Round, Dealer, Bidder, Current, Leader, numTricks, trumpCard, trump, led, version = _SNAPSHOT_HEADER.unpack_from( data, 0 )
+
+		game = cls( n, maxTricks, rng, validation )
+
+		size = game.numRounds * n
+
+		if len( data ) != _SNAPSHOT_HEADER.size + 8 + 10 * n + 3 * size :
+
+			raise ValueError( 'ERROR: Truncated or corrupt Blackout snapshot.' )
+
+
+		game.Round = Round
+		game.Dealer = Dealer
+		game.Bidder = Bidder
+		game.Current = Current
+		game.Leader = Leader
+		game.numTricks = numTricks
+		game.version = version
+
+		if trumpCard != 255 :
+
+			game.TrumpCard = game.Deck[ trumpCard ]
+			game.trump = game.TrumpCard.Suit
+
+		if trump != NO_SUIT :
+
+			game.precedence.trump = Suit.All[ trump ]
+
+		if led != NO_SUIT :
+
+			game.precedence.led = Suit.All[ led ]
+			game.ledSuit = game.precedence.led
+
+
+		offset = _SNAPSHOT_HEADER.size
+
+		game.Hand = list( struct.unpack_from( '<%dQ' % ( n + 1 ), data, offset ) )
+
+		game.Played = game.Hand.pop()
+
+		game.Remaining = [ NUM_RANKS - countOf( game.Played & SUIT_MASK[ suit ] ) for suit in range( NUM_SUITS ) ]
+
+		offset += 8 * ( n + 1 )
+
+		game.currentTrick = [ None if card == 255 else card for card in bytearray( data[ offset : offset + n ] ) ]
+
+		game.Voids = list( bytearray( data[ offset + n : offset + 2 * n ] ) )
+
+		offset += 2 * n
+
+		game.Bids = array( 'b', data[ offset : offset + size ] )
+		game.Tricks = array( 'B', data[ offset + size : offset + 2 * size ] )
+		game.Points = array( 'B', data[ offset + 2 * size : offset + 3 * size ] )
+
+		return game
+
+
+
+	def bids( self, player ) :
+
+		'''
+		Returns the list of the bids of the player in every round so far (including the current one). -1 indicates that the player has not bid (yet).
+		'''
+
+		return list( self.Bids[ player : self._played() : self.numPlayers ] )
+
+
+
+	def tricks( self, player ) :
+
+		'''
+		Returns the list of the number of tricks the player won in every round so far (including the current one).
+		'''
+
+		return list( self.Tricks[ player : self._played() : self.numPlayers ] )
+
+
+
+	def points( self, player ) :
+
+		'''
+		Returns the list of the points the player scored in every round that has been completed.
+		'''
+
+		return list( self.Points[ player : ( self.Round - 1 ) * self.numPlayers : self.numPlayers ] )
+
+
+
+	def _played( self ) :
+
+		'''
+		Returns the end (exclusive) of the entries in the per-round arrays of the rounds played so far, including the current one.
+
+		Used internally.
+		'''
+
+		return min( self.Round, self.numRounds ) * self.numPlayers
+
+
+
+
+
+
+
+# Search (see Blackout.applyMove()):
+
+_VOIDED = 1 << 15		# Added to an entry of the undo stack when the move revealed a new void
+
+
+
+# Binary snapshots (see Blackout.toBytes()):
+
+SNAPSHOT_VERSION = 3
+
+_SNAPSHOT_HEADER = struct.Struct( '<12BI' )
 
 
 
@@ -443,3 +1039,140 @@ def circGen( total, start ) :
 	for ii in range(total) :
 
 		yield (ii + start) % total
+
+
+
+def shuffleDeck( rng ) :
+
+	'''
+	Returns a shuffled list of the integers 0 - 51 (pointing to the cards of a deck) drawn from the random.Random object 'rng'.
+	'''
+
+	shuffled = list( range( NUM_CARDS ) )
+
+	rng.shuffle( shuffled )
+
+	return shuffled
+
+
+
+def dealFrom( shuffled, numPlayers, numTricks, dealer ) :
+
+	'''
+	Deals a round from the permutation 'shuffled' of the integers 0 - 51. The cards are dealt one at a time starting with the player to the left of the dealer, that is the k-th card goes to player ( dealer + 1 + k ) % numPlayers, until every player holds numTricks cards. The next card determines the trump.
+
+	Returns the list of the players' hands (as masks, see cards.SUIT_MASK) and the integer identity of the trump card.
+	'''
+
+	hands = [ 0 ] * numPlayers
+
+	dealt = numPlayers * numTricks
+
+	for k in range( dealt ) :
+
+		hands[ ( dealer + 1 + k ) % numPlayers ] |= 1 << int( shuffled[ k ] )		# int() since the permutation may be a row of a NumPy array
+
+	return hands, int( shuffled[ dealt ] )
+
+
+
+def dealMany( count, numPlayers, numTricks, dealer = 0, seed = None ) :
+
+	'''
+	Generates 'count' deals at once following the same dealing order as dealFrom().
+
+	seed: An integer seed or a generator (numpy.random.Generator, or random.Random if NumPy is not installed). The same seed always produces the same deals on the same installation. The two paths draw from different generators though, so an integer seed produces different deals with and without NumPy: store the shuffled decks (or the games) rather than the seed to reproduce deals across machines.
+
+	Returns a tuple ( shuffled, hands, trump ) where shuffled[ ii ] is the permutation of the deck of deal ii (pass it to Blackout.Deal() to replay the deal in a game), hands[ ii ] the masks of the players' hands and trump[ ii ] the integer identity of the trump card. With NumPy these are arrays of shape (count, 52), (count, numPlayers) of type uint64 and (count,), otherwise lists.
+	'''
+
+	dealt = numPlayers * numTricks
+
+	assert dealt < NUM_CARDS, 'ERROR: Not enough cards in the deck for this deal.'
+
+
+	if numpy is None :		# Fall back to shuffling one deck at a time
+
+		import random
+
+		rng = seed if isinstance( seed, random.Random ) else random.Random( seed )
+
+		shuffled = [ shuffleDeck( rng ) for ii in range( count ) ]
+
+		deals = [ dealFrom( row, numPlayers, numTricks, dealer ) for row in shuffled ]
+
+		return shuffled, [ deal[0] for deal in deals ], [ deal[1] for deal in deals ]
+
+
+	rng = numpy.random.default_rng( seed )
+
+	shuffled = rng.permuted( numpy.tile( numpy.arange( NUM_CARDS, dtype = numpy.uint8 ), ( count, 1 ) ), axis = 1 )		# Each row is an independent permutation of the deck
+
+
+	# Column j of the dealt cards (viewed as numTricks rounds of numPlayers cards) goes to player ( dealer + 1 + j ) % numPlayers:
+
+	bits = numpy.left_shift( numpy.uint64( 1 ), shuffled[ :, :dealt ].astype( numpy.uint64 ) ).reshape( count, numTricks, numPlayers )
+
+	hands = numpy.roll( numpy.bitwise_or.reduce( bits, axis = 1 ), dealer + 1, axis = 1 )
+
+	return shuffled, hands, shuffled[ :, dealt ]
+
+
+
+def _trickWinnerSeat( trick, trump, led ) :
+
+	'''
+	Returns the seat that wins a single trick. 'trick' is indexed by seat and holds the integer identity of the card each seat played, 'trump' and 'led' are suit indices (NO_SUIT if unset). This is the same POWER kernel that evalTricks() applies to whole batches.
+	'''
+
+	power = POWER[ trump ][ led ]
+
+	winner = 0
+
+	for seat in range( 1, len( trick ) ) :
+
+		if power[ trick[ seat ] ] > power[ trick[ winner ] ] :
+
+			winner = seat
+
+	return winner
+
+
+
+def evalTricks( played, trump, led ) :
+
+	'''
+	Resolves a whole batch of tricks in a single vectorized call.
+
+	played: <ARRAY> of shape (N, numPlayers) where row ii holds the integer identities (0 - 51) of the cards played by each seat in trick ii.
+
+	trump: <ARRAY> of N trump suit indices, one per row (or a single index for all rows). NO_SUIT means no trump.
+
+	led: <ARRAY> of N indices of the suit led in each trick (or a single index for all rows).
+
+	Returns an array (a list if NumPy is not installed) of N seats, the winner of each trick.
+	'''
+
+	if numpy is None :		# Fall back to resolving the tricks one at a time
+
+		rows = len( played )
+
+		if not hasattr( trump, '__len__' ) :	trump = [ trump ] * rows
+		if not hasattr( led, '__len__' ) :	led = [ led ] * rows
+
+		return [ _trickWinnerSeat( played[ii], trump[ii], led[ii] ) for ii in range( rows ) ]
+
+
+	played = numpy.asarray( played, dtype = numpy.intp )
+	trump = numpy.asarray( trump, dtype = numpy.intp )
+	led = numpy.asarray( led, dtype = numpy.intp )
+
+	power = _POWER_ARRAY[ trump[ ..., None ], led[ ..., None ], played ]		# Look up the power of every card played in every trick: shape (N, numPlayers)
+
+	return power.argmax( axis = 1 )
+
+
+
+if numpy is not None :
+
+	_POWER_ARRAY = numpy.array( [ [ list( POWER[ trump ][ led ] ) for led in range( NUM_SUITS + 1 ) ] for trump in range( NUM_SUITS + 1 ) ], dtype = numpy.uint8 )		# The POWER tables as a single (5, 5, 52) array
@@ -20,6 +20,15 @@
 
 # To use this implementation it is best to use 'from cards import *'. If a plain 'import cards' is used the namespace will have to be respected.
 
+# Underneath the Suit, Rank and Card classes lies an integer card core. Every card is identified by an integer from 0 to 51 (its position in a deck ordered Spade, Heart, Club, Diamond and within each suit Two through Ace) so that its suit is index // 13 and its rank is index % 13. The precedence of one card over another for every combination of trump and led suit is precomputed into the BEATS tables (see the end of this file) so that comparing cards and resolving tricks reduces to table lookups. The Card class is a thin view over this integer core.
+
+
+NUM_SUITS = 4		# Number of suits in a deck
+NUM_RANKS = 13		# Number of ranks in each suit
+NUM_CARDS = NUM_SUITS * NUM_RANKS		# Number of cards in a deck
+
+NO_SUIT = NUM_SUITS		# Suit index used for 'no suit', i.e. no trump declared or nothing led yet
+
 
 class Suit:
 
@@ -35,13 +44,13 @@ class Suit:
 	a = Suit.Spade	# means the variable contains a spade
 	'''
 
-	def __init__( self, name ) :
+	__slots__ = ( 'name', 'index' )		# No per-instance dictionary. Only the four suits below should ever exist.
 
-		self.name = name
+	def __init__( self, name, index ) :
 
-		self.trump = False		# This declares that this suit is not trump (at least not yet). The way the enumerated type is being implemented, if this value is changed for any variable containing the enumerated type it will change simultaneously for all variables that contain that enumerated type (suit)
+		self.name = name
 
-		self.led = False		# This declares that this suit was NOT led (at least not yet). This behaves like the trump member.
+		self.index = index		# The integer (0 - 3) identifying this suit in the integer card core
 
 	def __str__( self ) :
 			
@@ -55,10 +64,12 @@ class Suit:
 
 # We use the Suit class to create the enumerated type elements explicitly:
 
-Suit.Spade = Suit( 'Spade' )		
-Suit.Heart = Suit( 'Heart' )
-Suit.Club = Suit( 'Club' )
-Suit.Diamond = Suit( 'Diamond' )
+Suit.Spade = Suit( 'Spade', 0 )		
+Suit.Heart = Suit( 'Heart', 1 )
+Suit.Club = Suit( 'Club', 2 )
+Suit.Diamond = Suit( 'Diamond', 3 )
+
+Suit.All = [ Suit.Spade, Suit.Heart, Suit.Club, Suit.Diamond ]		# All suits in the order of their integer indices, i.e. Suit.All[ suit.index ] is suit
 
 # We store a particular instance (object) of the class in the class (and not in an object) itself as a member. Now Suit.Spade is a particular Suit instance distinct from any other.
 #
@@ -68,15 +79,8 @@ Suit.Diamond = Suit( 'Diamond' )
 # b = Suit.Spade
 #
 # bool( a == b )		# This returns True so comparisons can be made.
-#
-# a.trump		# Initially False
-# Suit.Spade.trump = True		# Declare spades to be trump
-# a.trump		# Now True
-# b.trump		# Now True
-
-# The same goes for Suit.Spade.led = True which declares that Spades were led in the current hand/round. The Blackout class must explicitly take care of the problem of more than one suit being declared trump or led simultaneously. Between hands/rounds care must be taken to set these values back to False again.
 
-# Be careful. The code doesn't check if two suits have erroneously been declared trump.
+# The suits themselves carry NO knowledge of which suit is trump or which suit was led. These singletons are shared by every game running in the process so any such state stored on them would leak from one game into another. Instead each game keeps its own Precedence object (see below) which is passed explicitly into card comparisons.
 
 
 
@@ -88,6 +92,10 @@ class Rank:
 	It is based on the same logic as the Suit class
 	'''
 
+	__slots__ = ( 'rank', 'index' )		# No per-instance dictionary
+
+	stringList = ( '','', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A' ) 	# Stores string representations of the ranks. Shared by all instances.
+
 	def __init__( self, rank ) :
 
 		'''
@@ -99,7 +107,7 @@ class Rank:
 
 		self.rank = rank 	 # This is an integer value which denotes the rank of the card.
 
-		self.stringList = ['','', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A' ] 	# Stores string representations of the ranks
+		self.index = rank - 2		# The integer (0 - 12) identifying this rank in the integer card core
 	
 
 
@@ -126,7 +134,7 @@ class Rank:
 
 	def __repr__( self ) :
 
-		return self 
+		return str( self )
 
 
 # We use the Rank class to create the enumerated type elements explicitly, to correspond to the allowed ranks of cards:
@@ -145,79 +153,320 @@ Rank.Queen = Rank(12)
 Rank.King = Rank(13)
 Rank.Ace = Rank(14)
 
+Rank.All = [ Rank.Two, Rank.Three, Rank.Four, Rank.Five, Rank.Six, Rank.Seven, Rank.Eight, Rank.Nine, Rank.Ten, Rank.Jack, Rank.Queen, Rank.King, Rank.Ace ]		# All ranks in the order of their integer indices
+
+
+
+class Precedence:
+
+	'''
+	This holds the precedence context of a single game of cards, that is which suit (if any) is trump and which suit (if any) was led in the current trick.
+
+	Every game owns its own Precedence object and passes it explicitly into card comparisons (see Card.beats()). Since nothing is stored on the shared Suit singletons any number of games can run side by side in a single process (or thread pool) without corrupting each other.
+
+	Alongside the Suit objects the integer indices of the trump and led suits (NO_SUIT when unset) are kept in self.trumpIndex and self.ledIndex so that they can be used directly to select one of the BEATS tables.
+
+	Example:
+
+	p = Precedence( trump = Suit.Club )
+	p.led = Suit.Spade		# Spades were led in the current trick
+	'''
+
+	__slots__ = ( '_trump', 'trumpIndex', '_led', 'ledIndex' )
+
+	def __init__( self, trump = None, led = None ) :
+
+		self.trump = trump		# The Suit that is trump or None if no suit is trump (yet)
+
+		self.led = led		# The Suit that was led in the current trick or None if no card has been led (yet)
+
+
+	def _getTrump( self ) :
+
+		return self._trump
+
+
+	def _setTrump( self, suit ) :
+
+		self._trump = suit
+		self.trumpIndex = NO_SUIT if suit is None else suit.index
+
+
+	def _getLed( self ) :
+
+		return self._led
+
+
+	def _setLed( self, suit ) :
+
+		self._led = suit
+		self.ledIndex = NO_SUIT if suit is None else suit.index
+
+
+	trump = property( _getTrump, _setTrump )
+	led = property( _getLed, _setLed )
+
+
+	def clear( self ) :
+
+		'''
+		Clears both trump and led. Used between rounds.
+		'''
+
+		self.trump = None
+		self.led = None
+
+
+	def __str__( self ) :
+
+		return "<Precedence: trump %s, led %s>" % ( self.trump, self.led )
+
+
+	def __repr__( self ) :
+
+		return str( self )
+
 
 
 class Card:
 
 	'''
 	This card implements a single card of a deck. It basically contains a suit and a rank signifying a card. For the sake of simplicity it is NOT being implemented as an enumerated type.
+
+	Cards are immutable. The 52 cards of a deck are created once and shared by every game (see DECK below) so there is rarely a need to construct new ones.
 	'''
 
+	__slots__ = ( 'Suit', 'Rank', 'index' )		# No per-instance dictionary
+
 	def __init__( self, suit, rank ) :
 
-		# simply store the passed values
+		# simply store the passed values. Since Card forbids assignment (see __setattr__) we go through object.__setattr__
 		
-		self.Suit = suit
-		self.Rank = rank
+		object.__setattr__( self, 'Suit', suit )
+		object.__setattr__( self, 'Rank', rank )
+
+		object.__setattr__( self, 'index', suit.index * NUM_RANKS + rank.index )		# The integer (0 - 51) identifying this card in the integer card core
+
+
+	def __setattr__( self, name, value ) :
+
+		raise AttributeError( 'ERROR: Cards are immutable.' )
+
+
+	def beats( self, other, precedence ) :
+
+		'''
+		Returns True if this card takes precedence over the 'other' card given the trump and led suits stored in 'precedence' (a Precedence object belonging to the game in which the cards are being played).
+		'''
+
+		return BEATS[ precedence.trumpIndex ][ precedence.ledIndex ][ self.index * NUM_CARDS + other.index ] == 1		# The precedence rules are encoded in the BEATS tables built at the end of this file
 
 	
 	def __gt__( self, other ) :
 
 		'''
-		We overload the greater than operator allowing us to rank cards amongst each other. This function uses the suits' self-knowledge about them being trump and/or led or not.
+		We overload the greater than operator allowing us to rank cards amongst each other when neither suit is trump or has been led, that is only cards of the same suit can be compared. Use self.beats() to take a game's trump and led suits into account.
 		'''
 
-		# We check that either we are dealing with the same suit or if they are different suits then they are NOT both trump and/or NOT both designated as the suit that was led in the current hand
+		return self.beats( other, Precedence.Neutral )
 
-		if not self.Suit == other.Suit :		# If the two Suits are not the same perform some checks
 
-			assert not ( self.Suit.trump and other.Suit.trump ), 'ERROR: Two suits cannot be Trump at the same time.'
-			assert not ( self.Suit.led and other.Suit.led ), 'ERROR: Two suits cannot have been led in the current hand at the same time.'
+	def __str__( self ) :
 
+		return "<Card:  %s %s>" % ( self.Suit.name, self.Rank.stringList[ self.Rank.rank ] )
 
-		if self.Suit == other.Suit :		# The two suits match we should compare ranks. Uses overloading of equality operator in class Suit.
 
-			if self.Rank > other.Rank :		# Rank precedence established. User overloading of greather than operatore in class Rank.
+	def __repr__( self ) :
 
-				return True
+		return str(self)
 
-			else :
 
-				return False
 
-		else :					# Suits did not match. Check for trump and which suit was led.
+# A precedence context with no trump and no suit led. Used by Card.__gt__ and should never be modified.
 
-			if self.Suit.trump or other.Suit.trump :		# One of the two (distinct) suits is trump. (Both can't be because we checked via assertion).
+Precedence.Neutral = Precedence()
 
-				if self.Suit.trump :		# self is the Trump suit
 
-					return True		# Trump suit beats non-trump suit regardless of rank
 
-				else :
-					return False
+# The deck: a single immutable tuple of the 52 cards shared by every game in the process. DECK[ index ] is the card with integer identity 'index'.
 
-			elif self.Suit.led or other.Suit.led :			# Neither suit is trump but one or the other was the suit led in this hand which gives it precedence regardless or rank
+DECK = tuple( Card( suit, rank ) for suit in Suit.All for rank in Rank.All )
 
-				if self.Suit.led :		# self.Suit was the one led and so it has precedence
 
-					return True
 
-				else :
+# The integer card core:
 
-					return False			# Neither suit is trump so no rank precedence can be established
+def suitOf( index ) :
 
-			else :		# Neither suit was trump or led in which case no precedence exists
+	'''
+	Returns the integer suit (0 - 3) of the card with integer identity 'index' (0 - 51).
+	'''
 
-				return False
+	return index // NUM_RANKS
 
-		
 
+def rankOf( index ) :
 
-	def __str__( self ) :
+	'''
+	Returns the integer rank (0 - 12, i.e. Two through Ace) of the card with integer identity 'index' (0 - 51).
+	'''
 
-		return "<Card:  %s %s>" % ( self.Suit.name, self.Rank.stringList[ self.Rank.rank ] )
+	return index % NUM_RANKS
 
 
-	def __repr__( self ) :
 
-		return str(self)
+def _buildBeats( trump, led ) :
+
+	'''
+	Builds the flattened NUM_CARDS x NUM_CARDS table for the given trump and led suit indices. Entry [ a * NUM_CARDS + b ] is 1 if card 'a' takes precedence over card 'b' and 0 otherwise.
+	'''
+
+	table = bytearray( NUM_CARDS * NUM_CARDS )
+
+	for a in range( NUM_CARDS ) :
+
+		sa = a // NUM_RANKS
+
+		for b in range( NUM_CARDS ) :
+
+			sb = b // NUM_RANKS
+
+			if sa == sb :		# Same suit so rank decides
+
+				beats = a > b		# Within a suit the integer identity increases with rank
+
+			elif sa == trump :		# Trump suit beats non-trump suit regardless of rank
+
+				beats = True
+
+			elif sb == trump :
+
+				beats = False
+
+			else :		# Neither suit is trump. The led suit (if either is) takes precedence otherwise no precedence exists.
+
+				beats = sa == led
+
+			table[ a * NUM_CARDS + b ] = beats
+
+	return bytes( table )
+
+
+
+# BEATS[ trump ][ led ] is the precedence table for the given trump and led suit indices, where either may be NO_SUIT. Looking up BEATS[ trump ][ led ][ a * NUM_CARDS + b ] tells us whether card 'a' beats card 'b'.
+
+BEATS = [ [ _buildBeats( trump, led ) for led in range( NUM_SUITS + 1 ) ] for trump in range( NUM_SUITS + 1 ) ]
+
+
+
+def beats( a, b, trump = NO_SUIT, led = NO_SUIT ) :
+
+	'''
+	Returns True if the card with integer identity 'a' beats the card 'b' when 'trump' is the trump suit index and 'led' the index of the suit led (either may be NO_SUIT).
+	'''
+
+	return BEATS[ trump ][ led ][ a * NUM_CARDS + b ] == 1
+
+
+
+def _buildPower( trump, led ) :
+
+	'''
+	Builds the NUM_CARDS long table of trick-taking power of every card for the given trump and led suit indices. Cards of the led suit have power 1 - 13 by rank, trump cards 14 - 26 by rank and all other cards 0.
+	'''
+
+	table = bytearray( NUM_CARDS )
+
+	for card in range( NUM_CARDS ) :
+
+		suit = card // NUM_RANKS
+
+		if suit == trump :
+
+			table[ card ] = NUM_RANKS + 1 + card % NUM_RANKS
+
+		elif suit == led :
+
+			table[ card ] = 1 + card % NUM_RANKS
+
+	return bytes( table )
+
+
+
+# POWER[ trump ][ led ][ card ] is the trick-taking power of the card. Since the card led always has non-zero power and no two cards share the same non-zero power the winner of a trick is simply the card with the highest power. This is the kernel used to resolve tricks, one at a time or in batches.
+
+POWER = [ [ _buildPower( trump, led ) for led in range( NUM_SUITS + 1 ) ] for trump in range( NUM_SUITS + 1 ) ]
+
+
+
+def trickWinner( played, trump = NO_SUIT ) :
+
+	'''
+	Returns the position within 'played' (a sequence of integer card identities in the order they were played, the first being the card led) of the card that wins the trick.
+	'''
+
+	power = POWER[ trump ][ played[0] // NUM_RANKS ]		# The first card played decides the suit led
+
+	winner = 0
+
+	for ii in range( 1, len( played ) ) :
+
+		if power[ played[ ii ] ] > power[ played[ winner ] ] :
+
+			winner = ii
+
+	return winner
+
+
+
+# Sets of cards (for example a player's hand) are represented as 52-bit integer masks where bit 'index' is set if the card with integer identity 'index' is in the set. The cards of suit 's' occupy bits 13 * s to 13 * s + 12 so SUIT_MASK[ s ] selects them (SUIT_MASK[ NO_SUIT ] is empty).
+
+SUIT_MASK = [ ( ( 1 << NUM_RANKS ) - 1 ) << ( NUM_RANKS * suit ) for suit in range( NUM_SUITS ) ] + [ 0 ]
+
+FULL_MASK = ( 1 << NUM_CARDS ) - 1		# Mask of the entire deck
+
+
+
+def maskOf( cards ) :
+
+	'''
+	Returns the mask of a sequence of integer card identities.
+	'''
+
+	mask = 0
+
+	for card in cards :
+
+		mask |= 1 << card
+
+	return mask
+
+
+
+def cardsOf( mask ) :
+
+	'''
+	Returns the list of integer card identities in 'mask' in ascending order.
+	'''
+
+	cards = []
+
+	while mask :
+
+		low = mask & -mask		# Isolate the lowest set bit
+
+		cards.append( low.bit_length() - 1 )
+
+		mask ^= low
+
+	return cards
+
+
+
+def countOf( mask ) :
+
+	'''
+	Returns the number of cards in 'mask'.
+	'''
+
+	return bin( mask ).count( '1' )
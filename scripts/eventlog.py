@@ -0,0 +1,339 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements an event-sourced log of a game of Blackout.
+#
+# Every call to Deal(), Bid(), Move(), evalTrick() and postRound() made through an EventLog is appended to a compact byte string of events (one opcode byte followed by at most two bytes of arguments). The game's random number generator is seeded from a seed stored with the log so the deals are replayed exactly without storing them. The log can be written out after every action (crash recovery) and any position of the game rebuilt from it (audits).
+#
+# To avoid replaying a long game from the start the log also takes checkpoints (a Blackout.toBytes() snapshot and the state of the generator) after every 'checkpointEvery' rounds. A position is rebuilt from the last checkpoint before it plus the tail of events that follow.
+
+
+import random
+import struct
+
+from array import array
+from bisect import bisect_right
+
+from blackout import *		# Access the Blackout class
+
+
+
+# Event opcodes:
+
+DEAL = 0		# Deal() from the game's generator. No arguments.
+DEAL_FROM = 1		# Deal( shuffled ) from an explicit permutation. Followed by the 52 card indices.
+BID = 2		# Bid( player, bid ). Followed by the player and the bid.
+MOVE = 3		# Move( player, card ). Followed by the player and the card.
+EVAL_TRICK = 4		# evalTrick(). No arguments.
+POST_ROUND = 5		# postRound(). No arguments.
+
+_ARGUMENTS = ( 0, NUM_CARDS, 2, 2, 0, 0 )		# Number of argument bytes of each opcode
+
+
+LOG_VERSION = 1
+
+_LOG_HEADER = struct.Struct( '<BBBQ' )		# Version, numPlayers, maxTricks, seed
+
+
+
+class EventLog :
+
+	'''
+	Records the actions taken in one game of Blackout and replays them.
+
+	The game itself is self.game. Actions must be taken through the log (which forwards them to the game) so that they are recorded. Bid() and Move() return the value returned by the game and are only recorded if they succeed.
+
+	seed: <INT> Seed (less than 2**64) of the game's random number generator. A random one is drawn by default.
+
+	checkpointEvery: <INT> Number of rounds between checkpoints (0 to never take one).
+
+	Example:
+
+	log = EventLog( 4 )
+	log.Deal()
+	log.Bid( 1, 2 )
+	...
+	data = log.toBytes()		# Store after every action
+
+	game = EventLog.fromBytes( data ).game		# The game as it was
+	earlier = log.replay( 10 )		# The game after the first 10 events
+	'''
+
+	def __init__( self, numPlayers, maxTricks = 7, seed = None, checkpointEvery = 1 ) :
+
+		if seed is None :
+
+			seed = random.SystemRandom().getrandbits( 64 )
+
+		self.seed = seed
+		self.checkpointEvery = checkpointEvery
+
+		self.game = Blackout( numPlayers, maxTricks, random.Random( seed ) )
+
+		self.events = bytearray()		# The events, appended as they happen
+		self.offsets = array( 'I' )		# The offset in self.events of each event
+
+		self.checkpoints = [ ( 0, self.game.toBytes(), self.game.rng.getstate() ) ]		# ( number of events, snapshot, generator state ), in order
+
+
+	def __len__( self ) :
+
+		return len( self.offsets )
+
+
+	def _append( self, op, *args ) :
+
+		self.offsets.append( len( self.events ) )
+
+		self.events.append( op )
+		self.events.extend( args )
+
+
+	def Deal( self, shuffled = None ) :
+
+		self.game.Deal( shuffled )
+
+		if shuffled is None :
+
+			self._append( DEAL )
+
+		else :
+
+			self._append( DEAL_FROM, *[ int( card ) for card in shuffled ] )
+
+
+	def Bid( self, player, bid ) :
+
+		result = self.game.Bid( player, bid )
+
+		if result :
+
+			self._append( BID, player, bid )
+
+		return result
+
+
+	def Move( self, player, card ) :
+
+		result = self.game.Move( player, card )
+
+		if result :
+
+			self._append( MOVE, player, card )
+
+		return result
+
+
+	def evalTrick( self ) :
+
+		winner = self.game.evalTrick()
+
+		self._append( EVAL_TRICK )
+
+		return winner
+
+
+	def postRound( self ) :
+
+		self.game.postRound()
+
+		self._append( POST_ROUND )
+
+		if self.checkpointEvery and ( self.game.Round - 1 ) % self.checkpointEvery == 0 :
+
+			self.checkpoint()
+
+
+	def checkpoint( self ) :
+
+		'''
+		Takes a checkpoint of the current position.
+		'''
+
+		self.checkpoints.append( ( len( self ), self.game.toBytes(), self.game.rng.getstate() ) )
+
+
+	def replay( self, count = None ) :
+
+		'''
+		Returns a new Blackout object in the position reached after the first 'count' events (all of them by default), rebuilt from the last checkpoint at or before that event and the events that follow it. Raises ValueError if the log holds fewer than 'count' events.
+		'''
+
+		if count is None :
+
+			count = len( self )
+
+		if not 0 <= count <= len( self ) :
+
+			raise ValueError( 'ERROR: The log only holds %d events.' % len( self ) )
+
+		done, snapshot, state = self.checkpoints[ bisect_right( [ point[0] for point in self.checkpoints ], count ) - 1 ]
+
+		rng = random.Random()
+		rng.setstate( state )
+
+		game = Blackout.fromBytes( snapshot, rng, OFF )		# The events were checked when they were recorded
+
+		start = self.offsets[ done ] if done < len( self ) else len( self.events )
+		end = self.offsets[ count ] if count < len( self ) else len( self.events )
+
+		_apply( game, self.events, start, end )
+
+		game.validation = STRICT
+
+		return game
+
+
+	def toBytes( self ) :
+
+		'''
+		Returns the log as a byte string: a header (version byte, numPlayers, maxTricks and the seed) followed by the events. Checkpoints are not stored, they are taken again by fromBytes().
+		'''
+
+		return _LOG_HEADER.pack( LOG_VERSION, self.game.numPlayers, self.game.maxTricks, self.seed ) + bytes( self.events )
+
+
+	@classmethod
+	def fromBytes( cls, data, checkpointEvery = 1 ) :
+
+		'''
+		Rebuilds a log (and its game) from the output of toBytes() by replaying every event. Raises ValueError if the data is not a log of a supported version or an event is illegal (including a DEAL_FROM whose cards are not a permutation of the deck and the BlackoutError raised by an event out of turn or out of place).
+		'''
+
+		if len( data ) < _LOG_HEADER.size or bytearray( data[ :1 ] )[0] != LOG_VERSION :
+
+			raise ValueError( 'ERROR: Not a version %d Blackout event log.' % LOG_VERSION )
+
+		version, numPlayers, maxTricks, seed = _LOG_HEADER.unpack_from( data, 0 )
+
+		if not 0 < numPlayers < NUM_CARDS or not 0 < maxTricks < 14 :		# Checked here too since the constructor only asserts maxTricks, which -O strips
+
+			raise ValueError( 'ERROR: Corrupt header (%d players, maxTricks %d).' % ( numPlayers, maxTricks ) )
+
+		try :
+
+			log = cls( numPlayers, maxTricks, seed, checkpointEvery )
+
+		except AssertionError as error :		# Including the BlackoutError raised by the constructor
+
+			raise ValueError( 'ERROR: Corrupt header (%s).' % error )
+
+		events = bytearray( data[ _LOG_HEADER.size : ] )
+
+		offset = 0
+
+		while offset < len( events ) :
+
+			op = events[ offset ]
+
+			if op >= len( _ARGUMENTS ) or offset + 1 + _ARGUMENTS[ op ] > len( events ) :
+
+				raise ValueError( 'ERROR: Corrupt event at offset %d.' % offset )
+
+			args = events[ offset + 1 : offset + 1 + _ARGUMENTS[ op ] ]
+
+			try :
+
+				if op == DEAL :
+
+					log.Deal()
+
+				elif op == DEAL_FROM :
+
+					if sorted( args ) != list( range( NUM_CARDS ) ) :		# Deal() trusts its permutation
+
+						raise ValueError( 'ERROR: The deal at offset %d is not a permutation of the deck.' % offset )
+
+					log.Deal( list( args ) )
+
+				elif op == BID :
+
+					if not log.Bid( *args ) :
+
+						raise ValueError( 'ERROR: Illegal bid at offset %d.' % offset )
+
+				elif op == MOVE :
+
+					if not log.Move( *args ) :
+
+						raise ValueError( 'ERROR: Illegal move at offset %d.' % offset )
+
+				elif op == EVAL_TRICK :
+
+					log.evalTrick()
+
+				else :
+
+					log.postRound()
+
+			except BlackoutError as error :
+
+				raise ValueError( 'ERROR: Illegal event at offset %d (%s).' % ( offset, error ) )
+
+			offset += 1 + _ARGUMENTS[ op ]
+
+		return log
+
+
+
+def _apply( game, events, start, end ) :
+
+	'''
+	Applies the events in events[ start : end ] (which were recorded by an EventLog) to 'game'. The events are trusted: the results of Bid() and Move() are not checked (run 'game' with validation OFF to skip the checks altogether).
+	'''
+
+	offset = start
+
+	while offset < end :
+
+		op = events[ offset ]
+
+		if op == MOVE :		# By far the most common event
+
+			game.Move( events[ offset + 1 ], events[ offset + 2 ] )
+
+			offset += 3
+
+		elif op == EVAL_TRICK :
+
+			game.evalTrick()
+
+			offset += 1
+
+		elif op == BID :
+
+			game.Bid( events[ offset + 1 ], events[ offset + 2 ] )
+
+			offset += 3
+
+		elif op == DEAL :
+
+			game.Deal()
+
+			offset += 1
+
+		elif op == DEAL_FROM :
+
+			game.Deal( list( events[ offset + 1 : offset + 1 + NUM_CARDS ] ) )
+
+			offset += 1 + NUM_CARDS
+
+		else :
+
+			game.postRound()
+
+			offset += 1
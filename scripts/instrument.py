@@ -0,0 +1,230 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements optional instrumentation of the hot paths of the Blackout class, to tell whether slow tables are caused by the kernel or by the web layer.
+#
+# enable() replaces the methods in METHODS on the Blackout class by wrappers which count the calls, record their latencies in histograms and count the bids and moves rejected (the calls returning False). disable() puts the original methods back, so that instrumentation costs nothing at all when it is off.
+#
+# The data is exposed as a dictionary (snapshot()) and in the Prometheus text format (prometheusText()), served at /metrics by the game server (server.py), which is the process running the games, and by the Django app at /metrics/ for its own process.
+#
+# In the Django process the name 'blackout' is taken by the project package (ROOT_URLCONF = 'blackout.urls'), which hides the kernel module of the same name in this directory. The kernel is then loaded from this directory under the name in KERNEL instead.
+
+
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+from bisect import bisect_left
+
+KERNEL = 'blackout_kernel'		# The module name of the kernel when 'blackout' is taken
+
+try :
+
+	from blackout import Blackout		# Access the Blackout class
+
+except ImportError :		# 'blackout' is the Django project package
+
+	if KERNEL not in sys.modules :
+
+		spec = importlib.util.spec_from_file_location( KERNEL, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'blackout.py' ) )
+
+		sys.modules[ KERNEL ] = importlib.util.module_from_spec( spec )
+
+		spec.loader.exec_module( sys.modules[ KERNEL ] )
+
+	Blackout = sys.modules[ KERNEL ].Blackout
+
+
+
+METHODS = ( 'Deal', 'Bid', 'Move', 'evalTrick', 'postRound' )
+
+BUCKETS = ( 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2 )		# Upper bounds in seconds of the latency histogram buckets (a last bucket holds the slower calls)
+
+
+_originals = {}		# Maps the names of the instrumented methods to the original methods while enabled
+
+_lock = threading.Lock()
+
+
+
+class _Stats :
+
+	'''
+	The statistics of one method.
+	'''
+
+	def __init__( self ) :
+
+		self.clear()
+
+
+	def clear( self ) :
+
+		self.count = 0
+		self.total = 0.0		# Sum of the latencies in seconds
+		self.rejected = 0
+		self.buckets = [ 0 ] * ( len( BUCKETS ) + 1 )		# Number of calls in each bucket (not cumulative)
+
+
+	def record( self, elapsed, result ) :
+
+		with _lock :
+
+			self.count += 1
+			self.total += elapsed
+			self.buckets[ bisect_left( BUCKETS, elapsed ) ] += 1
+
+			if result is False :
+
+				self.rejected += 1
+
+
+
+_stats = dict( ( name, _Stats() ) for name in METHODS )
+
+
+
+def _wrap( name, method ) :
+
+	stats = _stats[ name ]
+
+	def timed( self, *args, **kwargs ) :
+
+		start = time.perf_counter()
+
+		result = method( self, *args, **kwargs )
+
+		stats.record( time.perf_counter() - start, result )
+
+		return result
+
+	timed.__name__ = method.__name__
+	timed.__doc__ = method.__doc__
+
+	return timed
+
+
+
+def enable() :
+
+	'''
+	Starts instrumenting the Blackout class (of every game in the process).
+	'''
+
+	for name in METHODS :
+
+		if name not in _originals :
+
+			_originals[ name ] = Blackout.__dict__[ name ]
+
+			setattr( Blackout, name, _wrap( name, _originals[ name ] ) )
+
+
+
+def disable() :
+
+	'''
+	Stops instrumenting the Blackout class. The statistics gathered so far are kept.
+	'''
+
+	for name in list( _originals ) :
+
+		setattr( Blackout, name, _originals.pop( name ) )
+
+
+
+def isEnabled() :
+
+	return bool( _originals )
+
+
+
+def reset() :
+
+	'''
+	Clears the statistics.
+	'''
+
+	with _lock :
+
+		for name in METHODS :
+
+			_stats[ name ].clear()
+
+
+
+def snapshot() :
+
+	'''
+	Returns the statistics as a dictionary mapping every method in METHODS to a dictionary of its number of calls ('count'), total latency in seconds ('sum'), number of rejected calls ('rejected', always 0 except for Bid and Move) and latency histogram ('buckets': a list of ( upper bound in seconds, cumulative number of calls ) with a last bound of float( 'inf' )).
+	'''
+
+	result = {}
+
+	with _lock :
+
+		for name in METHODS :
+
+			stats = _stats[ name ]
+
+			cumulative = 0
+			buckets = []
+
+			for bound, count in zip( BUCKETS + ( float( 'inf' ), ), stats.buckets ) :
+
+				cumulative += count
+
+				buckets.append( ( bound, cumulative ) )
+
+			result[ name ] = { 'count': stats.count, 'sum': stats.total, 'rejected': stats.rejected, 'buckets': buckets }
+
+	return result
+
+
+
+def prometheusText() :
+
+	'''
+	Returns the statistics in the Prometheus text exposition format.
+	'''
+
+	lines = [
+			'# HELP blackout_call_duration_seconds Latency of the Blackout kernel methods.',
+			'# TYPE blackout_call_duration_seconds histogram',
+		]
+
+	data = snapshot()
+
+	for name in METHODS :
+
+		for bound, count in data[ name ][ 'buckets' ] :
+
+			lines.append( 'blackout_call_duration_seconds_bucket{method="%s",le="%s"} %d' % ( name, '+Inf' if bound == float( 'inf' ) else repr( bound ), count ) )
+
+		lines.append( 'blackout_call_duration_seconds_sum{method="%s"} %r' % ( name, data[ name ][ 'sum' ] ) )
+		lines.append( 'blackout_call_duration_seconds_count{method="%s"} %d' % ( name, data[ name ][ 'count' ] ) )
+
+	lines.append( '# HELP blackout_rejected_total Bids and moves rejected by the Blackout kernel.' )
+	lines.append( '# TYPE blackout_rejected_total counter' )
+
+	for name in ( 'Bid', 'Move' ) :
+
+		lines.append( 'blackout_rejected_total{method="%s"} %d' % ( name, data[ name ][ 'rejected' ] ) )
+
+	return '\n'.join( lines ) + '\n'
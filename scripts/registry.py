@@ -0,0 +1,357 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a process-local registry of live Blackout games for the web server.
+#
+# The games being played are kept in memory keyed by game id, so that serving a request never touches the database. Games that have not been used for a while (more than 'ttl' seconds) or that are pushed out by more recently used games (when there are more than 'capacity' of them) are evicted: they are serialized with Blackout.toBytes() and handed to a background thread which writes them to a local SQLite database in batches (write-behind). Evicted games are loaded back on demand, straight from the queue if they have not been written yet.
+#
+# The validation level of a game and, unless the registry is given a generator for all the games it loads back, the state of the game's own random.Random generator are stored with its snapshot, so that a game behaves the same after it is loaded back. Games using the shared generator of the random module keep using it.
+#
+# A write that fails (for example because the disk is full) is logged and retried with the next batch: the games stay in the queue's memory, and can still be loaded back from it, until they are written.
+#
+# Removing a game also goes through the queue (as a tombstone), so that the database is only ever changed by the background thread and in the order of the changes: a snapshot queued before the game was removed can not be written after its deletion.
+
+
+import logging
+import queue
+import random
+import sqlite3
+import struct
+import threading
+import time
+
+from collections import OrderedDict
+
+from blackout import *		# Access the Blackout class
+
+
+
+_REMOVED = object()		# The tombstone queued (and kept in GameRegistry._pending) for a removed game until it is deleted from the database
+
+_RNG_STATE = struct.Struct( '<B625Id' )		# The state of a random.Random generator: its version, the 625 words of the Mersenne Twister and the next Gaussian (NaN for None)
+
+_log = logging.getLogger( 'blackout.registry' )
+
+
+class GameRegistry :
+
+	'''
+	Process-local registry of live games with LRU/TTL eviction to SQLite.
+
+	path: <STRING> The SQLite database file the evicted games are stored in.
+
+	capacity: <INT> Maximum number of games kept in memory.
+
+	ttl: <FLOAT> Number of seconds after which an unused game is evicted (None to only evict when over capacity).
+
+	batchSize: <INT> Maximum number of games written to the database in one transaction.
+
+	interval: <FLOAT> Number of seconds between sweeps of the background thread for idle games.
+
+	clock: <FUNCTION> Returns the current time in seconds.
+
+	rng: <random.Random> Optional generator given to every game loaded back, e.g. one shared by the process. By default the state of each game's own generator is stored with it.
+
+	Example:
+
+	registry = GameRegistry( 'games.sqlite3' )
+	registry.put( gameId, Blackout( 4 ) )
+	...
+	game = registry.get( gameId )		# None if there is no such game
+	...
+	registry.close()		# Writes every game out
+	'''
+
+	def __init__( self, path, capacity = 10000, ttl = 3600, batchSize = 100, interval = 1.0, clock = time.time, rng = None ) :
+
+		self.path = path
+		self.capacity = capacity
+		self.ttl = ttl
+		self.batchSize = batchSize
+		self.interval = interval
+		self.clock = clock
+		self.rng = rng
+
+		self._games = OrderedDict()		# Maps game ids to [ game, time of last use ] from the least to the most recently used
+		self._pending = {}		# Maps the ids of evicted games that have not been written yet to their rows ( snapshot, validation, generator state ) (or _REMOVED)
+		self._lock = threading.RLock()
+
+		self._db = sqlite3.connect( path, check_same_thread = False )		# Used (under self._lock) to load games back. Only the background thread writes.
+		self._db.execute( 'CREATE TABLE IF NOT EXISTS games ( id TEXT PRIMARY KEY, data BLOB NOT NULL, validation INTEGER NOT NULL DEFAULT %d, rng BLOB )' % STRICT )
+
+		columns = [ row[1] for row in self._db.execute( 'PRAGMA table_info( games )' ) ]
+
+		if 'validation' not in columns :		# A database written before the validation level and the generator were stored
+
+			self._db.execute( 'ALTER TABLE games ADD COLUMN validation INTEGER NOT NULL DEFAULT %d' % STRICT )
+			self._db.execute( 'ALTER TABLE games ADD COLUMN rng BLOB' )
+
+		self._db.commit()
+
+		self._queue = queue.Queue()		# Rows ( game id, row ) to write or ( game id, _REMOVED ) to delete. ( None, None ) stops the writer.
+
+		self.hits = 0		# Requests served from memory
+		self.loads = 0		# Requests for evicted games
+		self.evictions = 0
+
+		self._writer = threading.Thread( target = self._write, name = 'GameRegistry writer' )
+		self._writer.daemon = True
+		self._writer.start()
+
+
+	def __len__( self ) :
+
+		return len( self._games )
+
+
+	def put( self, gameId, game ) :
+
+		'''
+		Adds (or replaces) the game 'gameId'.
+		'''
+
+		with self._lock :
+
+			self._games.pop( gameId, None )
+			self._pending.pop( gameId, None )		# A snapshot still queued is now stale (the writer checks before writing)
+
+			self._games[ gameId ] = [ game, self.clock() ]
+
+			while len( self._games ) > self.capacity :
+
+				self._evict( next( iter( self._games ) ) )
+
+
+	def get( self, gameId ) :
+
+		'''
+		Returns the game 'gameId' (loading it back if it was evicted) or None if there is no such game.
+		'''
+
+		with self._lock :
+
+			entry = self._games.get( gameId )
+
+			if entry is not None :		# The hot path
+
+				self._games[ gameId ] = self._games.pop( gameId )		# Mark as the most recently used
+
+				entry[1] = self.clock()
+
+				self.hits += 1
+
+				return entry[0]
+
+			self.loads += 1
+
+			row = self._pending.get( gameId )
+
+			if row is _REMOVED :
+
+				return None
+
+			if row is None :
+
+				row = self._db.execute( 'SELECT data, validation, rng FROM games WHERE id = ?', ( gameId, ) ).fetchone()
+
+				if row is None :
+
+					return None
+
+			data, validation, state = row
+
+			rng = self.rng
+
+			if rng is None and state is not None :
+
+				rng = random.Random()
+
+				values = _RNG_STATE.unpack( bytes( state ) )
+
+				rng.setstate( ( values[0], values[ 1:-1 ], None if values[ -1 ] != values[ -1 ] else values[ -1 ] ) )		# NaN stands for None
+
+			game = Blackout.fromBytes( bytes( data ), rng, validation )
+
+			self.put( gameId, game )
+
+			return game
+
+
+	def remove( self, gameId ) :
+
+		'''
+		Removes the game 'gameId' from the registry and (by the background thread) from the database, for example once it is over.
+		'''
+
+		with self._lock :
+
+			self._games.pop( gameId, None )
+
+			self._pending[ gameId ] = _REMOVED
+
+			self._queue.put( ( gameId, _REMOVED ) )
+
+
+	def evictIdle( self ) :
+
+		'''
+		Evicts the games that have not been used for more than self.ttl seconds. Called periodically by the background thread.
+		'''
+
+		if self.ttl is None :
+
+			return
+
+		with self._lock :
+
+			limit = self.clock() - self.ttl
+
+			for gameId, entry in list( self._games.items() ) :		# From the least recently used
+
+				if entry[1] > limit :
+
+					break
+
+				self._evict( gameId )
+
+
+	def _evict( self, gameId ) :
+
+		game, used = self._games.pop( gameId )
+
+		state = None
+
+		if self.rng is None and isinstance( game.rng, random.Random ) :		# Not the shared generator of the random module
+
+			version, words, gauss = game.rng.getstate()
+
+			state = _RNG_STATE.pack( version, *( words + ( float( 'nan' ) if gauss is None else gauss, ) ) )
+
+		row = ( game.toBytes(), game.validation, state )
+
+		self._pending[ gameId ] = row
+
+		self._queue.put( ( gameId, row ) )
+
+		self.evictions += 1
+
+
+	def _write( self ) :
+
+		'''
+		The background thread: writes the queued snapshots (and deletes the removed games) in batches and sweeps for idle games. A batch that fails is logged and its rows retried with the next batch.
+		'''
+
+		db = sqlite3.connect( self.path )
+
+		retry = []		# The rows of the batch that failed
+
+		running = True
+
+		while running :
+
+			batch = []
+
+			try :
+
+				batch.append( self._queue.get( timeout = self.interval ) )
+
+				while len( batch ) < self.batchSize :
+
+					batch.append( self._queue.get_nowait() )
+
+			except queue.Empty :
+
+				pass
+
+			if batch or retry :
+
+				running = ( None, None ) not in batch
+
+				with self._lock :		# Skip the snapshots that were superseded, loaded back or removed since they were queued
+
+					rows = [ ( gameId, row ) for gameId, row in retry + batch if gameId is not None and self._pending.get( gameId ) is row ]
+
+				# A game removed after this point has its tombstone queued behind its snapshot, so it is deleted by a later batch.
+
+				try :
+
+					db.executemany( 'INSERT OR REPLACE INTO games VALUES ( ?, ?, ?, ? )', [ ( gameId, ) + row for gameId, row in rows if row is not _REMOVED ] )
+					db.executemany( 'DELETE FROM games WHERE id = ?', [ ( gameId, ) for gameId, row in rows if row is _REMOVED ] )
+					db.commit()
+
+				except sqlite3.Error :
+
+					_log.exception( 'Writing %d games to %s failed. They are kept in memory and retried.', len( rows ), self.path )
+
+					db.rollback()
+
+					retry = rows
+
+				else :
+
+					retry = []
+
+					with self._lock :
+
+						for gameId, row in rows :
+
+							if self._pending.get( gameId ) is row :
+
+								del self._pending[ gameId ]
+
+				for item in batch :		# Even if the write failed, so that flush() does not block for ever
+
+					self._queue.task_done()
+
+			if running :
+
+				self.evictIdle()
+
+		if retry :
+
+			_log.error( '%d games could not be written to %s before closing and are lost.', len( retry ), self.path )
+
+		db.close()
+
+
+	def flush( self ) :
+
+		'''
+		Blocks until every game evicted so far has been written to the database, or has failed to be (it is then retried by the background thread, see _write()).
+		'''
+
+		self._queue.join()
+
+
+	def close( self ) :
+
+		'''
+		Evicts every game, writes them all to the database and stops the background thread.
+		'''
+
+		with self._lock :
+
+			while self._games :
+
+				self._evict( next( iter( self._games ) ) )
+
+		self._queue.put( ( None, None ) )
+
+		self._writer.join()
+
+		self._db.close()
@@ -0,0 +1,511 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a sampler of the hidden hands of a round of Blackout as seen by one player (determinization), for the imperfect-information bots and the win probabilities shown to players.
+#
+# A player sees his own hand, the TrumpCard and the cards played so far, and knows how many cards every other player still holds and which suits they are void in (see the card tracker of the Blackout class). The sampler draws deals of the cards he has not seen (to the other players and to the pile of cards that were not dealt) uniformly among all the deals consistent with this, without rejection.
+#
+# The only constraints are the voids and they apply to whole suits, so the suits void for the same set of players are merged into one group of interchangeable cards (there are at most four groups). The number of consistent deals is counted once per position by a recursion over the players void in some suit on the numbers of cards left in each group: a player who takes y_1, ..., y_g cards from groups of r_1, ..., r_g cards can do so in C( r_1, y_1 ) * ... * C( r_g, y_g ) ways. The other players can hold any of the cards left, so they (and the pile of the cards that were not dealt) share them in multinomial( r_1 + ... + r_g; needs ) ways. A sample picks the numbers of cards every void player takes from each group with the probability of their share of the deals, deals them from random permutations of the groups and deals what is left to the other players. With NumPy many samples are drawn at once: the numbers of cards every player takes from each group are drawn from tables built once per position, and every group of every sample is shuffled by one sort of random keys, from which the players take consecutive runs.
+
+
+import random
+
+from bisect import bisect_right
+
+from blackout import *		# Access the Blackout class and the integer card core
+
+
+# NumPy is optional (see blackout.py).
+
+try :
+
+	import numpy
+
+except ImportError :
+
+	numpy = None
+
+
+
+_CARD_BITS = ( 1 << 6 ) - 1		# The bits of a sort key of sampleMany() that hold the card
+_RANDOM_BITS = ( ( 1 << 24 ) - 1 ) << 6		# Those that are drawn at random
+_GROUP_SHIFT = 30		# The position of the group of the card, in the top two bits
+
+_BLOCK = 4096		# The number of deals sampleMany() draws at once, so that its arrays stay in the cache
+
+
+_FACTORIAL = [ 1 ]		# n! for n from 0 to 52
+
+for ii in range( 1, NUM_CARDS + 1 ) :
+
+	_FACTORIAL.append( _FACTORIAL[ -1 ] * ii )
+
+
+
+def _binomial( n, k ) :
+
+	return _FACTORIAL[ n ] // ( _FACTORIAL[ k ] * _FACTORIAL[ n - k ] )
+
+
+
+_BINOMIALS = None if numpy is None else numpy.array( [ [ _binomial( n, k ) if k <= n else 0 for k in range( NUM_CARDS + 1 ) ] for n in range( NUM_CARDS + 1 ) ], dtype = float )		# C( n, k ) for n and k from 0 to 52
+
+
+
+def _splits( need, allowed, remaining ) :
+
+	'''
+	Generates the ways a player who needs 'need' cards can take them from the groups: tuples y with sum( y ) == need, y[g] <= remaining[g] and y[g] == 0 unless allowed[g].
+	'''
+
+	if not remaining :
+
+		if not need :
+
+			yield ()
+
+		return
+
+	for take in range( min( need, remaining[0] ) + 1 if allowed[0] else 1 ) :
+
+		for rest in _splits( need - take, allowed[ 1: ], remaining[ 1: ] ) :
+
+			yield ( take, ) + rest
+
+
+
+def _shuffledCards( rng, count, low ) :
+
+	'''
+	Returns the cards shuffled 'count' times, as an array of shape (len( low ) + 1, count) of their masks with one column per sample, under a row of empty masks. The cards are shuffled by sorting one 32 bit key per card, whose bits outside _RANDOM_BITS are taken from 'low' (a uint32 array):
+
+	bits 0-5: the card, read back after the sort,
+	bits 6-29: random,
+	bits 30-31: the group of the card. sampleMany() puts the groups there in increasing order, so every group stays in its own run of rows, in the order of the groups, and is shuffled among itself.
+
+	Two cards of a group whose random bits are equal (a pair in 2^24, so about one sample in 30000 of 35 cards) keep the order of their keys. Two keys are drawn from every 64 bit random number and 32 bit keys sort in half the time of 64 bit keys.
+	'''
+
+	keys = rng.bit_generator.random_raw( ( count * len( low ) + 1 ) // 2 ).view( numpy.uint32 )[ :count * len( low ) ].reshape( count, len( low ) )
+
+	keys &= numpy.uint32( _RANDOM_BITS )
+	keys |= low
+
+	keys.sort( axis = 1 )		# The only pass along the short rows of the samples
+
+	keys &= numpy.uint32( _CARD_BITS )
+
+	masks = numpy.empty( ( len( low ) + 1, count ), dtype = numpy.uint64 )
+
+	masks[0] = 0
+
+	numpy.left_shift( numpy.uint64( 1 ), keys.T, out = masks[ 1: ] )
+
+	return masks
+
+
+
+def _runs( masks, bounds ) :
+
+	'''
+	Returns the masks of the runs of the shuffled cards 'masks' (see _shuffledCards()) of every sample after its first bounds[ ..., i, : ] cards and up to its first bounds[ ..., i + 1, : ] cards, and destroys 'masks'. 'bounds' is an array of shape (..., runs + 1, count) increasing along its next to last axis and the result an array of shape (..., runs, count).
+
+	Every card is a distinct bit so the OR of the first i cards of a sample only grows with i, and the cards of a run are the bits of the OR up to its end that are not in the OR up to its start. One prefix OR of every sample (the empty row is the OR of its first 0 cards) therefore gives every run with one lookup per bound and an XOR.
+	'''
+
+	if masks.shape[1] < 1000 :		# One call is faster for few samples
+
+		numpy.bitwise_or.accumulate( masks, axis = 0, out = masks )
+
+	else :		# numpy.bitwise_or.accumulate( axis = 0 ) would run along the samples one at a time
+
+		for row in range( 1, len( masks ) ) :
+
+			numpy.bitwise_or( masks[ row ], masks[ row - 1 ], out = masks[ row ] )
+
+	prefix = masks.ravel()[ bounds * masks.shape[1] + numpy.arange( masks.shape[1] ) ]
+
+	return prefix[ ..., 1:, : ] ^ prefix[ ..., :-1, : ]
+
+
+
+def _guide( weights ) :
+
+	'''
+	Returns the tables ( bounds, guide ) of the indexed search (Chen and Asau) of the discrete distributions with the (nonnegative) 'weights', one distribution per row of width w: 'bounds' holds their cumulative probabilities (with the last one exactly 1) row after row and guide[ w * row + i ] the first index into 'bounds' of the row whose bound is above i / w. A uniform number u in [ 0, 1 ) of the row then draws the first way from guide[ w * row + int( u * w ) ] on whose bound is above u, a step or two away on average. Rows of weight 0 draw their first way.
+	'''
+
+	rows, width = weights.shape
+
+	bounds = numpy.cumsum( weights, axis = 1 )
+
+	bounds /= numpy.where( bounds[ :, -1: ] > 0, bounds[ :, -1: ], 1.0 )		# The last bound is exactly 1 (0 for rows of weight 0)
+
+	offsets = 2.0 * numpy.arange( rows )[ :, None ]		# Lay the rows out one after the other in increasing order
+
+	guide = numpy.searchsorted( ( bounds + offsets ).ravel(), ( numpy.arange( width ) / width + offsets ).ravel(), side = 'right' )
+
+	return bounds.ravel(), numpy.minimum( guide, ( numpy.arange( rows ) * width + width - 1 ).repeat( width ) )		# Rows of weight 0 stop at their last way
+
+
+
+class HandSampler :
+
+	'''
+	Uniform sampler of the hands of the other players in the current round of 'game' as seen by 'player'.
+
+	Raises ValueError if no deal is consistent with what the player has seen (which cannot happen in a game played by the rules).
+
+	Example:
+
+	sampler = HandSampler( game, 2 )
+	sampler.numDeals		# The number of consistent deals
+	hands = sampler.sample( rng )		# A list like game.Hand
+	hands = sampler.sampleMany( 1000 )		# A (1000, numPlayers) array with NumPy
+	'''
+
+	def __init__( self, game, player ) :
+
+		self.numPlayers = game.numPlayers
+		self.player = player
+		self.hand = game.Hand[ player ]
+
+		others = [ seat for seat in range( game.numPlayers ) if seat != player ]
+
+		self.seats = [ seat for seat in others if game.Voids[ seat ] ] + [ seat for seat in others if not game.Voids[ seat ] ]		# The players whose hands are sampled, those known to be void in some suit first
+
+		self.numVoid = sum( 1 for seat in others if game.Voids[ seat ] )
+
+		self.needs = [ countOf( game.Hand[ seat ] ) for seat in self.seats ]		# The number of cards each of them holds
+
+		unseen = game.unseen( player )
+
+		self.unseen = cardsOf( unseen )
+
+
+		# Group the unseen cards by the players void in their suit:
+
+		groups = {}
+
+		for suit in range( NUM_SUITS ) :
+
+			void = tuple( seat for seat in self.seats if game.isVoid( seat, suit ) )
+
+			groups[ void ] = groups.get( void, 0 ) | ( unseen & SUIT_MASK[ suit ] )
+
+		self.cards = [ cardsOf( mask ) for mask in groups.values() ]		# The cards of each group
+
+		self.allowed = [ tuple( seat not in void for void in groups ) for seat in self.seats[ :self.numVoid ] ]		# Whether each void player can hold the cards of each group
+
+
+		self._choices = [ {} for seat in self.allowed ]		# For each void player, maps the numbers of cards left in the groups to ( the number of deals, the cumulative numbers of deals of the ways he can take his cards, those ways )
+
+		self._arrays = None		# The choices of every player as NumPy arrays (see _choiceArrays()), built by the first call to sampleMany()
+
+		self.numDeals = self._count( 0, tuple( len( cards ) for cards in self.cards ) )
+
+		if not self.numDeals :
+
+			raise ValueError( 'ERROR: No deal is consistent with the cards seen by player %d.' % player )
+
+
+	def _count( self, k, remaining ) :
+
+		'''
+		Returns the number of ways the players self.seats[ k: ] can take their cards from groups with 'remaining' cards left.
+		'''
+
+		if k == self.numVoid :		# The other players (and the pile) share what is left
+
+			left = sum( remaining )
+
+			tail = self.needs[ k: ]
+
+			if sum( tail ) > left :
+
+				return 0
+
+			count = _FACTORIAL[ left ] // _FACTORIAL[ left - sum( tail ) ]
+
+			for need in tail :
+
+				count //= _FACTORIAL[ need ]
+
+			return count
+
+		entry = self._choices[ k ].get( remaining )
+
+		if entry is None :
+
+			total = 0
+			cumulative = []
+			ways = []
+
+			for y in _splits( self.needs[ k ], self.allowed[ k ], remaining ) :
+
+				count = self._count( k + 1, tuple( left - take for left, take in zip( remaining, y ) ) )
+
+				for left, take in zip( remaining, y ) :
+
+					count *= _binomial( left, take )
+
+				if count :
+
+					total += count
+
+					cumulative.append( total )
+					ways.append( y )
+
+			entry = ( total, cumulative, ways )
+
+			self._choices[ k ][ remaining ] = entry
+
+		return entry[0]
+
+
+	def _choiceArrays( self ) :
+
+		'''
+		Returns, for each player of self.seats, the arrays sampleMany() draws the numbers of cards he takes from each group from, with one indexed search (see _guide()):
+
+		states: Maps the numbers of cards left in the groups, as the digits of one integer in the base of the sizes of the groups plus one, to the index of the state (-1 for the others). None if there is only one state and one way, which needs no draw.
+		bounds: The cumulative probabilities of the ways he can take his cards in each state, padded with 1 to the same number of ways and laid out one state after the other.
+		guide: For each state, the first way whose bound passes each of 'width' equal steps of probability, as an index into 'bounds'.
+		ways: The numbers of cards those ways take from each group, an array of shape (groups, states * width).
+		steps: The codes of those ways, subtracted from the code of the state to get the next one.
+		width: The number of ways of each state.
+
+		The first call also sets the bits of the sort keys of the cards that are not random (self._keys, see _shuffledCards()), the code of the first state (self._start) and the number of cards before each group (self._firsts).
+
+		The ways of the void players are those counted by _count(). The other players can take any card, so a player who needs n cards takes y_1, ..., y_g cards from groups of r_1, ..., r_g cards in C( r_1, y_1 ) * ... * C( r_g, y_g ) of the C( r_1 + ... + r_g, n ) ways (whatever he takes, the players after him share the same number of cards). Their tables are built for every state a sample can reach at once.
+		'''
+
+		if self._arrays is None :
+
+			sizes = [ len( cards ) for cards in self.cards ]
+
+			radix = numpy.cumprod( [ 1 ] + [ size + 1 for size in sizes ] )
+
+			self._keys = numpy.array( [ g << _GROUP_SHIFT | card for g, cards in enumerate( self.cards ) for card in cards ], dtype = numpy.uint32 )		# The bits of the sort keys of the cards that are not random (see _shuffledCards())
+			self._start = sizes @ radix[ :-1 ]		# The code of the first state
+			self._firsts = numpy.cumsum( [ 0 ] + sizes[ :-1 ] )[ :, None ]		# The number of cards before each group
+
+			self._arrays = []
+
+			states = numpy.array( [ sizes ] )
+
+			for k in range( len( self.seats ) ) :
+
+				if k < self.numVoid :
+
+					states = numpy.array( sorted( self._choices[ k ] ), dtype = numpy.int64 ).reshape( -1, len( sizes ) )		# Every state _count() reached
+
+					entries = [ self._choices[ k ][ tuple( remaining ) ] for remaining in states.tolist() ]
+
+					width = max( len( entry[2] ) for entry in entries )
+
+					weights = numpy.zeros( ( len( states ), width ) )
+					ways = numpy.zeros( ( len( states ), width, len( sizes ) ), dtype = numpy.int64 )
+
+					for index, ( total, cumulative, split ) in enumerate( entries ) :
+
+						if not total :		# A dead end, which no sample reaches
+
+							continue
+
+						weights[ index, :len( split ) ] = [ count - previous for count, previous in zip( cumulative, [ 0 ] + cumulative[ :-1 ] ) ]
+						ways[ index, :len( split ) ] = split
+
+				else :
+
+					split = numpy.array( list( _splits( self.needs[ k ], ( True, ) * len( sizes ), sizes ) ), dtype = numpy.int64 ).reshape( -1, len( sizes ) )
+
+					weights = numpy.prod( _BINOMIALS[ states[ :, None, : ], split[ None, :, : ] ], axis = 2 )
+					ways = numpy.broadcast_to( split, ( len( states ), ) + split.shape )
+
+					width = len( split )
+
+				ways = ways.reshape( -1, len( sizes ) )
+
+				codes = numpy.full( radix[ -1 ], -1, dtype = numpy.int64 )
+
+				codes[ states @ radix[ :-1 ] ] = numpy.arange( len( states ) )
+
+				bounds, guide = _guide( weights )
+
+				self._arrays.append( ( codes if len( ways ) > 1 else None, bounds, guide, numpy.ascontiguousarray( ways.T ), ways @ radix[ :-1 ], width ) )
+
+				states = numpy.unique( ( states[ :, None, : ] - ways.reshape( len( states ), width, -1 ) )[ weights > 0 ], axis = 0 )		# The states the next player can find
+
+		return self._arrays
+
+
+	def sample( self, rng = random ) :
+
+		'''
+		Returns one deal drawn with the random.Random object 'rng': the list of the masks of the hands of all the players (like Blackout.Hand) including that of self.player.
+		'''
+
+		hands = [ 0 ] * self.numPlayers
+
+		hands[ self.player ] = self.hand
+
+		pool = self.unseen
+
+		if self.numVoid :
+
+			groups = [ list( cards ) for cards in self.cards ]
+
+			remaining = tuple( len( cards ) for cards in self.cards )
+
+			for k in range( self.numVoid ) :
+
+				total, cumulative, ways = self._choices[ k ][ remaining ]
+
+				y = ways[ bisect_right( cumulative, rng.randrange( total ) ) ]
+
+				for g, take in enumerate( y ) :
+
+					cards = groups[ g ]
+
+					for ii in range( len( cards ) - remaining[ g ], len( cards ) - remaining[ g ] + take ) :		# Draw the cards one at a time, moving them to the front of the group (partial Fisher-Yates shuffle)
+
+						jj = rng.randrange( ii, len( cards ) )
+
+						cards[ ii ], cards[ jj ] = cards[ jj ], cards[ ii ]
+
+						hands[ self.seats[ k ] ] |= 1 << cards[ ii ]
+
+				remaining = tuple( left - take for left, take in zip( remaining, y ) )
+
+			pool = [ card for g, cards in enumerate( groups ) for card in cards[ len( cards ) - remaining[ g ]: ] ]
+
+
+		chosen = rng.sample( pool, sum( self.needs[ self.numVoid: ] ) )
+
+		start = 0
+
+		for k in range( self.numVoid, len( self.seats ) ) :
+
+			hands[ self.seats[ k ] ] = maskOf( chosen[ start : start + self.needs[ k ] ] )
+
+			start += self.needs[ k ]
+
+		return hands
+
+
+	def sampleMany( self, count, seed = None ) :
+
+		'''
+		Returns 'count' deals (see sample()).
+
+		seed: An integer seed or a generator (numpy.random.Generator, or random.Random if NumPy is not installed). The same seed always produces the same deals.
+
+		With NumPy the deals are an array of shape (count, numPlayers) of type uint64, otherwise a list of lists. The NumPy deals are drawn with floating point probabilities and 24 bit random sort keys (see _shuffledCards()), so they are uniform up to rounding.
+
+		The NumPy path shuffles every group of cards with one sort, draws the numbers of cards every player takes from each group and deals him runs of the shuffled groups, _BLOCK deals at a time so that the arrays stay in the cache. It draws about 2000 deals per ms (about 0.5 us per deal, see benchmarks.py) in the middle of a 5 player round with two void players, and about half as many with four groups of cards. Without NumPy a deal takes about as long as sample(), tens of us.
+		'''
+
+		if numpy is None :		# Fall back to sampling one deal at a time
+
+			rng = seed if isinstance( seed, random.Random ) else random.Random( seed )
+
+			return [ self.sample( rng ) for ii in range( count ) ]
+
+
+		rng = numpy.random.default_rng( seed )
+
+		hands = numpy.zeros( ( count, self.numPlayers ), dtype = numpy.uint64 )
+
+		hands[ :, self.player ] = self.hand
+
+		self._choiceArrays()		# Built by the first call
+
+		for start in range( 0, count, _BLOCK ) :
+
+			self._sampleBlock( rng, hands[ start : start + _BLOCK ] )
+
+		return hands
+
+
+	def _sampleBlock( self, rng, hands ) :
+
+		'''
+		Fills the hands of the other players in the deals 'hands' (a slice of the array built by sampleMany()) with NumPy.
+		'''
+
+		count = len( hands )
+
+
+		# Shuffle every group of every sample with one sort:
+
+		masks = _shuffledCards( rng, count, self._keys )
+
+
+		# Draw the numbers of cards every player takes from each group, player after player. The arrays of numbers below have one column per sample: NumPy is much faster along rows of 'count' numbers than along 'count' short rows.
+
+		taken = numpy.zeros( ( len( self.seats ), len( self.cards ), count ), dtype = numpy.int64 )
+
+		code = numpy.full( count, self._start )		# The numbers of cards left in the groups (see _choiceArrays())
+
+		for k, ( states, bounds, guide, ways, steps, width ) in enumerate( self._arrays ) :
+
+			if states is None :		# Always the same numbers
+
+				taken[ k ] = ways
+				code -= steps[0]
+
+				continue
+
+			draw = rng.random( count )
+
+			choice = guide[ states[ code ] * width + ( draw * width ).astype( numpy.int64 ) ]
+
+			behind = numpy.flatnonzero( draw >= bounds[ choice ] )		# The samples whose way is further on
+
+			while len( behind ) :
+
+				choice[ behind ] += 1
+
+				behind = behind[ draw[ behind ] >= bounds[ choice[ behind ] ] ]
+
+			taken[ k ] = ways[ :, choice ]
+
+			code -= steps[ choice ]
+
+
+		# Every player takes a run of each shuffled group, after the runs of the players before him:
+
+		edges = numpy.empty( ( len( self.cards ), len( self.seats ) + 1, count ), dtype = numpy.int64 )		# The numbers of cards before the run of each player in each group, and after the last one
+
+		edges[ :, 0 ] = self._firsts		# The cards before each group
+
+		for k in range( len( self.seats ) ) :		# numpy.cumsum( axis = 1 ) would run along the samples one at a time
+
+			numpy.add( edges[ :, k ], taken[ k ], out = edges[ :, k + 1 ] )
+
+		hands[ :, self.seats ] = numpy.bitwise_or.reduce( _runs( masks, edges ), axis = 0 ).T
+
+
+
+def sampleDeals( game, player, count, seed = None ) :
+
+	'''
+	Returns 'count' deals of the hidden hands of the current round of 'game' as seen by 'player' (see HandSampler.sampleMany()).
+	'''
+
+	return HandSampler( game, player ).sampleMany( count, seed )
@@ -0,0 +1,931 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements an asyncio game server which hosts Blackout tables and pushes the changes to the players and spectators by long polling.
+#
+# Every change to a table (a bid, a card played, a trick won, a new round dealt) is recorded as a small delta carrying the new version of the game (Blackout.version). A client asks for the deltas since the last version it has seen and, if there are none yet, its request is parked until the next change (or a timeout) instead of the client polling the whole state. A parked request is only a suspended coroutine waiting on a future shared by the whole table, so a single process can hold a very large number of idle connections. When a table changes the waiters are woken once per event loop iteration (so a trick completed by a card is sent together with the card) and the response is encoded once for all the waiters that had seen the same version.
+#
+# Tables can have turn clocks: a player who takes longer than 'turnTimeout' seconds to bid or play has a bid or card chosen for him by the auto-bid and auto-play policies (see simulate.py). The deadlines of all the tables are kept in a single timer wheel (see timerwheel.py) driven by one scheduler task.
+#
+# A table is removed 'finishedTimeout' seconds after its game is over and, if it is abandoned, 'idleTimeout' seconds after its last change, so that a long-running server does not keep every table it ever hosted.
+#
+# The changes are pushed by long polling rather than over WebSockets: a parked HTTP request needs nothing but the standard library on the server and passes through any proxy, and one request per change costs little next to the think time of the players.
+#
+# Django 1.3 runs on WSGI and cannot hold connections open, so the server runs as its own process next to the Django project. The front end web server routes the /tables/ URLs to it (see the deployment section of README.md); the Django development server forwards them to it (see views.tables in the project).
+#
+# Usage (from the terminal):
+#
+# python server.py --port 8001
+#
+# The HTTP API (all responses are JSON):
+#
+# POST /tables/<id>?players=<n>&maxTricks=<m>		Creates a table and deals the first round. 409 Conflict if the table exists.
+# POST /tables/<id>/join?player=<p>		Takes seat p. Returns { "token": ... }, the secret the player must send with every request made for the seat. 409 Conflict if the seat is taken.
+# GET /tables/<id>?player=<p>&token=<t>		The full state of the table (with the hand of player p if given). The ETag is the version of the game prefixed by a nonce drawn when the table is created, so that a table recreated under the same id (whose versions start again at 1) never matches the ETag of the table it replaced. A client sending the ETag of its copy in If-None-Match gets 304 Not Modified if it is current. The response is sent with Cache-Control: no-cache, so that caches revalidate it every time.
+# GET /tables/<id>/changes?since=<version>&player=<p>&token=<t>		Only the fields of the state that changed since 'version': { "version": ..., "since": ..., "changes": { ... } }, or { "version": ..., "reset": true } if the state at 'version' is no longer kept (the client must then get the full state).
+# GET /tables/<id>/updates?since=<version>		The deltas since 'version', waiting for the next change if there are none.
+# POST /tables/<id>/bid?player=<p>&token=<t>&bid=<b>		Bids. Returns { "ok": true/false }.
+# POST /tables/<id>/move?player=<p>&token=<t>&card=<c>		Plays the card with integer identity c. Returns { "ok": true/false }.
+# GET /metrics		The instrumentation of the kernel in this process (see instrument.py and --instrument) in the Prometheus text format.
+#
+# Missing or out of range arguments (players, maxTricks, player) get 400 Bad Request, and a request for a seat without its token 403 Forbidden. Spectators leave out the player and only see the public state.
+
+
+import asyncio
+import hmac
+import json
+import logging
+import random
+import secrets
+import time
+
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+from blackout import *		# Access the Blackout class
+import instrument		# The optional instrumentation of the kernel, served at /metrics
+from simulate import trumpBid, greedyPlay		# The default auto-bid and auto-play policies
+from timerwheel import TimerWheel
+
+
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = NUM_CARDS - 1		# Every player must be dealt a card and one is turned up for the trump
+
+_EVICT_EVERY = 60.0		# Seconds between two sweeps for finished and idle tables (see GameServer.evictTables())
+
+_log = logging.getLogger( 'blackout.server' )
+
+
+
+class Table :
+
+	'''
+	A table hosting one game and the deltas of its recent changes.
+
+	history: <INT> Number of versions whose deltas and changed fields are kept. Clients further behind must reload the whole state.
+	'''
+
+	def __init__( self, game, history = 256 ) :
+
+		self.game = game
+		self.history = history
+
+		self.deltas = []		# The most recent deltas, in order of version
+
+		self.changedAt = None		# The time of the last change, by the clock of the server
+
+		self.tokens = [ None ] * game.numPlayers		# The secret token of each seat taken (see GameServer.join())
+
+		self.nonce = secrets.token_hex( 4 )		# Tells this table apart from earlier tables with the same id in the ETags
+
+		self._state = _fullState( game )		# The full state of the table at the current version, kept up to date by changed()
+		self._changes = OrderedDict()		# Maps recent versions to the fields of the full state changed at them (the hands as a dictionary mapping the players to their new hands)
+
+		self._waiter = None		# Future shared by the requests waiting for the next change
+		self._scheduled = False		# Whether the waiters will be woken at the next iteration of the loop
+		self._encoded = {}		# Maps versions to the encoded responses with the deltas since them (see updates())
+
+
+	def changed( self, delta ) :
+
+		'''
+		Records the dictionary 'delta' as the next change to the table and schedules waking the waiters. Only the fields of the full state that a change of this type can touch are read from the game (see _AFFECTED) and the ones whose values differ are recorded as the changes at the new version, so that a client which has only followed the deltas can ask for the fields changed since any recent version (see changes()).
+		'''
+
+		delta[ 'version' ] = self.version
+
+		self.deltas.append( delta )
+
+		if len( self.deltas ) > self.history :
+
+			del self.deltas[ : len( self.deltas ) - self.history ]
+
+		state = self._state
+		changes = { 'version': self.version }
+
+		for field in _AFFECTED.get( delta[ 'type' ], _FIELDS ) :
+
+			value = _FIELDS[ field ]( self.game )
+
+			if field == 'hands' :
+
+				hands = dict( ( player, hand ) for player, hand in enumerate( value ) if hand != state[ 'hands' ][ player ] )
+
+				if hands :
+
+					changes[ 'hands' ] = hands
+
+			elif value != state[ field ] :
+
+				changes[ field ] = value
+
+		state = dict( state )		# A new dictionary: the states already handed out stay as they were
+
+		for field, value in changes.items() :
+
+			state[ field ] = value if field != 'hands' else [ value.get( player, hand ) for player, hand in enumerate( state[ 'hands' ] ) ]
+
+		self._state = state
+
+		self._changes[ self.version ] = changes
+
+		while len( self._changes ) > self.history :
+
+			self._changes.popitem( last = False )
+
+		self._encoded = {}
+
+		if self._waiter is not None and not self._scheduled :
+
+			self._scheduled = True
+
+			self._waiter.get_loop().call_soon( self._wake )		# Batch all the changes made in this iteration of the loop
+
+
+	@property
+	def version( self ) :
+
+		return self.game.version
+
+
+	@property
+	def etag( self ) :
+
+		'''
+		The entity tag (without the quotes) of the full state at the current version.
+		'''
+
+		return '%s-%d' % ( self.nonce, self.version )
+
+
+	def state( self ) :
+
+		'''
+		Returns the full state of the table (including every hand) at the current version as a dictionary. It is kept up to date by changed() and must not be modified.
+		'''
+
+		return self._state
+
+
+	def changes( self, since, player = None ) :
+
+		'''
+		Returns the fields of the full state (as seen by 'player', see _view()) changed since version 'since', merged from the changes recorded at every later version (a field which changed and changed back is included, with its current value). Returns None if the changes since 'since' are no longer kept.
+		'''
+
+		if since not in self._changes :
+
+			return None
+
+		merged = {}
+
+		for version in reversed( self._changes ) :
+
+			if version == since :
+
+				break
+
+			changes = self._changes[ version ]
+
+			for field, value in changes.items() :
+
+				if field == 'hands' :
+
+					if player in value and 'hand' not in merged :
+
+						merged[ 'hand' ] = value[ player ]
+
+				elif field not in merged :		# The latest value of the field
+
+					merged[ field ] = value
+
+		return merged
+
+
+	def _wake( self ) :
+
+		self._scheduled = False
+
+		waiter, self._waiter = self._waiter, None
+
+		if waiter is not None and not waiter.done() :
+
+			waiter.set_result( self.version )
+
+
+	async def wait( self, since, timeout ) :
+
+		'''
+		Waits (at most 'timeout' seconds) until the version of the table is past 'since'.
+		'''
+
+		if self.version > since :
+
+			return
+
+		if self._waiter is None :
+
+			self._waiter = asyncio.get_running_loop().create_future()
+
+		try :
+
+			await asyncio.wait_for( asyncio.shield( self._waiter ), timeout )
+
+		except asyncio.TimeoutError :
+
+			pass
+
+
+	def updates( self, since ) :
+
+		'''
+		Returns the encoded response with the deltas since version 'since': { "version": ..., "deltas": [ ... ] }, or { "version": ..., "reset": true } if they are no longer kept.
+		'''
+
+		encoded = self._encoded.get( since )
+
+		if encoded is None :
+
+			first = self.version - len( self.deltas )		# The version before the oldest delta kept
+
+			if since < first :
+
+				response = { 'version': self.version, 'reset': True }
+
+			else :
+
+				response = { 'version': self.version, 'deltas': self.deltas[ since - first : ] }
+
+			encoded = json.dumps( response ).encode( 'utf-8' )
+
+			self._encoded[ since ] = encoded
+
+		return encoded
+
+
+
+class GameServer :
+
+	'''
+	Hosts Blackout tables and serves them over HTTP (see the module description for the API).
+
+	Example:
+
+	server = await GameServer().serve( '127.0.0.1', 8001 )
+	await server.serve_forever()
+	'''
+
+	def __init__( self, timeout = 30.0, turnTimeout = None, autoBid = trumpBid, autoPlay = greedyPlay, clock = time.monotonic, idleTimeout = 3600.0, finishedTimeout = 300.0 ) :
+
+		self.timeout = timeout		# Maximum number of seconds an update request is parked
+
+		self.tables = {}
+
+		self.idleTimeout = idleTimeout		# Number of seconds after which a table that has not changed is removed (None to keep it)
+		self.finishedTimeout = finishedTimeout		# Number of seconds after which a table whose game is over is removed (None to keep it)
+
+
+		# Turn clocks:
+
+		self.turnTimeout = turnTimeout		# Number of seconds a player has to bid or play (None for no limit)
+		self.autoBid = autoBid		# Policies ( game, player, rng ) used when a player runs out of time
+		self.autoPlay = autoPlay
+		self.clock = clock
+
+		self.wheel = TimerWheel( now = clock() )		# The deadline of the player to act at every table
+		self.rng = random.Random()
+
+		self._clocks = None		# The scheduler task
+		self._evictions = None		# The task sweeping for finished and idle tables
+
+
+	def createTable( self, tableId, numPlayers, maxTricks = 7 ) :
+
+		if not MIN_PLAYERS <= numPlayers <= MAX_PLAYERS :
+
+			raise ValueError( 'ERROR: The number of players must be between %d and %d.' % ( MIN_PLAYERS, MAX_PLAYERS ) )
+
+		if not 0 < maxTricks < 14 :
+
+			raise ValueError( 'ERROR: maxTricks must be an integer between 1 and 13.' )
+
+		table = Table( Blackout( numPlayers, maxTricks, validation = TRUSTED ) )		# bid() and move() check the turn order themselves
+
+		table.game.Deal()
+
+		table.changed( _dealDelta( table.game ) )
+
+		table.changedAt = self.clock()
+
+		self.tables[ tableId ] = table
+
+		self._startClock( tableId )
+
+		return table
+
+
+	def removeTable( self, tableId ) :
+
+		'''
+		Removes a table. The requests waiting for its next change are answered right away.
+		'''
+
+		table = self.tables.pop( tableId )
+
+		self.wheel.cancel( tableId )
+
+		table._wake()
+
+
+	def evictTables( self ) :
+
+		'''
+		Removes the tables whose game has been over for more than finishedTimeout seconds and those that have not changed for more than idleTimeout seconds. Called every _EVICT_EVERY seconds by a task of serve(). Returns the number of tables removed.
+		'''
+
+		now = self.clock()
+
+		evicted = []
+
+		for tableId, table in self.tables.items() :
+
+			timeout = self.finishedTimeout if table.game.isOver() else self.idleTimeout
+
+			if timeout is not None and now - table.changedAt > timeout :
+
+				evicted.append( tableId )
+
+		for tableId in evicted :
+
+			self.removeTable( tableId )
+
+		return len( evicted )
+
+
+	def _startClock( self, tableId ) :
+
+		'''
+		(Re)starts the turn clock of a table for the player whose turn it now is.
+		'''
+
+		if self.turnTimeout is None :
+
+			return
+
+		if self.tables[ tableId ].game.isOver() :
+
+			self.wheel.cancel( tableId )
+
+		else :
+
+			self.wheel.schedule( tableId, self.clock() + self.turnTimeout )
+
+
+	def expireTurns( self ) :
+
+		'''
+		Bids or plays for the players who have run out of time. Called every tick of the wheel by the scheduler task (see serve()). Returns the number of tables acted at.
+
+		A table at which the policy fails (raises or picks an illegal bid or card) is logged and its clock restarted, so that it is tried again after another turnTimeout instead of stalling and the other tables are still served.
+		'''
+
+		expired = self.wheel.expire( self.clock() )
+
+		for tableId in expired :
+
+			table = self.tables.get( tableId )
+
+			if table is None or table.game.isOver() :
+
+				continue
+
+			game = table.game
+
+			try :
+
+				if game.Bids[ game._base() + game.Bidder ] == -1 :		# Bidding
+
+					acted = self.bid( tableId, game.Bidder, self.autoBid( game, game.Bidder, self.rng ) )
+
+				else :
+
+					acted = self.move( tableId, game.Current, self.autoPlay( game, game.Current, self.rng ) )
+
+				if not acted :
+
+					_log.error( 'The auto-play policy picked an illegal bid or card at table %s.', tableId )
+
+			except Exception :
+
+				_log.exception( 'The auto-play policy failed at table %s.', tableId )
+
+				acted = False
+
+			if not acted :
+
+				self._startClock( tableId )		# bid() and move() only restart the clock when they succeed
+
+		return len( expired )
+
+
+	async def _runClocks( self ) :
+
+		while True :
+
+			await asyncio.sleep( self.wheel.tick )
+
+			self.expireTurns()
+
+
+	async def _runEvictions( self ) :
+
+		while True :
+
+			await asyncio.sleep( _EVICT_EVERY )
+
+			self.evictTables()
+
+
+	def join( self, tableId, player ) :
+
+		'''
+		Seats 'player' at a table and returns the token that the requests made for the seat must carry, or None if the seat is already taken.
+		'''
+
+		table = self.tables[ tableId ]
+
+		if table.tokens[ player ] is not None :
+
+			return None
+
+		table.tokens[ player ] = secrets.token_hex( 16 )
+
+		return table.tokens[ player ]
+
+
+	def bid( self, tableId, player, bid ) :
+
+		table = self.tables[ tableId ]
+		game = table.game
+
+		if game.isOver() or player != game.Bidder or game.Bids[ game._base() + player ] != -1 or not game.Bid( player, bid ) :		# Out of turn, already bid or illegal
+
+			return False
+
+		table.changed( { 'type': 'bid', 'player': player, 'bid': bid } )
+
+		table.changedAt = self.clock()
+
+		self._startClock( tableId )
+
+		return True
+
+
+	def move( self, tableId, player, card ) :
+
+		'''
+		Plays a card. Completed tricks are evaluated and completed rounds scored and the next round dealt right away, each as its own delta.
+		'''
+
+		table = self.tables[ tableId ]
+		game = table.game
+
+		if game.isOver() or player != game.Current or game.Bids[ game._base() + game.Bidder ] == -1 or not game.Move( player, card ) :		# Every player must have bid first
+
+			return False
+
+		table.changed( { 'type': 'move', 'player': player, 'card': card } )
+
+		if game.Current == game.Leader :		# The trick is complete
+
+			table.changed( { 'type': 'trick', 'winner': game.evalTrick() } )
+
+			if not game.Hand[ game.Leader ] :		# The round is complete
+
+				game.postRound()
+
+				table.changed( { 'type': 'round', 'scores': game.scores() } )
+
+				if not game.isOver() :
+
+					game.Deal()
+
+					table.changed( _dealDelta( game ) )
+
+		table.changedAt = self.clock()
+
+		self._startClock( tableId )
+
+		return True
+
+
+	def state( self, tableId, player = None ) :
+
+		'''
+		Returns the state of a table as seen by 'player' (or a spectator if None) as a dictionary. The hand of 'player' is only included if given.
+		'''
+
+		return _view( self.tables[ tableId ].state(), player )
+
+
+	def conditionalState( self, tableId, player = None, known = None ) :
+
+		'''
+		Answers a request for the state of a table by a client which has the state with the entity tag 'known' (see Table.etag, None if it has none). Returns a tuple ( status, body ): 304 Not Modified with an empty body if 'known' is the tag of the current version and the full state otherwise. The fields that changed are served by changes() on their own resource, so that the same URL and ETag always stand for the full state.
+		'''
+
+		table = self.tables[ tableId ]
+
+		if known == table.etag :
+
+			return b'304 Not Modified', b''
+
+		return b'200 OK', json.dumps( _view( table.state(), player ) ).encode( 'utf-8' )
+
+
+	def changes( self, tableId, since, player = None ) :
+
+		'''
+		Returns the encoded fields of the state of a table (as seen by 'player') that changed since version 'since': { "version": ..., "since": ..., "changes": { ... } }, or { "version": ..., "reset": true } if the changes since 'since' are no longer kept. The fields are merged from the changes the table recorded at every version (see Table.changed()), so no past state is rebuilt.
+		'''
+
+		table = self.tables[ tableId ]
+
+		changes = table.changes( since, player )
+
+		if changes is None :
+
+			return json.dumps( { 'version': table.version, 'reset': True } ).encode( 'utf-8' )
+
+		return json.dumps( { 'version': table.version, 'since': since, 'changes': changes } ).encode( 'utf-8' )
+
+
+	async def updates( self, tableId, since, timeout = None ) :
+
+		'''
+		Returns the encoded deltas of a table since version 'since', waiting for the next change if there are none yet.
+		'''
+
+		table = self.tables[ tableId ]
+
+		await table.wait( since, self.timeout if timeout is None else timeout )
+
+		return table.updates( since )
+
+
+	async def serve( self, host, port ) :
+
+		'''
+		Starts serving on 'host' and 'port' (and the scheduler task of the turn clocks if there are any and the task removing finished and idle tables). Returns the asyncio server.
+		'''
+
+		if self.turnTimeout is not None :
+
+			self._clocks = asyncio.ensure_future( self._runClocks() )
+
+		if self.idleTimeout is not None or self.finishedTimeout is not None :
+
+			self._evictions = asyncio.ensure_future( self._runEvictions() )
+
+		return await asyncio.start_server( self.handle, host, port )
+
+
+	async def handle( self, reader, writer ) :
+
+		'''
+		Serves the HTTP/1.1 requests of one connection (kept alive between requests).
+		'''
+
+		try :
+
+			while True :
+
+				line = await reader.readline()
+
+				if not line :
+
+					break
+
+				method, target = line.decode( 'latin-1' ).split()[ :2 ]
+
+				length = 0
+				close = False
+				known = None
+
+				while True :		# The headers
+
+					header = await reader.readline()
+
+					if header in ( b'\r\n', b'\n', b'' ) :
+
+						break
+
+					name, value = header.decode( 'latin-1' ).split( ':', 1 )
+
+					if name.strip().lower() == 'content-length' :
+
+						length = int( value )
+
+					elif name.strip().lower() == 'connection' and value.strip().lower() == 'close' :
+
+						close = True
+
+					elif name.strip().lower() == 'if-none-match' :
+
+						known = _entityTag( value )
+
+				if length :
+
+					await reader.readexactly( length )		# The API takes its arguments in the query string
+
+				status, body, headers = await self._route( method, target, known )
+
+				headers.setdefault( 'Content-Type', 'application/json' )
+				headers[ 'Content-Length' ] = str( len( body ) )
+
+				writer.write( b'HTTP/1.1 ' + status + b''.join( ( '\r\n%s: %s' % item ).encode( 'latin-1' ) for item in headers.items() ) + b'\r\n\r\n' + body )
+
+				await writer.drain()
+
+				if close :
+
+					break
+
+		except ( ConnectionError, asyncio.IncompleteReadError, ValueError ) :
+
+			pass
+
+		finally :
+
+			writer.close()
+
+
+	async def _route( self, method, target, known = None ) :
+
+		'''
+		Returns the status, body and headers (a dictionary of the headers other than Content-Length, by default Content-Type: application/json) of the response to a request. 'known' is the entity tag in the If-None-Match header of the request, if any.
+		'''
+
+		parts = urlsplit( target )
+
+		path = parts.path.strip( '/' ).split( '/' )
+		query = dict( ( key, values[0] ) for key, values in parse_qs( parts.query ).items() )
+
+		if method == 'GET' and path == [ 'metrics' ] :
+
+			return b'200 OK', instrument.prometheusText().encode( 'utf-8' ), { 'Content-Type': 'text/plain; version=0.0.4' }
+
+		if len( path ) < 2 or path[0] != 'tables' :
+
+			return b'404 Not Found', b'{}', {}
+
+		tableId = path[1]
+		action = path[2] if len( path ) > 2 else None
+
+		try :
+
+			if method == 'POST' and action is None :
+
+				if tableId in self.tables :
+
+					return b'409 Conflict', b'{}', {}
+
+				table = self.createTable( tableId, int( query[ 'players' ] ), int( query.get( 'maxTricks', 7 ) ) )
+
+				return b'200 OK', json.dumps( { 'version': table.version } ).encode( 'utf-8' ), {}
+
+			if tableId not in self.tables :
+
+				return b'404 Not Found', b'{}', {}
+
+			if method == 'POST' and action == 'join' :
+
+				token = self.join( tableId, self._player( tableId, query ) )
+
+				if token is None :
+
+					return b'409 Conflict', b'{}', {}
+
+				return b'200 OK', json.dumps( { 'token': token } ).encode( 'utf-8' ), {}
+
+			if method == 'GET' and action is None :
+
+				player = self._seat( tableId, query ) if 'player' in query else None
+
+				status, body = self.conditionalState( tableId, player, known )
+
+				return status, body, { 'ETag': '"%s"' % self.tables[ tableId ].etag, 'Cache-Control': 'no-cache', 'Vary': 'If-None-Match' }		# A 304 always means that the full copy of the client is current
+
+			if method == 'GET' and action == 'changes' :
+
+				player = self._seat( tableId, query ) if 'player' in query else None
+
+				return b'200 OK', self.changes( tableId, int( query[ 'since' ] ), player ), { 'Cache-Control': 'no-cache' }
+
+			if method == 'GET' and action == 'updates' :
+
+				return b'200 OK', await self.updates( tableId, int( query.get( 'since', 0 ) ) ), {}
+
+			if method == 'POST' and action == 'bid' :
+
+				ok = self.bid( tableId, self._seat( tableId, query ), int( query[ 'bid' ] ) )
+
+				return b'200 OK', json.dumps( { 'ok': ok } ).encode( 'utf-8' ), {}
+
+			if method == 'POST' and action == 'move' :
+
+				ok = self.move( tableId, self._seat( tableId, query ), int( query[ 'card' ] ) )
+
+				return b'200 OK', json.dumps( { 'ok': ok } ).encode( 'utf-8' ), {}
+
+		except PermissionError :
+
+			return b'403 Forbidden', b'{}', {}
+
+		except ( KeyError, ValueError, IndexError, AssertionError ) :
+
+			return b'400 Bad Request', b'{}', {}
+
+		return b'404 Not Found', b'{}', {}
+
+
+	def _player( self, tableId, query ) :
+
+		'''
+		Returns the 'player' argument of a request on a table. Raises KeyError if it is missing and ValueError if it is not a seat of the table.
+		'''
+
+		player = int( query[ 'player' ] )
+
+		if not 0 <= player < self.tables[ tableId ].game.numPlayers :
+
+			raise ValueError( 'ERROR: Illegal player %d.' % player )
+
+		return player
+
+
+	def _seat( self, tableId, query ) :
+
+		'''
+		Returns the 'player' argument of a request made for a seat, as _player() does, after checking its 'token' argument. Raises PermissionError if the token is missing or is not the one issued to the seat by join().
+		'''
+
+		player = self._player( tableId, query )
+
+		issued = self.tables[ tableId ].tokens[ player ]
+
+		if issued is None or not hmac.compare_digest( issued.encode( 'utf-8' ), query.get( 'token', '' ).encode( 'utf-8' ) ) :
+
+			raise PermissionError( 'ERROR: The token of seat %d is missing or wrong.' % player )
+
+		return player
+
+
+
+def _view( state, player ) :
+
+	'''
+	Returns the full state 'state' of a table (see Table.state()) as seen by 'player' (None for a spectator).
+	'''
+
+	view = dict( state )
+
+	hands = view.pop( 'hands' )
+
+	if player is not None :
+
+		view[ 'hand' ] = hands[ player ]
+
+	return view
+
+
+
+def _entityTag( value ) :
+
+	'''
+	Returns the (first) entity tag of an If-None-Match header, without its quotes.
+	'''
+
+	tag = value.split( ',' )[0].strip()
+
+	if tag.startswith( 'W/' ) :
+
+		tag = tag[ 2: ]
+
+	return tag.strip( '"' )
+
+
+
+def _dealDelta( game ) :
+
+	'''
+	Returns the public information about the round being played: the delta sent when a round is dealt.
+	'''
+
+	return { 'type': 'deal', 'round': game.Round, 'numTricks': game.numTricks, 'dealer': game.Dealer, 'trumpCard': None if game.TrumpCard is None else game.TrumpCard.index }
+
+
+
+def _bids( game ) :
+
+	base = game._base()
+
+	return list( game.Bids[ base : base + game.numPlayers ] ) if not game.isOver() else []
+
+
+
+def _tricks( game ) :
+
+	base = game._base()
+
+	return list( game.Tricks[ base : base + game.numPlayers ] ) if not game.isOver() else []
+
+
+
+# The fields of the full state of a table, each mapped to the function reading it from the game:
+
+_FIELDS = OrderedDict( [
+		( 'round', lambda game : game.Round ),
+		( 'numTricks', lambda game : game.numTricks ),
+		( 'dealer', lambda game : game.Dealer ),
+		( 'trumpCard', lambda game : None if game.TrumpCard is None else game.TrumpCard.index ),
+		( 'numPlayers', lambda game : game.numPlayers ),
+		( 'bidder', lambda game : game.Bidder ),
+		( 'current', lambda game : game.Current ),
+		( 'leader', lambda game : game.Leader ),
+		( 'bids', _bids ),
+		( 'tricks', _tricks ),
+		( 'currentTrick', lambda game : list( game.currentTrick ) ),
+		( 'played', lambda game : cardsOf( game.Played ) ),		# The cards played this round
+		( 'voids', lambda game : [ [ suit for suit in range( NUM_SUITS ) if game.isVoid( player, suit ) ] for player in range( game.numPlayers ) ] ),		# The suits each player has shown he is out of
+		( 'scores', lambda game : game.scores() ),
+		( 'over', lambda game : game.isOver() ),
+		( 'hands', lambda game : [ game.hand( player ) for player in range( game.numPlayers ) ] ),
+	] )
+
+
+# The fields each type of delta can change (the others change every field):
+
+_AFFECTED = {
+		'bid': ( 'bidder', 'current', 'leader', 'bids' ),
+		'move': ( 'current', 'currentTrick', 'played', 'voids', 'hands' ),
+		'trick': ( 'current', 'leader', 'tricks', 'currentTrick' ),
+	}
+
+
+
+def _fullState( game ) :
+
+	'''
+	Returns the full state of a table (including every hand) hosting 'game', read from scratch (see Table.changed() for the state kept up to date).
+	'''
+
+	state = dict( ( field, read( game ) ) for field, read in _FIELDS.items() )
+
+	state[ 'version' ] = game.version
+
+	return state
+
+
+
+if __name__ == '__main__' :
+
+	import argparse
+
+	parser = argparse.ArgumentParser( description = 'Serve Blackout tables.' )
+
+	parser.add_argument( '--host', default = '127.0.0.1' )
+	parser.add_argument( '--port', type = int, default = 8001 )
+	parser.add_argument( '--turn-timeout', type = float, default = None, help = 'Seconds a player has to bid or play' )
+	parser.add_argument( '--idle-timeout', type = float, default = 3600.0, help = 'Seconds after its last change that an abandoned table is removed' )
+	parser.add_argument( '--finished-timeout', type = float, default = 300.0, help = 'Seconds after its last change that a finished table is removed' )
+	parser.add_argument( '--instrument', action = 'store_true', help = 'Record the latencies of the kernel, served at /metrics' )
+
+	args = parser.parse_args()
+
+	if args.instrument :
+
+		instrument.enable()
+
+	async def main() :
+
+		server = await GameServer( turnTimeout = args.turn_timeout, idleTimeout = args.idle_timeout, finishedTimeout = args.finished_timeout ).serve( args.host, args.port )
+
+		await server.serve_forever()
+
+	asyncio.run( main() )
@@ -0,0 +1,459 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements sharded hosting of Blackout games over several worker processes, to use every core of a server despite the GIL.
+#
+# Game ids are hashed (with a hash that is the same in every process) onto a fixed number of shards and every shard is owned by one worker process which holds the games of the shard in memory. The supervisor routes every action to the worker owning the game (sticky routing) over a pipe. Actions for many games are sent as one batch per worker so that the workers run them in parallel.
+#
+# When a worker is restarted its games are moved to the other workers (as Blackout.toBytes() snapshots together with the state of their random generators and their validation levels) while it is down and the shards are then spread evenly again over all the workers. A worker that dies unexpectedly takes its games with it; its shards are reassigned in the same way. A worker whose pipe fails is stopped (so that no stale reply can be read from it later) and the requests sent to it fail with WorkerError until check() replaces it.
+
+
+import multiprocessing
+import random
+import zlib
+
+from blackout import *		# Access the Blackout class
+
+import simulate		# Access playGame() and the automatic policies
+
+
+
+# The Blackout methods that can be called through Supervisor.execute():
+
+ACTIONS = frozenset( [ 'Deal', 'Bid', 'Move', 'evalTrick', 'postRound', 'isOver', 'legalBids', 'legalMoves', 'hand', 'scores', 'toBytes' ] )
+
+
+
+class WorkerError( RuntimeError ) :
+
+	'''
+	Returned (and raised by Supervisor.execute()) in place of the results of the requests sent to a worker that could not be reached or died before replying.
+	'''
+
+	pass
+
+
+
+def shardOf( gameId, numShards ) :
+
+	'''
+	Returns the shard of the game 'gameId' (a string). Unlike hash() the result is the same in every process.
+	'''
+
+	return zlib.crc32( gameId.encode( 'utf-8' ) ) % numShards
+
+
+
+def _worker( conn, numShards ) :
+
+	'''
+	The main loop of a worker process. Every message is a list of requests ( gameId, action, args ) answered by the list of their results (an exception raised by an action is returned in place of its result).
+	'''
+
+	games = {}
+
+	while True :
+
+		try :
+
+			requests = conn.recv()
+
+		except EOFError :
+
+			break
+
+		if requests is None :		# Stop
+
+			break
+
+		results = []
+
+		for gameId, action, args in requests :
+
+			try :
+
+				if action == '_create' :		# args: numPlayers, maxTricks, seed, validation
+
+					if gameId in games :		# Do not throw a live game away
+
+						raise ValueError( 'ERROR: The game %s already exists.' % gameId )
+
+					game = Blackout( args[0], args[1], random.Random( args[2] ), args[3] )
+
+					games[ gameId ] = game
+
+					result = True
+
+				elif action == '_export' :		# Removes and returns the snapshots (with the generator states and validation levels) of the games of the shards in args
+
+					shards = set( args )
+
+					result = dict( ( key, ( game.toBytes(), game.rng.getstate(), game.validation ) ) for key, game in games.items() if shardOf( key, numShards ) in shards )
+
+					for key in result :
+
+						del games[ key ]
+
+				elif action == '_import' :		# args: a dictionary of snapshots, generator states and validation levels (see '_export')
+
+					for key, ( data, state, validation ) in args[0].items() :
+
+						rng = random.Random()
+						rng.setstate( state )		# The game goes on dealing the same cards as before the move
+
+						games[ key ] = Blackout.fromBytes( data, rng, validation )
+
+					result = True
+
+				elif action == '_playGame' :		# args: numPlayers, maxTricks, seed. Plays a whole game with the automatic policies, without keeping it, and returns its scores: a CPU-bound request (see benchmarks.py)
+
+					rng = random.Random( args[2] )
+
+					result = simulate.playGame( args[0], args[1], simulate.trumpBid, simulate.greedyPlay, rng ).scores()
+
+				elif action == '_count' :
+
+					result = len( games )
+
+				elif action == '_drop' :
+
+					result = games.pop( gameId, None ) is not None
+
+				elif action in ACTIONS :
+
+					result = getattr( games[ gameId ], action )( *args )
+
+				else :
+
+					raise ValueError( 'ERROR: Unknown action %s.' % action )
+
+			except Exception as error :
+
+				result = error
+
+			results.append( result )
+
+		conn.send( results )
+
+
+
+class Supervisor :
+
+	'''
+	Starts 'numWorkers' worker processes and routes the actions on games to the worker owning each game.
+
+	numShards: <INT> Number of shards the games are hashed onto. Should be several times the number of workers so that the shards can be spread evenly.
+
+	Example:
+
+	supervisor = Supervisor( 4 )
+	supervisor.create( 'table-17', 5 )
+	supervisor.execute( [ ( 'table-17', 'Deal', () ), ( 'table-17', 'hand', ( 1, ) ) ] )
+	...
+	supervisor.close()
+	'''
+
+	def __init__( self, numWorkers = None, numShards = 256 ) :
+
+		self.numWorkers = numWorkers or multiprocessing.cpu_count()
+		self.numShards = numShards
+
+		self.owner = [ shard % self.numWorkers for shard in range( numShards ) ]		# The worker owning each shard
+
+		self._processes = [ None ] * self.numWorkers
+		self._conns = [ None ] * self.numWorkers
+
+		for index in range( self.numWorkers ) :
+
+			self._start( index )
+
+
+	def _start( self, index ) :
+
+		conn, child = multiprocessing.Pipe()
+
+		process = multiprocessing.Process( target = _worker, args = ( child, self.numShards ), name = 'Blackout worker %d' % index )
+		process.daemon = True
+		process.start()
+
+		child.close()
+
+		self._processes[ index ] = process
+		self._conns[ index ] = conn
+
+
+	def workerOf( self, gameId ) :
+
+		return self.owner[ shardOf( gameId, self.numShards ) ]
+
+
+	def _send( self, batches ) :
+
+		'''
+		Sends the batches of requests (a dictionary mapping worker indices to lists of requests) to the workers and returns a dictionary of their lists of results. All the batches are sent before any result is awaited so that the workers run in parallel.
+
+		The reply of every worker that was sent a batch is always read, so that none is left in a pipe to be mistaken for the reply to a later batch. A worker that cannot be reached is stopped (see _fail()) and every result of its batch is a WorkerError.
+		'''
+
+		sent = []
+
+		replies = {}
+
+		for index, batch in batches.items() :
+
+			try :
+
+				self._conns[ index ].send( batch )
+
+				sent.append( index )
+
+			except ( OSError, EOFError ) as error :
+
+				replies[ index ] = self._fail( index, batch, error )
+
+		for index in sent :
+
+			try :
+
+				replies[ index ] = self._conns[ index ].recv()
+
+			except ( OSError, EOFError ) as error :
+
+				replies[ index ] = self._fail( index, batches[ index ], error )
+
+		return replies
+
+
+	def _fail( self, index, batch, error ) :
+
+		'''
+		Stops the worker 'index' after its pipe failed and returns the results of 'batch': a WorkerError for every request. check() replaces the worker.
+		'''
+
+		if self._processes[ index ].is_alive() :
+
+			self._processes[ index ].terminate()
+
+		self._processes[ index ].join()
+
+		failure = WorkerError( 'ERROR: Worker %d failed (%s).' % ( index, error ) )
+
+		return [ failure ] * len( batch )
+
+
+	def execute( self, requests ) :
+
+		'''
+		Runs a list of requests ( gameId, action, args ), where action is one of ACTIONS (the Blackout method called with *args), and returns the list of their results in the same order. Exceptions raised by actions are raised again here (after every request has run), as is a WorkerError if a worker failed.
+		'''
+
+		batches = {}
+		positions = []		# ( worker, position in its batch ) of every request
+
+		for request in requests :
+
+			index = self.workerOf( request[0] )
+
+			batch = batches.setdefault( index, [] )
+
+			positions.append( ( index, len( batch ) ) )
+
+			batch.append( request )
+
+		replies = self._send( batches )
+
+		results = [ replies[ index ][ position ] for index, position in positions ]
+
+		for result in results :
+
+			if isinstance( result, Exception ) :
+
+				raise result
+
+		return results
+
+
+	def create( self, gameId, numPlayers, maxTricks = 7, seed = None, validation = STRICT ) :
+
+		'''
+		Creates the game 'gameId' on the worker owning it. Raises ValueError if the game already exists.
+		'''
+
+		return self.execute( [ ( gameId, '_create', ( numPlayers, maxTricks, seed, validation ) ) ] )[0]
+
+
+	def drop( self, gameId ) :
+
+		return self.execute( [ ( gameId, '_drop', () ) ] )[0]
+
+
+	def counts( self ) :
+
+		'''
+		Returns the number of games held by each worker (None for a worker that failed).
+		'''
+
+		replies = self._send( dict( ( index, [ ( None, '_count', () ) ] ) for index in range( self.numWorkers ) ) )
+
+		return [ None if isinstance( replies[ index ][0], WorkerError ) else replies[ index ][0] for index in range( self.numWorkers ) ]
+
+
+	def _move( self, moves ) :
+
+		'''
+		Moves shards between workers. 'moves' maps shards to their new owners.
+		'''
+
+		sources = {}
+
+		for shard, index in moves.items() :
+
+			if self.owner[ shard ] != index :
+
+				sources.setdefault( self.owner[ shard ], [] ).append( shard )
+
+		alive = dict( ( index, shards ) for index, shards in sources.items() if self._processes[ index ].is_alive() )
+
+		exported = self._send( dict( ( index, [ ( None, '_export', shards ) ] ) for index, shards in alive.items() ) )
+
+		imports = {}
+
+		for index, reply in exported.items() :
+
+			if isinstance( reply[0], WorkerError ) :		# The games of a worker that failed are lost
+
+				continue
+
+			for gameId, data in reply[0].items() :
+
+				imports.setdefault( moves[ shardOf( gameId, self.numShards ) ], {} )[ gameId ] = data
+
+		for shard, index in moves.items() :
+
+			self.owner[ shard ] = index
+
+		self._send( dict( ( index, [ ( None, '_import', ( games, ) ) ] ) for index, games in imports.items() ) )
+
+
+	def rebalance( self, exclude = () ) :
+
+		'''
+		Spreads the shards evenly over the workers (except those in 'exclude'), moving as few shards as possible.
+		'''
+
+		workers = [ index for index in range( self.numWorkers ) if index not in exclude ]
+
+		quota = dict( ( index, self.numShards // len( workers ) + ( 1 if k < self.numShards % len( workers ) else 0 ) ) for k, index in enumerate( workers ) )
+
+		held = dict( ( index, 0 ) for index in workers )
+
+		moves = {}
+		spare = []		# Shards that must move
+
+		for shard, index in enumerate( self.owner ) :
+
+			if index in held and held[ index ] < quota[ index ] :
+
+				held[ index ] += 1
+
+			else :
+
+				spare.append( shard )
+
+		for index in workers :
+
+			while held[ index ] < quota[ index ] :
+
+				moves[ spare.pop() ] = index
+
+				held[ index ] += 1
+
+		self._move( moves )
+
+
+	def restartWorker( self, index ) :
+
+		'''
+		Restarts a worker process without losing its games: they are moved to the other workers while it restarts and the shards are then spread evenly again. Also used to replace a worker that died (whose games are lost).
+		'''
+
+		saved = None
+
+		if self.numWorkers > 1 :
+
+			self.rebalance( exclude = ( index, ) )
+
+		elif self._processes[ index ].is_alive() :		# There is no other worker to hold the games meanwhile
+
+			saved = self._send( { index: [ ( None, '_export', range( self.numShards ) ) ] } )[ index ][0]
+
+			if isinstance( saved, WorkerError ) :
+
+				saved = None
+
+		self._stop( index )
+
+		self._start( index )
+
+		if saved :
+
+			self._send( { index: [ ( None, '_import', ( saved, ) ) ] } )
+
+		self.rebalance()
+
+
+	def check( self ) :
+
+		'''
+		Replaces the workers that have died. Returns the list of their indices.
+		'''
+
+		dead = [ index for index in range( self.numWorkers ) if not self._processes[ index ].is_alive() ]
+
+		for index in dead :
+
+			self.restartWorker( index )
+
+		return dead
+
+
+	def _stop( self, index ) :
+
+		'''
+		Stops the worker 'index' and closes its pipe. A worker that is still running but whose pipe has failed is terminated (see _fail()).
+		'''
+
+		if self._processes[ index ].is_alive() :
+
+			try :
+
+				self._conns[ index ].send( None )
+
+			except ( OSError, EOFError ) :
+
+				self._processes[ index ].terminate()
+
+		self._processes[ index ].join()
+
+		self._conns[ index ].close()
+
+
+	def close( self ) :
+
+		for index in range( self.numWorkers ) :
+
+			self._stop( index )
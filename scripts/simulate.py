@@ -0,0 +1,303 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a headless simulator which plays complete games of Blackout using the API of the Blackout class (Deal -> Bid -> Move -> evalTrick -> postRound) with pluggable bidding and playing policies. It is used to tune house rules (maxTricks, table size) by simulating a large number of games spread over a pool of worker processes.
+
+# Usage (from the terminal):
+#
+# python simulate.py --games 100000 --players 4 --max-tricks 7 --processes 4 --seed 2013
+
+
+import random
+
+from cards import *		# Access all the playing card implementing classes and enumerations from the cards module (custom-built)
+from blackout import *		# Access the Blackout class
+
+
+
+# Policies:
+#
+# A bidding policy is a function policy( game, player, rng ) which returns the bid of 'player' in the current round of the Blackout object 'game'. A playing policy has the same signature and returns the index (in game.Deck) of the card 'player' plays next. 'rng' is the random.Random object of the worker process. Policies must be module level functions so that they can be sent to the worker processes.
+
+
+def randomBid( game, player, rng ) :
+
+	'''
+	Bids uniformly at random among the legal bids.
+	'''
+
+	return rng.choice( game.legalBids( player ) )
+
+
+
+def trumpBid( game, player, rng ) :
+
+	'''
+	Bids the number of trumps and aces held, adjusted to the nearest legal bid.
+	'''
+
+	hand = game.Hand[ player ]
+
+	estimate = countOf( hand & SUIT_MASK[ game.precedence.trumpIndex ] )
+
+	for suit in range( NUM_SUITS ) :
+
+		if suit != game.precedence.trumpIndex and ( hand >> ( suit * NUM_RANKS + NUM_RANKS - 1 ) ) & 1 :		# Holds the (non-trump) Ace of the suit
+
+			estimate += 1
+
+	return min( game.legalBids( player ), key = lambda bid : abs( bid - estimate ) )
+
+
+
+def randomPlay( game, player, rng ) :
+
+	'''
+	Plays a legal card uniformly at random.
+	'''
+
+	return rng.choice( cardsOf( game.legalMoves( player ) ) )
+
+
+
+def greedyPlay( game, player, rng ) :
+
+	'''
+	Plays the legal card with the highest trick-taking power (see cards.POWER). When leading the suit of the card decides the suit led.
+	'''
+
+	cards = cardsOf( game.legalMoves( player ) )
+
+	trump = game.precedence.trumpIndex
+
+	if player == game.Leader :
+
+		return max( cards, key = lambda card : POWER[ trump ][ card // NUM_RANKS ][ card ] )
+
+	power = POWER[ trump ][ game.precedence.ledIndex ]
+
+	return max( cards, key = lambda card : power[ card ] )
+
+
+
+def playGame( numPlayers, maxTricks, bidPolicy, playPolicy, rng, validation = OFF ) :
+
+	'''
+	Plays one complete game of Blackout driving the Blackout API and returns the finished Blackout object. All randomness (the deals and the policies) is drawn from 'rng' so that a seeded 'rng' reproduces the game exactly.
+
+	validation: <INT> The validation level of the game (see blackout.STRICT). The policies only pick legal bids and cards so by default nothing is checked. Pass TRUSTED or STRICT to check a new policy: an illegal bid or card then raises ValueError.
+	'''
+
+	game = Blackout( numPlayers, maxTricks, rng, validation )
+
+	while not game.isOver() :
+
+		game.Deal()
+
+		for player in circGen( numPlayers, game.Leader ) :
+
+			if not game.Bid( player, bidPolicy( game, player, rng ) ) :		# Not an assert: the bid must be made even under python -O
+
+				raise ValueError( 'ERROR: The bidding policy made an illegal bid.' )
+
+		for trick in range( game.numTricks ) :
+
+			for player in circGen( numPlayers, game.Leader ) :
+
+				if not game.Move( player, playPolicy( game, player, rng ) ) :
+
+					raise ValueError( 'ERROR: The playing policy made an illegal move.' )
+
+			game.evalTrick()
+
+		game.postRound()
+
+	return game
+
+
+
+def _newStats( numPlayers, numRounds ) :
+
+	'''
+	Returns an empty statistics dictionary. The entries are all sums so that the statistics of separate batches of games can be merged by simply adding them (see _mergeStats()).
+	'''
+
+	return {
+			'games': 0,
+			'points': [ 0 ] * numPlayers,		# Sum of the final score of each seat
+			'pointsSq': [ 0 ] * numPlayers,		# Sum of the squares of the final score of each seat (for the variance)
+			'wins': [ 0 ] * numPlayers,		# Number of games won (or shared) by each seat
+			'bidsMade': [ 0 ] * numRounds,		# Number of bids made, per round
+			'bids': [ 0 ] * numRounds,		# Number of bids placed, per round
+		}
+
+
+
+def _mergeStats( total, stats ) :
+
+	'''
+	Adds the statistics 'stats' into 'total'.
+	'''
+
+	for key in total :
+
+		if key == 'games' :
+
+			total[ key ] += stats[ key ]
+
+		else :
+
+			total[ key ] = [ a + b for a, b in zip( total[ key ], stats[ key ] ) ]
+
+	return total
+
+
+
+def _runBatch( args ) :
+
+	'''
+	Plays a batch of games in a worker process and returns their statistics. Every batch has its own random stream seeded from the master seed and the batch number so the result of a simulation is independent of the number of processes used.
+	'''
+
+	numGames, numPlayers, maxTricks, bidPolicy, playPolicy, seed, batch, validation = args
+
+	rng = random.Random( '%s:%d' % ( seed, batch ) )
+
+	stats = None
+
+	for ii in range( numGames ) :
+
+		game = playGame( numPlayers, maxTricks, bidPolicy, playPolicy, rng, validation )
+
+		if stats is None :	stats = _newStats( numPlayers, game.numRounds )
+
+		scores = game.scores()
+		best = max( scores )
+
+		stats[ 'games' ] += 1
+
+		for seat in range( numPlayers ) :
+
+			stats[ 'points' ][ seat ] += scores[ seat ]
+			stats[ 'pointsSq' ][ seat ] += scores[ seat ] ** 2
+
+			if scores[ seat ] == best :	stats[ 'wins' ][ seat ] += 1
+
+			for rnd in range( game.numRounds ) :
+
+				stats[ 'bids' ][ rnd ] += 1
+
+				if game.Bids[ rnd * numPlayers + seat ] == game.Tricks[ rnd * numPlayers + seat ] :	stats[ 'bidsMade' ][ rnd ] += 1
+
+	return stats
+
+
+
+def simulate( numGames, numPlayers, maxTricks = 7, bidPolicy = randomBid, playPolicy = randomPlay, processes = None, seed = 0, batchSize = 1000, validation = OFF ) :
+
+	'''
+	Simulates 'numGames' complete games spread over a multiprocessing pool of 'processes' workers (None means one per CPU, 1 means run in this process) and returns the merged statistics:
+
+	games: Number of games played.
+
+	meanPoints, stdPoints: Mean and standard deviation of the final score of each seat.
+
+	winRate: Fraction of games won (or shared) by each seat.
+
+	bidAccuracy: Fraction of bids made in each round.
+
+	'validation' is the validation level of every game (see playGame()).
+	'''
+
+	if numGames < 1 :
+
+		raise ValueError( 'ERROR: At least one game must be simulated.' )
+
+	batches = []
+
+	for batch in range( ( numGames + batchSize - 1 ) // batchSize ) :
+
+		batches.append( ( min( batchSize, numGames - batch * batchSize ), numPlayers, maxTricks, bidPolicy, playPolicy, seed, batch, validation ) )
+
+
+	if processes == 1 :
+
+		results = [ _runBatch( args ) for args in batches ]
+
+	else :
+
+		import multiprocessing
+
+		pool = multiprocessing.Pool( processes )
+
+		try :
+
+			results = pool.map( _runBatch, batches )
+
+		finally :
+
+			pool.close()
+			pool.join()
+
+
+	total = results[0]
+
+	for stats in results[1:] :
+
+		_mergeStats( total, stats )
+
+
+	games = float( total[ 'games' ] )
+
+	meanPoints = [ points / games for points in total[ 'points' ] ]
+
+	return {
+			'games': total[ 'games' ],
+			'meanPoints': meanPoints,
+			'stdPoints': [ max( sq / games - mean ** 2, 0 ) ** 0.5 for sq, mean in zip( total[ 'pointsSq' ], meanPoints ) ],
+			'winRate': [ wins / games for wins in total[ 'wins' ] ],
+			'bidAccuracy': [ made / float( bids ) for made, bids in zip( total[ 'bidsMade' ], total[ 'bids' ] ) ],
+		}
+
+
+
+if __name__ == '__main__' :
+
+	import argparse
+
+	policies = { 'randomBid': randomBid, 'trumpBid': trumpBid, 'randomPlay': randomPlay, 'greedyPlay': greedyPlay }
+
+	levels = { 'off': OFF, 'trusted': TRUSTED, 'strict': STRICT }
+
+	parser = argparse.ArgumentParser( description = 'Simulate games of Blackout.' )
+
+	parser.add_argument( '--games', type = int, default = 10000 )
+	parser.add_argument( '--players', type = int, default = 4 )
+	parser.add_argument( '--max-tricks', type = int, default = 7 )
+	parser.add_argument( '--processes', type = int, default = None )
+	parser.add_argument( '--seed', default = '0' )
+	parser.add_argument( '--bid', choices = [ 'randomBid', 'trumpBid' ], default = 'randomBid' )
+	parser.add_argument( '--play', choices = [ 'randomPlay', 'greedyPlay' ], default = 'randomPlay' )
+	parser.add_argument( '--validation', choices = [ 'off', 'trusted', 'strict' ], default = 'off' )
+
+	args = parser.parse_args()
+
+	stats = simulate( args.games, args.players, args.max_tricks, policies[ args.bid ], policies[ args.play ], args.processes, args.seed, validation = levels[ args.validation ] )
+
+	for key in [ 'games', 'meanPoints', 'stdPoints', 'winRate', 'bidAccuracy' ] :
+
+		print( '%s: %s' % ( key, stats[ key ] ) )
@@ -0,0 +1,1250 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a double-dummy solver for a round of Blackout, that is a solver which sees every player's hand (as in the full deal produced by Blackout.Deal()) and finds the maximum number of tricks each player can take with perfect play. It is used for post-game analysis ("you could have made your bid") and as a strong (if clairvoyant) bot.
+
+# Since Blackout is played every man for himself, the number of tricks a player can take is computed under the assumption that all the other players combine against him. The search is an alpha-beta search of the game tree reduced to a sequence of yes/no questions ("can the player take at least k more tricks?") with:
+#
+# (a) a transposition table per number of tricks left which stores bounds on the number of tricks the player can take from the start of a trick. It is keyed on the player on lead and the number of cards of every suit held by each player. The ranks are handled by partition search: every answer comes with the cards whose ranks decided it (e.g. the card that won a trick over another of its suit) and an entry only records, in every suit, the owners of the cards down to the lowest of these. The lower cards only count by number, so the entry answers for every position that differs from the one searched in their ranks only,
+#
+# (b) equivalence pruning, that is only one card of a sequence of touching ranks held by the same player (once the cards between them have been played) is searched, as is only one of the cards of a suit whose ranks did not decide the answer for the first of them,
+#
+# (c) move ordering which depends on who is winning the trick so far and whether the player has already played to it: the player leads first the cards nobody can beat and then his trumps, the other players first try to keep the trick out of his reach as cheaply as possible. The card led that decided the answer in a position is stored with its bounds and tried first when the position is searched again,
+#
+# (d) bounds on the tricks the player is sure to win or lose, from the top trumps and the top cards the player on lead can cash before anyone can ruff. Once the player has played to a trick (or when he only needs that trick and nobody can beat his best card) the trick is decided as soon as nobody left to play can change its winner.
+#
+# Solving every seat of a 7 trick deal (allMaxTricks()) takes a median of about 25 ms with 4 or 5 players and 0.1-0.15 s with 6 or 7, i.e. a few ms per seat with 4 or 5 players and about 20 ms with 6 or 7. The cost depends on how long the other players can keep a trick from the player, so it varies a lot between deals: one deal in ten takes over 0.1 s with 5 players and over a second with 7, and with 7 players the odd seat takes close to a million positions (about 10 s). A solver can therefore be given a limit on the number of positions and/or the time of each maxTricks() search (see SearchLimitError).
+#
+# The transposition tables are kept for the life of the solver, so that later searches re-use the bounds found by earlier ones, but the tables of a player are cleared when they reach 'maxEntries' positions to bound the memory used by a long-running process.
+
+
+import time
+
+from cards import *		# Access the integer card core
+
+
+
+_CHECK_EVERY = 1024		# Number of positions between two checks of the time limit
+
+_MAX_ENTRIES = 200000		# Default number of positions stored in the transposition table of each player (roughly 50 MB)
+
+try :
+
+	_count = int.bit_count		# Python 3.10 and later: much faster than countOf() in the inner loops of the search
+
+except AttributeError :
+
+	_count = countOf
+
+
+
+def _nth( bits, n ) :
+
+	'''
+	Returns the index of the n-th highest set bit of 'bits' (counting from 1).
+	'''
+
+	for ii in range( n - 1 ) :
+
+		bits ^= 1 << ( bits.bit_length() - 1 )
+
+	return bits.bit_length() - 1
+
+
+
+class SearchLimitError( RuntimeError ) :
+
+	'''
+	Raised by DoubleDummy.maxTricks() when the search reaches the limit on the number of positions or on the time of the solver. 'lower' is the number of tricks proven so far, a lower bound on the answer. The bounds stored in the transposition table stay valid so calling maxTricks() again (with higher limits) resumes the search.
+	'''
+
+	lower = 0
+
+
+
+class DoubleDummy :
+
+	'''
+	Double-dummy solver for a single round.
+
+	hands: <LIST> The hands of the players as masks (see cards.SUIT_MASK), e.g. Blackout.Hand.
+
+	trump: <INT> The trump suit index (NO_SUIT for no trump).
+
+	leader: <INT> The player who leads (or led) the current trick.
+
+	table: <LIST> The cards already played to the current trick in the order they were played, starting with the leader's. Empty at the start of a trick.
+
+	maxNodes: <INT> Optional limit on the number of positions visited by each maxTricks() search.
+
+	maxSeconds: <FLOAT> Optional limit on the time of each maxTricks() search.
+
+	maxEntries: <INT> Number of positions stored in the transposition table of each player before it is cleared.
+
+	Example:
+
+	solver = DoubleDummy( game.Hand, game.precedence.trumpIndex, game.Leader )
+	solver.maxTricks( 2 )		# The most tricks player 2 can take in this round
+	'''
+
+	def __init__( self, hands, trump, leader, table = (), maxNodes = None, maxSeconds = None, maxEntries = _MAX_ENTRIES ) :
+
+		self.numPlayers = len( hands )
+
+		self.hands = list( hands )		# Mutated (and restored) during the search
+
+		self.remaining = 0		# Mask of all the cards still in the players' hands
+
+		self.owner = [ 0 ] * NUM_CARDS		# The player holding each card. Fixed by the deal.
+
+		self._width = max( 1, ( self.numPlayers - 1 ).bit_length() )		# Number of bits of an owner in the transposition table keys
+
+		for seat in range( self.numPlayers ) :
+
+			self.remaining |= hands[ seat ]
+
+			for card in cardsOf( hands[ seat ] ) :
+
+				self.owner[ card ] = seat
+
+		self.trump = trump
+		self.leader = leader
+		self.table = list( table )
+
+		self.nodes = 0		# Number of positions visited, for diagnostics
+
+		self.maxNodes = maxNodes
+		self.maxSeconds = maxSeconds
+		self.maxEntries = maxEntries
+
+		self._checkAt = None		# The number of positions at which the limits are next checked (None while the search is not limited)
+		self._stopAt = None
+		self._deadline = None
+
+		self._tables = [ [ {} for left in range( NUM_CARDS // self.numPlayers + 1 ) ] for seat in range( self.numPlayers ) ]		# One transposition table per player (since the player maximizing his tricks differs) and number of tricks left
+
+		self._entries = [ 0 ] * self.numPlayers		# Number of positions stored in the tables of each player
+
+		self._layouts = [ {} for suit in range( NUM_SUITS ) ]		# The layout of each suit by the mask of its remaining cards (see _layout())
+
+		self._cutoff = None		# The card led that decided the last answer of _play() at the start of a trick
+
+		self._relevant = 0		# The cards whose ranks decided the last answer of _trick() or _play() (see _store())
+		self._relevantSure = 0
+		self._relevantLost = 0
+
+
+	@classmethod
+	def fromGame( cls, game ) :
+
+		'''
+		Creates a solver for the current position of the Blackout object 'game'.
+		'''
+
+		table = []		# The cards played to the trick in progress (if any) in the order they were played
+
+		for k in range( game.numPlayers ) :
+
+			card = game.currentTrick[ ( game.Leader + k ) % game.numPlayers ]
+
+			if card is None :	break
+
+			table.append( card )
+
+		return cls( game.Hand, game.precedence.trumpIndex, game.Leader, table )
+
+
+	def maxTricks( self, seat ) :
+
+		'''
+		Returns the maximum number of tricks 'seat' can take in the rest of the round (including the trick in progress) against best defence by all the other players. Raises SearchLimitError if the limits of the solver are reached first.
+
+		A 7 trick round takes a few ms per seat with 4 or 5 players and tens of ms with 6 or 7 but some deals take much longer (see the module comment), so callers that must answer within a bound should set maxNodes or maxSeconds.
+		'''
+
+		tricks = 0
+
+		self._stopAt = None if self.maxNodes is None else self.nodes + self.maxNodes
+		self._deadline = None if self.maxSeconds is None else time.monotonic() + self.maxSeconds
+
+		self._schedule()
+
+		hands = list( self.hands )
+		remaining = self.remaining
+
+		try :
+
+			while self._root( seat, tricks + 1 ) :		# Each question re-uses the bounds stored by the previous ones
+
+				tricks += 1
+
+		except SearchLimitError as error :
+
+			self.hands = hands		# The search stopped with cards still played
+			self.remaining = remaining
+
+			error.lower = tricks
+
+			raise
+
+		finally :
+
+			self._checkAt = None
+
+		return tricks
+
+
+	def _schedule( self ) :
+
+		'''
+		Sets the number of positions at which the limits are next checked.
+		'''
+
+		checks = []
+
+		if self._stopAt is not None :
+
+			checks.append( self._stopAt )
+
+		if self._deadline is not None :
+
+			checks.append( self.nodes + _CHECK_EVERY )
+
+		self._checkAt = max( min( checks ), self.nodes + 1 ) if checks else None
+
+
+	def _checkLimits( self ) :
+
+		if self._stopAt is not None and self.nodes >= self._stopAt :
+
+			raise SearchLimitError( 'ERROR: The search reached its limit of %d positions.' % self.maxNodes )
+
+		if self._deadline is not None and time.monotonic() > self._deadline :
+
+			raise SearchLimitError( 'ERROR: The search reached its limit of %g seconds.' % self.maxSeconds )
+
+		self._schedule()
+
+
+	def allMaxTricks( self ) :
+
+		'''
+		Returns the list of maxTricks() for every player.
+		'''
+
+		return [ self.maxTricks( seat ) for seat in range( self.numPlayers ) ]
+
+
+	def bestMove( self ) :
+
+		'''
+		Returns the card (integer identity) that the player next to play should play to maximize his tricks, together with the number of tricks he can then take. The limits of the solver apply to the search of every card.
+
+		Every candidate card costs a maxTricks() search (with a fresh transposition table) so this is several times slower than maxTricks() itself.
+		'''
+
+		seat = ( self.leader + len( self.table ) ) % self.numPlayers
+
+		best = None
+
+		led, bestSeat, bestCard, tableMask = self._trickSoFar()
+
+		for card in self._ordered( seat, self.leader, len( self.table ), seat, led, bestSeat, POWER[ self.trump ][ led ][ bestCard ] if self.table else -1, tableMask ) :
+
+			child = DoubleDummy( self.hands, self.trump, self.leader, self.table + [ card ], self.maxNodes, self.maxSeconds, self.maxEntries )
+
+			child.hands[ seat ] ^= 1 << card
+			child.remaining ^= 1 << card
+
+			if len( child.table ) == self.numPlayers :		# The card completes the trick
+
+				winner = ( self.leader + trickWinner( child.table, self.trump ) ) % self.numPlayers
+
+				child.leader = winner
+				child.table = []
+
+				tricks = child.maxTricks( seat ) + ( winner == seat )
+
+			else :
+
+				tricks = child.maxTricks( seat )
+
+			if best is None or tricks > best[1] :
+
+				best = ( card, tricks )
+
+		return best
+
+
+	def _led( self ) :
+
+		'''
+		Returns the index of the suit led in the current trick (NO_SUIT if nothing has been played yet).
+		'''
+
+		return self.table[0] // NUM_RANKS if self.table else NO_SUIT
+
+
+	def _trickSoFar( self ) :
+
+		'''
+		Replays the cards already on the table and returns a tuple of the suit led (NO_SUIT if nothing has been played yet), the player winning the trick so far, his card and the mask of the cards on the table.
+		'''
+
+		if not self.table :
+
+			return NO_SUIT, self.leader, -1, 0
+
+		led = self._led()
+		power = POWER[ self.trump ][ led ]
+
+		bestSeat = self.leader
+		bestCard = self.table[0]
+		tableMask = 0
+
+		for k in range( len( self.table ) ) :
+
+			card = self.table[ k ]
+
+			tableMask |= 1 << card
+
+			if power[ card ] > power[ bestCard ] :
+
+				bestSeat = ( self.leader + k ) % self.numPlayers
+				bestCard = card
+
+		return led, bestSeat, bestCard, tableMask
+
+
+	def _root( self, seat, need ) :
+
+		'''
+		Answers whether 'seat' can take at least 'need' tricks from the starting position.
+		'''
+
+		if not self.table :
+
+			return self._trick( seat, self.leader, need )
+
+		return self._play( seat, self.leader, len( self.table ), *self._trickSoFar(), need = need )
+
+
+	def _trick( self, seat, leader, need ) :
+
+		'''
+		Answers whether 'seat' can take at least 'need' of the remaining tricks when 'leader' is on lead at the start of a trick. Like _play(), leaves in self._relevant the cards whose ranks decided the answer.
+		'''
+
+		if need <= 0 :
+
+			self._relevant = 0
+
+			return True
+
+		left = _count( self.hands[ leader ] )		# Number of tricks left to play
+
+		if need > left :
+
+			self._relevant = 0
+
+			return False
+
+		if left == 1 :		# Last trick: every player has a single card left so the outcome is fixed
+
+			return self._lastTrick( leader ) == seat
+
+		layouts, key = self._position( leader )
+
+		table = self._tables[ seat ][ left ]
+
+		bucket = table.get( key )
+
+		hint = None
+
+		if bucket is not None :
+
+			for tops, entries in bucket.items() :
+
+				entry = entries.get( self._pattern( layouts, tops ) )
+
+				if entry is None :
+
+					continue
+
+				if entry[0] >= need or entry[1] < need :		# The stored bounds answer the question
+
+					self._relevant = self._floors( layouts, tops )
+
+					return entry[0] >= need
+
+				if hint is None :
+
+					hint = entry[2]
+
+
+		sure, lost = self._sureTricks( seat, leader )
+
+		if need <= sure :
+
+			self._relevant = self._relevantSure
+
+			return True
+
+		if need > left - lost :
+
+			self._relevant = self._relevantLost
+
+			return False
+
+
+		result = self._play( seat, leader, 0, NO_SUIT, leader, -1, 0, need, None if hint is None else self._absolute( hint ) )
+
+		self._store( seat, table, key, layouts, result, need, left )
+
+		return result
+
+
+	def _position( self, leader ) :
+
+		'''
+		Returns the layouts of the four suits (see _layout()) and the transposition table key of the position at the start of a trick led by 'leader': the leader followed by the number of cards of every suit held by each player.
+		'''
+
+		remaining = self.remaining
+
+		layouts = []
+
+		for suit in range( NUM_SUITS ) :
+
+			bits = ( remaining >> ( suit * NUM_RANKS ) ) & 0x1FFF
+
+			memo = self._layouts[ suit ]
+
+			if bits not in memo :
+
+				memo[ bits ] = self._layout( suit, bits )
+
+			layouts.append( memo[ bits ] )
+
+		return layouts, ( leader, layouts[0][0], layouts[1][0], layouts[2][0], layouts[3][0] )
+
+
+	def _layout( self, suit, bits ) :
+
+		'''
+		Returns a tuple describing the remaining cards of 'suit' (the mask 'bits' of its ranks): the number of them held by each player packed into an integer, the owners of the cards from the highest down packed into an integer (with a leading 1) and the list of the cards from the highest down.
+
+		The owners of the cards are fixed by the deal so the layout of a suit only depends on which of its cards remain, and is computed once for each.
+		'''
+
+		owner = self.owner
+		width = self._width
+
+		counts = 0
+		code = 1
+		cards = []
+
+		for rank in range( NUM_RANKS - 1, -1, -1 ) :
+
+			if bits >> rank & 1 :
+
+				card = suit * NUM_RANKS + rank
+
+				counts += 1 << ( 4 * owner[ card ] )
+				code = ( code << width ) | owner[ card ]
+
+				cards.append( card )
+
+		return counts, code, cards
+
+
+	def _pattern( self, layouts, tops ) :
+
+		'''
+		Returns the owners of the 'tops[ suit ]' highest cards of every suit, which is what a transposition table entry stores of the ranks.
+		'''
+
+		width = self._width
+
+		return tuple( layout[1] >> ( width * ( len( layout[2] ) - top ) ) for layout, top in zip( layouts, tops ) )
+
+
+	def _floors( self, layouts, tops ) :
+
+		'''
+		Returns the relevant cards (see _store()) of a transposition table entry in the current position: the lowest of the 'tops[ suit ]' highest cards of every suit.
+		'''
+
+		relevant = 0
+
+		for layout, top in zip( layouts, tops ) :
+
+			if top :
+
+				relevant |= 1 << layout[2][ top - 1 ]
+
+		return relevant
+
+
+	def _store( self, seat, table, key, layouts, result, need, left ) :
+
+		'''
+		Stores the answer of the search of the position with transposition table key 'key' and the card led that decided it.
+
+		The answer only depends on the ranks of the cards in self._relevant: in every suit the cards from the highest down to the lowest relevant one must be held by the same players, while the lower cards only count by number (which is part of the key) since none of them decided a trick against another. The entry thus stores the owners of these top cards of each suit and answers for every position that shares them.
+		'''
+
+		relevant = self._relevant
+
+		tops = []
+
+		for suit in range( NUM_SUITS ) :
+
+			bits = ( relevant >> ( suit * NUM_RANKS ) ) & 0x1FFF
+
+			if bits :
+
+				tops.append( layouts[ suit ][2].index( suit * NUM_RANKS + ( bits & -bits ).bit_length() - 1 ) + 1 )
+
+			else :
+
+				tops.append( 0 )
+
+		tops = tuple( tops )
+
+		pattern = self._pattern( layouts, tops )
+
+		bucket = table.get( key )
+
+		entry = None if bucket is None or tops not in bucket else bucket[ tops ].get( pattern )
+
+		if entry is None :
+
+			if self._entries[ seat ] >= self.maxEntries :
+
+				for trick in self._tables[ seat ] :		# The bounds are only hints so dropping them all keeps the answers exact
+
+					trick.clear()
+
+				self._entries[ seat ] = 0
+
+			entry = [ 0, left, None ]
+
+			table.setdefault( key, {} ).setdefault( tops, {} )[ pattern ] = entry
+
+			self._entries[ seat ] += 1
+
+		if result :
+
+			entry[0] = max( entry[0], need )
+
+		else :
+
+			entry[1] = min( entry[1], need - 1 )
+
+		if self._cutoff is not None :
+
+			entry[2] = self._relative( self._cutoff )
+
+
+	def _relative( self, card ) :
+
+		'''
+		Returns 'card' as its suit and the number of remaining cards of the suit above it, which identifies the same card in every position sharing a transposition table entry.
+		'''
+
+		suit = card // NUM_RANKS
+
+		return suit, _count( ( self.remaining & SUIT_MASK[ suit ] ) >> ( card + 1 ) )
+
+
+	def _absolute( self, hint ) :
+
+		'''
+		Returns the card identified by _relative() in the current position.
+		'''
+
+		suit, above = hint
+
+		return suit * NUM_RANKS + _nth( ( self.remaining >> ( suit * NUM_RANKS ) ) & 0x1FFF, above + 1 )
+
+
+	def _lastTrick( self, leader ) :
+
+		'''
+		Returns the winner of the last trick, led by 'leader', when every player holds a single card.
+		'''
+
+		numPlayers = self.numPlayers
+
+		best = self.hands[ leader ].bit_length() - 1
+
+		power = POWER[ self.trump ][ best // NUM_RANKS ]
+
+		winner = leader
+
+		for k in range( 1, numPlayers ) :
+
+			player = ( leader + k ) % numPlayers
+
+			card = self.hands[ player ].bit_length() - 1
+
+			if power[ card ] > power[ best ] :
+
+				winner = player
+				best = card
+
+		self._relevant = 1 << best if self.remaining & SUIT_MASK[ best // NUM_RANKS ] & ~( 1 << best ) else 0		# The rank of the winning card only matters against others of its suit
+
+		return winner
+
+
+	def _sureTricks( self, seat, leader ) :
+
+		'''
+		Returns a tuple of the number of tricks 'seat' is sure to win and the number he is sure to lose, at the start of a trick led by 'leader'. The cards these depend on are left in self._relevantSure and self._relevantLost.
+
+		Every trump of the seat that is higher than all the trumps held by the other players wins the trick it is played to. Similarly every trump of another player that is higher than all of the seat's trumps costs him a trick, although trumps of different players may fall in the same trick so only the player holding the most of them is counted.
+
+		The leader can also cash his top cards, keeping the lead: first the trumps higher than all the others', which the other players must follow, then in every other suit the cards higher than all the others' as long as every player who still holds a trump must follow to them. These are won by the seat if he leads and lost otherwise.
+		'''
+
+		hands = self.hands
+		trump = self.trump
+		remaining = self.remaining
+
+		sure = lost = drawn = 0
+
+		relevantSure = relevantLost = relevantCashed = 0
+
+		ruffers = []		# The hands of the other players who still hold trumps once the leader has cashed his
+
+		if trump != NO_SUIT :
+
+			shift = trump * NUM_RANKS
+
+			trumps = ( remaining >> shift ) & 0x1FFF
+			mine = ( hands[ seat ] >> shift ) & 0x1FFF
+			theirs = trumps & ~mine
+
+			top = mine.bit_length()		# Trumps from this rank up are higher than all of the seat's trumps
+
+			if theirs >> top :
+
+				for player in range( self.numPlayers ) :
+
+					if player != seat :
+
+						lost = max( lost, _count( ( ( hands[ player ] >> shift ) & 0x1FFF ) >> top ) )
+
+				if mine :
+
+					above = theirs >> top << top
+
+					relevantLost = 1 << ( shift + ( above & -above ).bit_length() - 1 )
+
+			sure = _count( mine >> theirs.bit_length() )
+
+			if sure :
+
+				relevantSure = 1 << ( shift + _nth( trumps, sure ) )
+
+			ours = ( hands[ leader ] >> shift ) & 0x1FFF
+
+			drawn = _count( ours >> ( trumps & ~ours ).bit_length() )
+
+			if drawn :
+
+				relevantCashed = 1 << ( shift + _nth( trumps, drawn ) )
+
+			for player in range( self.numPlayers ) :
+
+				if player != leader and _count( hands[ player ] & SUIT_MASK[ trump ] ) > drawn :
+
+					ruffers.append( hands[ player ] )
+
+
+		# The leader cashes his top cards:
+
+		hand = hands[ leader ]
+
+		others = remaining & ~hand
+
+		cashed = drawn
+
+		for suit in range( NUM_SUITS ) :
+
+			if suit != trump :
+
+				shift = suit * NUM_RANKS
+
+				tops = _count( ( ( hand >> shift ) & 0x1FFF ) >> ( ( others >> shift ) & 0x1FFF ).bit_length() )
+
+				for ruffer in ruffers :
+
+					tops = min( tops, _count( ruffer & SUIT_MASK[ suit ] ) )
+
+				if tops :
+
+					cashed += tops
+
+					relevantCashed |= 1 << ( shift + _nth( ( remaining >> shift ) & 0x1FFF, tops ) )
+
+		if leader == seat :
+
+			if cashed > sure :
+
+				sure = cashed
+				relevantSure = relevantCashed
+
+		elif cashed > lost :
+
+			lost = cashed
+			relevantLost = relevantCashed
+
+		self._relevantSure = relevantSure
+		self._relevantLost = relevantLost
+
+		return sure, lost
+
+
+	def _play( self, seat, leader, k, led, bestSeat, bestCard, tableMask, need, hint = None ) :
+
+		'''
+		Answers whether 'seat' can take at least 'need' tricks when the k-th card of the trick led by 'leader' is to be played. 'bestSeat' is the player winning the trick so far with the card 'bestCard' and 'tableMask' is the mask of the cards already played to the trick. 'hint' is a card to try first.
+
+		The cards whose ranks decided the answer are left in self._relevant (see _store()) and, when k is 0, the card that decided it (if any) in self._cutoff.
+		'''
+
+		numPlayers = self.numPlayers
+
+		self.nodes += 1
+
+		if self.nodes == self._checkAt :
+
+			self._checkLimits()
+
+		if k == numPlayers :		# The trick is complete
+
+			result = self._trick( seat, bestSeat, need - ( bestSeat == seat ) )
+
+			if tableMask & SUIT_MASK[ bestCard // NUM_RANKS ] & ~( 1 << bestCard ) :		# The trick was won by rank
+
+				self._relevant |= 1 << bestCard
+
+			return result
+
+
+		player = ( leader + k ) % numPlayers
+
+		maximizing = player == seat
+
+		if k > ( seat - leader ) % numPlayers :		# The seat has played to this trick
+
+			decided = self._decided( seat, leader, k, led, bestSeat, bestCard, tableMask, need )
+
+			if decided is not None :
+
+				return decided
+
+		elif k and need == 1 :		# The seat has yet to play and only needs this trick
+
+			card = self._sureWinner( seat, leader, k, led, bestCard )
+
+			if card is not None :
+
+				self._relevant = 1 << card if ( self.remaining | tableMask ) & SUIT_MASK[ card // NUM_RANKS ] & ~( 1 << card ) else 0
+
+				return True
+
+		power = POWER[ self.trump ][ led ]
+
+		bestPower = power[ bestCard ] if k else -1
+
+		cards = self._ordered( seat, leader, k, player, led, bestSeat, bestPower, tableMask )
+
+		if hint is not None and hint in cards :
+
+			cards.remove( hint )
+			cards.insert( 0, hint )
+
+		relevant = skipped = 0
+
+		for card in cards :
+
+			bit = 1 << card
+
+			if bit & skipped :
+
+				continue
+
+			self.hands[ player ] ^= bit
+			self.remaining ^= bit
+
+			if k == 0 :		# The card led decides the suit led
+
+				result = self._play( seat, leader, 1, card // NUM_RANKS, player, card, bit, need )
+
+			elif power[ card ] > bestPower :
+
+				result = self._play( seat, leader, k + 1, led, player, card, tableMask | bit, need )
+
+			else :
+
+				result = self._play( seat, leader, k + 1, led, bestSeat, bestCard, tableMask | bit, need )
+
+			self.hands[ player ] ^= bit
+			self.remaining ^= bit
+
+			if result == maximizing :		# Cut-off: the player to move has found a card that achieves his aim
+
+				if k == 0 :
+
+					self._cutoff = card
+
+				return result
+
+			relevant |= self._relevant
+
+			suit = SUIT_MASK[ card // NUM_RANKS ]
+
+			floor = self._relevant & suit
+
+			below = ( ( floor & -floor ) - 1 if floor else -1 ) & suit		# The cards of the suit whose ranks did not matter
+
+			if bit & below :		# Any other of them would have done the same
+
+				skipped |= below
+
+		if k == 0 :
+
+			self._cutoff = None
+
+		self._relevant = relevant | self._straddled( player, led, tableMask, relevant )
+
+		return not maximizing
+
+
+	def _straddled( self, player, led, tableMask, relevant ) :
+
+		'''
+		Returns the cards to add to the 'relevant' ones once every card of 'player' has been searched: only one card of each sequence of touching ranks was (see _candidates()), the lowest, which stands for the others only while all of them are relevant or none is.
+		'''
+
+		hand = self.hands[ player ]
+
+		legal = hand & SUIT_MASK[ led ]
+
+		if not legal :
+
+			legal = hand
+
+		others = ( self.remaining & ~hand ) | tableMask
+
+		added = 0
+
+		low = previous = -1
+
+		while legal :
+
+			bit = legal & -legal
+
+			legal ^= bit
+
+			card = bit.bit_length() - 1
+
+			if previous >= 0 and previous // NUM_RANKS == card // NUM_RANKS and not others & ( bit - ( 2 << previous ) ) :		# Touches the previous card
+
+				floor = relevant & SUIT_MASK[ card // NUM_RANKS ]
+
+				if floor and low < ( floor & -floor ).bit_length() - 1 <= card :		# The lowest relevant card of the suit splits the sequence
+
+					added |= 1 << low
+
+			else :
+
+				low = card
+
+			previous = card
+
+		return added
+
+
+	def _sureWinner( self, seat, leader, k, led, bestCard ) :
+
+		'''
+		Returns the card with which the seat, who has yet to play to the trick, wins it whatever the other players play (None if there is none): his most powerful legal card, if it beats the card winning the trick so far and every card the players yet to play can play.
+		'''
+
+		numPlayers = self.numPlayers
+		power = POWER[ self.trump ][ led ]
+
+		top = self._top( seat, led )
+
+		if top <= power[ bestCard ] :
+
+			return None
+
+		for j in range( k, numPlayers ) :
+
+			player = ( leader + j ) % numPlayers
+
+			if player != seat and self._top( player, led ) > top :
+
+				return None
+
+		hand = self.hands[ seat ]
+
+		legal = hand & SUIT_MASK[ led ] or hand & SUIT_MASK[ self.trump ]
+
+		return legal.bit_length() - 1
+
+
+	def _decided( self, seat, leader, k, led, bestSeat, bestCard, tableMask, need ) :
+
+		'''
+		Returns the answer of _play() when it does not depend on the rest of the trick, once the seat has played to it (None otherwise).
+
+		The seat loses the trick if another player is winning it and wins it if none of the players yet to play can beat his card. The answer is then decided when the tricks still needed are within his top trumps or beyond the tricks left after those lost to the top trumps of another player (see _sureTricks()), counting the trump that player may still play to this trick.
+		'''
+
+		numPlayers = self.numPlayers
+		trump = self.trump
+
+		if bestSeat == seat :
+
+			bestPower = POWER[ trump ][ led ][ bestCard ]
+
+			for j in range( k, numPlayers ) :
+
+				if self._top( ( leader + j ) % numPlayers, led ) > bestPower :		# The trick is still open
+
+					return None
+
+			relevant = 1 << bestCard
+
+			need -= 1
+
+			if need <= 0 :
+
+				self._relevant = relevant
+
+				return True
+
+		else :
+
+			relevant = 1 << bestCard if tableMask & SUIT_MASK[ bestCard // NUM_RANKS ] & ~( 1 << bestCard ) else 0
+
+		hands = self.hands
+
+		if trump == NO_SUIT :
+
+			if need > _count( hands[ seat ] ) :
+
+				self._relevant = relevant
+
+				return False
+
+			return None
+
+		shift = trump * NUM_RANKS
+
+		trumps = ( self.remaining >> shift ) & 0x1FFF
+		mine = ( hands[ seat ] >> shift ) & 0x1FFF
+		theirs = trumps & ~mine
+
+		if need <= _count( mine >> theirs.bit_length() ) :
+
+			self._relevant = relevant | 1 << ( shift + _nth( trumps, need ) )
+
+			return True
+
+		top = mine.bit_length()
+
+		lost = 0
+
+		if theirs >> top :
+
+			for j in range( numPlayers ) :
+
+				player = ( leader + j ) % numPlayers
+
+				if player != seat :
+
+					lost = max( lost, _count( ( ( hands[ player ] >> shift ) & 0x1FFF ) >> top ) - ( j >= k ) )
+
+		if need > _count( hands[ seat ] ) - lost :
+
+			if mine and theirs >> top :
+
+				above = theirs >> top << top
+
+				relevant |= 1 << ( shift + ( above & -above ).bit_length() - 1 )
+
+			self._relevant = relevant
+
+			return False
+
+		return None
+
+
+	def _ordered( self, seat, leader, k, player, led, bestSeat, bestPower, tableMask ) :
+
+		'''
+		Returns the cards 'player' should consider playing as the k-th card of the trick, in the order they should be tried.
+
+		The seat leads first the cards nobody can beat, then his trumps (highest first) and then his other cards (lowest first). When following he first tries the cheapest card that wins the trick whatever the players after him play, then the other winning cards (highest first) and then the others (lowest first).
+
+		The other players try first to keep the trick out of the seat's reach: while he has yet to play, with the cards he can not beat (cheapest first), and once he has played and is winning the trick, with the cheapest cards that beat his (or with their cheapest cards if a player after them can beat it too). When the trick is already lost to the seat they discard their cheapest cards first.
+		'''
+
+		numPlayers = self.numPlayers
+		trump = self.trump
+
+		winners, losers = self._candidates( player, led, bestPower, tableMask )
+
+		cheap = lambda card : ( card // NUM_RANKS == trump, card % NUM_RANKS )
+
+		if player == seat :
+
+			if k == 0 :
+
+				return self._leads( seat, winners )
+
+			threat = 0		# The most powerful card the players after the seat can play
+
+			for j in range( k + 1, numPlayers ) :
+
+				threat = max( threat, self._top( ( leader + j ) % numPlayers, led ) )
+
+			power = POWER[ trump ][ led ]
+
+			winners.sort( key = power.__getitem__, reverse = True )
+
+			safe = [ card for card in winners if power[ card ] > threat ]
+
+			if safe :		# The cheapest card that wins the trick for sure goes first
+
+				winners.remove( safe[-1] )
+				winners.insert( 0, safe[-1] )
+
+			losers.sort( key = cheap )
+
+			return winners + losers
+
+		if ( seat - leader ) % numPlayers > k :		# The seat has yet to play to this trick: try to play a card he can not beat as cheaply as possible
+
+			return self._blockersFirst( seat, led, bestPower, winners + losers )
+
+		if bestSeat == seat :		# The seat has played and is winning the trick: try to beat it as cheaply as possible
+
+			power = POWER[ trump ][ led ]
+
+			winners.sort( key = power.__getitem__ )
+			losers.sort( key = cheap )
+
+			for j in range( k + 1, numPlayers ) :
+
+				if self._top( ( leader + j ) % numPlayers, led ) > bestPower :		# A player after him can beat the seat too: keep the high cards
+
+					return losers + winners
+
+			return winners + losers
+
+		# The seat has played and has lost the trick already: try the cheapest cards first
+
+		cards = winners + losers
+
+		cards.sort( key = cheap )
+
+		return cards
+
+
+	def _leads( self, seat, cards ) :
+
+		'''
+		Arranges the cards the seat may lead (see _ordered()).
+		'''
+
+		trump = self.trump
+
+		others = self.remaining & ~self.hands[ seat ]
+
+		sure = []
+		trumps = []
+		rest = []
+
+		for card in cards :
+
+			suit = card // NUM_RANKS
+
+			if suit == trump :
+
+				trumps.append( card )
+
+			elif not ( others & SUIT_MASK[ suit ] ) >> card and self._unruffed( seat, suit ) :
+
+				sure.append( card )
+
+			else :
+
+				rest.append( card )
+
+		if trumps and not ( others & SUIT_MASK[ trump ] ) >> trumps[-1] :
+
+			sure.append( trumps.pop() )
+
+		trumps.reverse()
+
+		rest.sort( key = lambda card : card % NUM_RANKS )
+
+		return sure + trumps + rest
+
+
+	def _unruffed( self, seat, suit ) :
+
+		'''
+		Returns whether none of the other players can ruff a lead of 'suit', i.e. all of them either hold a card of the suit or no trump.
+		'''
+
+		trump = self.trump
+
+		if trump == NO_SUIT :
+
+			return True
+
+		for player in range( self.numPlayers ) :
+
+			hand = self.hands[ player ]
+
+			if player != seat and not hand & SUIT_MASK[ suit ] and hand & SUIT_MASK[ trump ] :
+
+				return False
+
+		return True
+
+
+	def _candidates( self, player, led, bestPower = -1, tableMask = 0 ) :
+
+		'''
+		Returns the cards 'player' should consider playing, that is one card of each sequence of touching ranks among his legal cards, as a tuple of the lists of cards that win the trick so far and of those that do not (in increasing order of the card indices).
+		'''
+
+		hand = self.hands[ player ]
+
+		legal = hand & SUIT_MASK[ led ]
+
+		if not legal :
+
+			legal = hand
+
+
+		# Cards that are still live (in another player's hand or on the table) separate sequences:
+
+		others = ( self.remaining & ~hand ) | tableMask
+
+		power = POWER[ self.trump ][ led ] if led != NO_SUIT else None
+
+		winners = []
+		losers = []
+
+		previous = -1
+
+		while legal :
+
+			low = legal & -legal		# Isolate the lowest legal card
+
+			legal ^= low
+
+			card = low.bit_length() - 1
+
+			if previous >= 0 and previous // NUM_RANKS == card // NUM_RANKS and not others & ( low - ( 2 << previous ) ) :		# Touches the previous card so playing it is equivalent
+
+				previous = card
+
+				continue
+
+			previous = card
+
+			if power is None or power[ card ] > bestPower :
+
+				winners.append( card )
+
+			else :
+
+				losers.append( card )
+
+		return winners, losers
+
+
+	def _top( self, player, led ) :
+
+		'''
+		Returns the power of the most powerful legal card of 'player' in a trick where suit 'led' was led (0 if he holds neither a card of the suit nor a trump).
+		'''
+
+		hand = self.hands[ player ]
+
+		follow = hand & SUIT_MASK[ led ]
+
+		if follow :
+
+			return POWER[ self.trump ][ led ][ follow.bit_length() - 1 ]		# The highest card of the suit led is its most powerful
+
+		if self.trump != NO_SUIT and hand & SUIT_MASK[ self.trump ] :
+
+			return POWER[ self.trump ][ led ][ ( hand & SUIT_MASK[ self.trump ] ).bit_length() - 1 ]
+
+		return 0
+
+
+	def _blockersFirst( self, seat, led, bestPower, cards ) :
+
+		'''
+		Arranges 'cards' for a player before the seat in the trick: the cards that the seat can not beat, cheapest first, followed by the others (lowest first). Non-trumps come before trumps among cards of the same rank.
+		'''
+
+		trump = self.trump
+
+		if led == NO_SUIT :		# Leading: the card decides the suit led
+
+			tops = [ self._top( seat, suit ) for suit in range( NUM_SUITS ) ]
+
+			blockers = [ card for card in cards if POWER[ trump ][ card // NUM_RANKS ][ card ] > tops[ card // NUM_RANKS ] ]
+
+		else :
+
+			top = self._top( seat, led )
+
+			if bestPower > top :		# The trick is already out of the seat's reach
+
+				blockers = []
+
+			else :
+
+				power = POWER[ trump ][ led ]
+
+				blockers = [ card for card in cards if power[ card ] > top ]
+
+		rest = [ card for card in cards if card not in blockers ]
+
+		cheap = lambda card : ( card // NUM_RANKS == trump, card % NUM_RANKS )
+
+		blockers.sort( key = cheap )
+		rest.sort( key = cheap )
+
+		return blockers + rest
@@ -0,0 +1,121 @@
+# Copyright 2013 Abid Hasan Mujtaba
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+# Author: Abid H. Mujtaba
+
+# This file implements a hashed timer wheel used to keep the turn clocks of a large number of tables (see server.GameServer) with a single scheduler task.
+#
+# Time is divided into ticks and the wheel into 'size' slots, a deadline falling in tick t being kept in slot t % size. Scheduling and cancelling a deadline are O(1) (a dictionary insertion or deletion) whatever the number of deadlines pending. Every tick the scheduler only looks at the one slot whose turn has come, firing the deadlines in it that are due and leaving those that are one or more turns of the wheel away.
+
+
+import math
+import time
+
+
+
+class TimerWheel :
+
+	'''
+	Hashed timer wheel of deadlines identified by keys (each key has at most one deadline).
+
+	tick: <FLOAT> Resolution of the wheel in seconds. Deadlines fire at the end of the tick they fall in.
+
+	size: <INT> Number of slots. Deadlines up to tick * size seconds away are found in a single turn of the wheel.
+
+	Example:
+
+	wheel = TimerWheel( 0.1 )
+	wheel.schedule( tableId, time.monotonic() + 30 )
+	...
+	for tableId in wheel.expire( time.monotonic() ) :		# Called every tick
+		...
+	'''
+
+	def __init__( self, tick = 0.1, size = 1024, now = None ) :
+
+		self.tick = tick
+		self.size = size
+
+		self._slots = [ {} for ii in range( size ) ]		# Each maps the keys whose deadlines fall in the slot to their tick
+		self._where = {}		# Maps every pending key to its slot
+
+		self._current = int( math.floor( ( time.monotonic() if now is None else now ) / tick ) )		# The last tick processed
+
+
+	def __len__( self ) :
+
+		return len( self._where )
+
+
+	def __contains__( self, key ) :
+
+		return key in self._where
+
+
+	def schedule( self, key, deadline ) :
+
+		'''
+		Schedules (or reschedules) the deadline of 'key' at time 'deadline' (in seconds, on the clock passed to expire()).
+		'''
+
+		self.cancel( key )
+
+		t = max( int( math.ceil( deadline / self.tick ) ), self._current + 1 )		# Deadlines in the past fire on the next tick
+
+		slot = t % self.size
+
+		self._slots[ slot ][ key ] = t
+		self._where[ key ] = slot
+
+
+	def cancel( self, key ) :
+
+		'''
+		Cancels the deadline of 'key' if it has one.
+		'''
+
+		slot = self._where.pop( key, None )
+
+		if slot is not None :
+
+			del self._slots[ slot ][ key ]
+
+
+	def expire( self, now ) :
+
+		'''
+		Advances the wheel to time 'now' and returns the list of the keys whose deadlines have passed (they are removed from the wheel).
+		'''
+
+		target = int( math.floor( now / self.tick ) )
+
+		fired = []
+
+		for t in range( self._current + 1, min( target, self._current + self.size ) + 1 ) :		# Each slot is visited at most once
+
+			slot = self._slots[ t % self.size ]
+
+			due = [ key for key, when in slot.items() if when <= target ]
+
+			for key in due :
+
+				del slot[ key ]
+				del self._where[ key ]
+
+			fired.extend( due )
+
+		self._current = max( self._current, target )
+
+		return fired
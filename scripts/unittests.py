@@ -18,9 +18,31 @@
 
 # This file implements Unit tests for the various classes and functions in the Blackout scripts
 
+import itertools
+import logging
+import random
+import sys
 import unittest
+from math import comb
 from cards import *		# import all classes and enumerations that simulate playing cards
 from blackout import *		# import all classes and functions from blackout.py
+import simulate		# the headless simulator
+from solver import DoubleDummy, SearchLimitError		# the double-dummy solver
+from advisor import BidAdvisor, signature		# the Monte Carlo bid advisor
+from advisor import BidTable, buildBidTable, handClass, NUM_CLASSES		# the offline bid table
+from eventlog import EventLog, BID, DEAL_FROM, EVAL_TRICK, _LOG_HEADER		# the event-sourced game log
+from archive import ArchiveWriter, ArchiveReader		# the columnar archive of finished games
+from registry import GameRegistry		# the registry of live games
+from server import GameServer		# the asyncio push server
+import server
+from timerwheel import TimerWheel		# the timer wheel of the turn clocks
+from shards import Supervisor, WorkerError		# the sharded multi-process hosting
+import benchmarks		# the benchmark suite
+import instrument		# the optional instrumentation of the kernel
+import blackout		# the NumPy switch of the kernel
+import sampler		# the NumPy switch of the sampler
+from sampler import HandSampler		# the sampler of hidden hands
+from unittest import mock
 
 class testBlackout( unittest.TestCase ) :
 
@@ -79,39 +101,20 @@ class testBlackout( unittest.TestCase ) :
 		self.assertEqual( str(d), '<Suit: Diamond>' )
 
 
-		# Verify trump = False initially:
-
-		for item in [s, h, c, d] :
-
-			self.assertEqual( item.trump, False )
-			self.assertEqual( item.led, False )
-
-
 		# Declare new variable with same suit:
 
 		s2 = Suit.Spade
 
 		self.assertEqual( s, s2 )
-
-		# Change value of trump:
-
-		Suit.Spade.trump = True
-
-		
-		# Verify that this change now effects all variables containing Suit.Spade
-
-		self.assertEqual( s.trump, True )
-		self.assertEqual( s2.trump, True ) 
+		self.assertTrue( s is s2 )
 
 
-		# Same for led:
+		# The shared suits must not carry any game state (trump or led):
 
-		h2 = Suit.Heart
-
-		Suit.Heart.led = True
+		for item in [s, h, c, d] :
 
-		self.assertEqual( h.led, True )
-		self.assertEqual( h2.led, True )
+			self.assertFalse( hasattr( item, 'trump' ) )
+			self.assertFalse( hasattr( item, 'led' ) )
 
 	
 
@@ -183,38 +186,2173 @@ class testBlackout( unittest.TestCase ) :
 
 		# Declare club to trump:
 
-		Suit.Club.trump = True
+		p = Precedence( trump = Suit.Club )
 
-		self.assertEqual( sQ > c3, False )
-		self.assertEqual( c3 > sQ, True )
-		self.assertEqual( c3 > h7, True )
-		self.assertEqual( c3 > d9, True )
+		self.assertEqual( sQ.beats( c3, p ), False )
+		self.assertEqual( c3.beats( sQ, p ), True )
+		self.assertEqual( c3.beats( h7, p ), True )
+		self.assertEqual( c3.beats( d9, p ), True )
 
-		self.assertEqual( c3 > cJ, False )
-		self.assertEqual( cJ > c3, True )
+		self.assertEqual( c3.beats( cJ, p ), False )
+		self.assertEqual( cJ.beats( c3, p ), True )
 
 
-		# Declare space to have been led :
+		# Declare spade to have been led :
 
-		Suit.Spade.led = True
+		p.led = Suit.Spade
 
-		self.assertEqual( s3 > sQ, False )
-		self.assertEqual( sQ > s3, True )
+		self.assertEqual( s3.beats( sQ, p ), False )
+		self.assertEqual( sQ.beats( s3, p ), True )
 
-		self.assertEqual( s3 > h7, True )
-		self.assertEqual( s3 > d9, True )
+		self.assertEqual( s3.beats( h7, p ), True )
+		self.assertEqual( s3.beats( d9, p ), True )
 
-		self.assertEqual( s3 > c3, False )
-		self.assertEqual( c3 > sQ, True )
+		self.assertEqual( s3.beats( c3, p ), False )
+		self.assertEqual( c3.beats( sQ, p ), True )
+
+
+		# The plain comparison operator is unaffected by any game's precedence context:
+
+		self.assertEqual( c3 > sQ, False )
+		self.assertEqual( s3 > h7, False )
+
+	
+
+	def testIntegerCore( self ) :
+
+		'''
+		Unit Test for the integer card core: card identities, the BEATS tables and trickWinner().
+		'''
+
+		# Card identities match the deck order with suit = index // 13 and rank = index % 13:
+
+		self.assertEqual( Card( Suit.Spade, Rank.Two ).index, 0 )
+		self.assertEqual( Card( Suit.Heart, Rank.Two ).index, 13 )
+		self.assertEqual( Card( Suit.Diamond, Rank.Ace ).index, 51 )
+
+		self.assertEqual( suitOf( 30 ), Suit.Club.index )
+		self.assertEqual( rankOf( 30 ), Rank.Six.index )
+
+
+		# The tables agree with the rules of precedence for every combination of trump and led suits:
+
+		for trump in range( NUM_SUITS + 1 ) :
+
+			for led in range( NUM_SUITS + 1 ) :
+
+				for a in range( NUM_CARDS ) :
 
+					for b in range( NUM_CARDS ) :
 
-		# Clear trump and led for later tests:
+						if suitOf( a ) == suitOf( b ) :
 
-		Suit.Club.trump = False
-		Suit.Spade.led = False 
+							expected = rankOf( a ) > rankOf( b )
+
+						elif trump in ( suitOf( a ), suitOf( b ) ) :
+
+							expected = suitOf( a ) == trump
+
+						else :
+
+							expected = suitOf( a ) == led
+
+						self.assertEqual( beats( a, b, trump, led ), expected )
+
+
+		# Trick resolution:
+
+		s3, sQ, h7, c3 = 1, 10, 18, 27
+
+		self.assertEqual( trickWinner( [ s3, h7, sQ ] ), 2 )		# Highest of the suit led
+		self.assertEqual( trickWinner( [ h7, sQ, s3 ] ), 0 )		# Nobody followed suit
+		self.assertEqual( trickWinner( [ sQ, c3, s3 ], Suit.Club.index ), 1 )		# Trumped
+		self.assertEqual( trickWinner( [ c3 ], Suit.Heart.index ), 0 )
+
+	
+
+	def testDeck( self ) :
+
+		'''
+		Tests that all games share the single immutable deck.
+		'''
+
+		self.assertEqual( [ card.index for card in DECK ], list( range( NUM_CARDS ) ) )
+
+		self.assertTrue( Blackout( 4 ).Deck is Blackout( 6 ).Deck )
+
+		self.assertRaises( AttributeError, setattr, DECK[0], 'Suit', Suit.Heart )		# Cards are immutable
+		self.assertRaises( AttributeError, setattr, DECK[0], 'owner', 1 )		# No per-instance dictionary
+
+		self.assertEqual( str( DECK[ 51 ] ), '<Card:  Diamond A>' )
 
 	
 
+	def testPrecedencePerGame( self ) :
+
+		'''
+		Verifies that the trump and led suits belong to each game and that two games in the same process do not interfere with each other.
+		'''
+
+		BC1 = Blackout( 4 )
+		BC2 = Blackout( 4 )
+
+		BC1.Deal()
+		BC2.Deal()
+
+		self.assertTrue( BC1.precedence is not BC2.precedence )
+
+		self.assertTrue( BC1.precedence.trump is BC1.TrumpCard.Suit )
+		self.assertTrue( BC2.precedence.trump is BC2.TrumpCard.Suit )
+
+
+		# Forcing a different trump in one game leaves the other untouched:
+
+		other = [ s for s in ( Suit.Spade, Suit.Heart, Suit.Club, Suit.Diamond ) if s is not BC2.trump ][0]
+
+		BC1.precedence.trump = other
+
+		self.assertTrue( BC2.precedence.trump is BC2.TrumpCard.Suit )
+
+
+		# Clearing between rounds only affects the game itself:
+
+		BC1.clearRound()
+
+		self.assertEqual( BC1.precedence.trump, None )
+		self.assertTrue( BC2.precedence.trump is BC2.TrumpCard.Suit )
+
+
+
+	def testEvalTrick( self ) :
+
+		'''
+		Tests that evalTrick() finds the winner of the current trick and prepares the game for the next trick.
+		'''
+
+		BC = Blackout( 4 )
+
+		BC.Deal()
+
+		BC.precedence.trump = Suit.Club
+		BC.precedence.led = Suit.Spade
+
+		BC.currentTrick = [ 18, 1, 10, 27 ]		# Seat 0: Heart 7, Seat 1: Spade 3 (led), Seat 2: Spade Q, Seat 3: Club 3 (trump)
+
+		self.assertEqual( BC.evalTrick(), 3 )
+
+		self.assertEqual( BC.Leader, 3 )
+		self.assertEqual( BC.Current, 3 )
+		self.assertEqual( BC.currentTrick, [ None ] * 4 )
+		self.assertEqual( BC.precedence.led, None )
+		self.assertTrue( BC.precedence.trump is Suit.Club )
+
+		self.assertEqual( [ BC.tricks( ii ) for ii in range(4) ], [ [0], [0], [0], [1] ] )
+
+
+
+	def testEvalTricks( self ) :
+
+		'''
+		Tests that the batched evalTricks() agrees with resolving each trick on its own.
+		'''
+
+		from random import Random
+
+		rng = Random( 2013 )
+
+		played, trump, led, expected = [], [], [], []
+
+		for ii in range( 500 ) :
+
+			cards = rng.sample( range( NUM_CARDS ), 5 )
+			first = rng.randrange( 5 )		# Seat that led the trick
+
+			played.append( cards )
+			trump.append( rng.randrange( NUM_SUITS + 1 ) )
+			led.append( suitOf( cards[ first ] ) )
+
+			order = list( circGen( 5, first ) )
+
+			expected.append( order[ trickWinner( [ cards[ seat ] for seat in order ], trump[-1] ) ] )
+
+		self.assertEqual( list( evalTricks( played, trump, led ) ), expected )
+
+
+		# A single trump and led suit may be given for the whole batch:
+
+		self.assertEqual( list( evalTricks( [ [ 1, 10, 27 ], [ 10, 1, 18 ] ], Suit.Club.index, Suit.Spade.index ) ), [ 2, 0 ] )
+
+
+		# The fallback without NumPy gives the same winners:
+
+		with mock.patch.object( blackout, 'numpy', None ) :
+
+			self.assertEqual( evalTricks( played, trump, led ), expected )
+			self.assertEqual( evalTricks( [ [ 1, 10, 27 ], [ 10, 1, 18 ] ], Suit.Club.index, Suit.Spade.index ), [ 2, 0 ] )
+
+
+
+	def testHands( self ) :
+
+		'''
+		Tests that the hands dealt are disjoint masks of the correct size.
+		'''
+
+		BC = Blackout( 5 )
+
+		BC.numTricks = 7
+
+		BC.Deal()
+
+		dealt = 0
+
+		for ii in range( 5 ) :
+
+			self.assertEqual( countOf( BC.Hand[ii] ), 7 )
+			self.assertEqual( BC.hand( ii ), cardsOf( BC.Hand[ii] ) )
+
+			self.assertEqual( dealt & BC.Hand[ii], 0 )		# No card is dealt twice
+
+			dealt |= BC.Hand[ii]
+
+		self.assertEqual( dealt >> BC.TrumpCard.index & 1, 0 )		# The trump card is not in anyone's hand
+
+		self.assertEqual( maskOf( cardsOf( dealt ) ), dealt )
+
+
+
+	def testDealMany( self ) :
+
+		'''
+		Tests that bulk deals are reproducible and identical to dealing each permutation in a game.
+		'''
+
+		shuffled, hands, trump = dealMany( 50, 5, 4, dealer = 3, seed = 42 )
+
+		again = dealMany( 50, 5, 4, dealer = 3, seed = 42 )
+
+		self.assertEqual( [ list( row ) for row in again[0] ], [ list( row ) for row in shuffled ] )
+
+		BC = Blackout( 5 )
+
+		BC.numTricks = 4
+		BC.Dealer = 3
+
+		for ii in range( 50 ) :
+
+			self.assertEqual( sorted( shuffled[ii] ), list( range( NUM_CARDS ) ) )
+
+			BC.Deal( list( shuffled[ii] ) )
+
+			self.assertEqual( [ int( hand ) for hand in hands[ii] ], BC.Hand )
+			self.assertEqual( int( trump[ii] ), BC.TrumpCard.index )
+
+			self.assertEqual( countOf( BC.Hand[4] ), 4 )
+
+
+		# The fallback without NumPy deals the same permutations into the same hands. The two paths draw from different generators, so the fallback replays the permutations drawn with NumPy:
+
+		class Replay( random.Random ) :
+
+			def __init__( self, rows ) :
+
+				random.Random.__init__( self )
+
+				self.rows = iter( rows )
+
+			def shuffle( self, deck ) :
+
+				deck[:] = [ int( card ) for card in next( self.rows ) ]
+
+		with mock.patch.object( blackout, 'numpy', None ) :
+
+			fallback = dealMany( 50, 5, 4, dealer = 3, seed = Replay( shuffled ) )
+
+		self.assertEqual( fallback[0], [ [ int( card ) for card in row ] for row in shuffled ] )
+		self.assertEqual( fallback[1], [ [ int( hand ) for hand in row ] for row in hands ] )
+		self.assertEqual( fallback[2], [ int( card ) for card in trump ] )
+
+
+
+	def testMove( self ) :
+
+		'''
+		Tests the validation of moves and legalMoves().
+		'''
+
+		BC = Blackout( 3 )
+
+		BC.Deal()
+
+		BC.Hand = [ maskOf( [ 5, 20 ] ), maskOf( [ 1, 40 ] ), maskOf( [ 30, 45 ] ) ]		# Player 1 (the leader) holds a spade and a diamond, player 2 holds no spades
+
+		self.assertEqual( BC.legalMoves( 1 ), BC.Hand[1] )		# The leader can play anything
+
+		self.assertFalse( BC.Move( 1, 5 ) )		# Player 1 does not hold this card
+
+		self.assertTrue( BC.Move( 1, 1 ) )		# Leads the spade 3
+
+		self.assertTrue( BC.precedence.led is Suit.Spade )
+		self.assertEqual( BC.hand( 1 ), [ 40 ] )
+
+
+		self.assertEqual( cardsOf( BC.legalMoves( 2 ) ), [ 30, 45 ] )		# Cannot follow suit so anything is legal
+
+		self.assertTrue( BC.Move( 2, 45 ) )
+
+
+		self.assertEqual( cardsOf( BC.legalMoves( 0 ) ), [ 5 ] )		# Must follow suit
+
+		self.assertFalse( BC.Move( 0, 20 ) )		# Not following suit when able to
+
+		self.assertTrue( BC.Move( 0, 5 ) )
+
+
+		self.assertEqual( BC.currentTrick, [ 5, 1, 45 ] )
+
+
+
+	def testApplyUndo( self ) :
+
+		'''
+		Tests that applyMove()/undoMove() and applyBid()/undoBid() agree with Move()/evalTrick() and Bid() and restore the state exactly.
+		'''
+
+		def state( game ) :
+
+			return ( list( game.Hand ), list( game.Bids ), list( game.Tricks ), list( game.currentTrick ), game.Bidder, game.Current, game.Leader, game.precedence.led, game.Played, list( game.Remaining ), list( game.Voids ) )
+
+		rng = random.Random( 3 )
+
+		for numPlayers in range( 3, 7 ) :
+
+			BC = Blackout( numPlayers, rng = random.Random( numPlayers ) )
+			BC.numTricks = BC.maxTricks
+
+			BC.Deal()
+
+			ref = Blackout( numPlayers )
+			ref.numTricks = BC.numTricks
+			ref.Hand = list( BC.Hand )
+			ref.precedence.trump = BC.precedence.trump
+
+			history = []
+
+			for ii in range( numPlayers ) :
+
+				history.append( state( BC ) )
+
+				bid = rng.choice( BC.legalBids( BC.Bidder ) )
+
+				self.assertTrue( ref.Bid( ref.Bidder, bid ) )
+
+				BC.applyBid( BC.Bidder, bid )
+
+			while BC.Hand[ BC.Current ] :
+
+				history.append( state( BC ) )
+
+				player = BC.Current
+				card = rng.choice( cardsOf( BC.legalMoves( player ) ) )
+
+				self.assertTrue( ref.Move( player, card ) )
+
+				if ref.Current == ref.Leader :
+
+					ref.evalTrick()
+
+				BC.applyMove( player, card )
+
+				self.assertEqual( state( BC ), state( ref ) )
+
+			for ii in range( BC.numTricks * numPlayers ) :
+
+				BC.undoMove()
+
+				self.assertEqual( state( BC ), history.pop() )
+
+			for ii in range( numPlayers ) :
+
+				BC.undoBid()
+
+				self.assertEqual( state( BC ), history.pop() )
+
+
+		# A search started in the middle of a trick played with Move():
+
+		BC = Blackout( 4, rng = random.Random( 21 ) )
+		BC.numTricks = 3
+
+		BC.Deal()
+
+		for player in circGen( 4, BC.Leader ) :
+
+			BC.Bid( player, BC.legalBids( player )[0] )
+
+		BC.Move( BC.Current, cardsOf( BC.legalMoves( BC.Current ) )[0] )
+
+		start = BC.toBytes()
+
+		for ii in range( 7 ) :		# Complete the trick and play another one
+
+			BC.applyMove( BC.Current, cardsOf( BC.legalMoves( BC.Current ) )[ -1 ] )
+
+		for ii in range( 7 ) :
+
+			BC.undoMove()
+
+		self.assertEqual( BC.toBytes(), start )
+
+
+
+	def testTracker( self ) :
+
+		'''
+		Tests that the card tracker (played cards, remaining cards per suit and voids) agrees with a rescan of the tricks played.
+		'''
+
+		rng = random.Random( 6 )
+
+		for validation in ( STRICT, OFF ) :
+
+			BC = Blackout( 4, rng = random.Random( 11 ), validation = validation )
+			BC.numTricks = BC.maxTricks
+
+			BC.Deal()
+
+			for player in circGen( 4, BC.Leader ) :
+
+				BC.Bid( player, BC.legalBids( player )[0] )
+
+			played = []
+			voids = [ set() for ii in range( 4 ) ]
+
+			self.assertEqual( BC.unseen( 0 ), FULL_MASK & ~BC.Hand[0] & ~( 1 << BC.TrumpCard.index ) )
+
+			for trick in range( BC.numTricks ) :
+
+				for player in circGen( 4, BC.Leader ) :
+
+					card = rng.choice( cardsOf( BC.legalMoves( player ) ) )
+
+					if player != BC.Leader and card // NUM_RANKS != BC.precedence.ledIndex :
+
+						voids[ player ].add( BC.precedence.ledIndex )
+
+					self.assertTrue( BC.Move( player, card ) )
+
+					played.append( card )
+
+					self.assertEqual( BC.Played, maskOf( played ) )
+					self.assertEqual( BC.Remaining, [ NUM_RANKS - len( [ c for c in played if c // NUM_RANKS == suit ] ) for suit in range( NUM_SUITS ) ] )
+					self.assertEqual( [ set( suit for suit in range( NUM_SUITS ) if BC.isVoid( seat, suit ) ) for seat in range( 4 ) ], voids )
+
+					self.assertFalse( BC.unseen( player ) & ( BC.Played | BC.Hand[ player ] ) )
+
+				BC.evalTrick()
+
+			self.assertEqual( countOf( BC.Played ), 4 * BC.numTricks )
+
+			self.assertTrue( any( BC.Voids ) )		# The test would not show that the voids are cleared otherwise
+
+			BC.postRound()		# The end of the round clears the tracker, so that nothing sees the voids of the finished round
+
+			self.assertEqual( ( BC.Played, BC.Remaining, BC.Voids ), ( 0, [ NUM_RANKS ] * NUM_SUITS, [ 0 ] * 4 ) )
+			self.assertEqual( Blackout.fromBytes( BC.toBytes() ).Voids, [ 0 ] * 4 )
+
+			BC.Deal()		# And so does a new round
+
+			self.assertEqual( ( BC.Played, BC.Remaining, BC.Voids ), ( 0, [ NUM_RANKS ] * NUM_SUITS, [ 0 ] * 4 ) )
+
+
+
+	def testSampler( self ) :
+
+		'''
+		Tests that the hidden hands sampled for a player are consistent with everything he has seen and uniformly distributed.
+		'''
+
+		BC = Blackout( 4, rng = random.Random( 11 ) )
+		BC.numTricks = BC.maxTricks
+
+		BC.Deal()
+
+		for player in circGen( 4, BC.Leader ) :
+
+			BC.Bid( player, BC.legalBids( player )[0] )
+
+		rng = random.Random( 5 )
+
+		while not any( BC.Voids[ 1: ] ) :		# Play until one of the other players shows a void
+
+			for player in circGen( 4, BC.Leader ) :
+
+				BC.Move( player, rng.choice( cardsOf( BC.legalMoves( player ) ) ) )
+
+			BC.evalTrick()
+
+		voids = [ ( seat, suit ) for seat in range( 1, 4 ) for suit in range( NUM_SUITS ) if BC.isVoid( seat, suit ) ]
+
+		self.assertEqual( len( voids ), 1 )
+
+		seat, suit = voids[0]
+
+		sampler = HandSampler( BC, 0 )
+
+		unseen = BC.unseen( 0 )
+		numUnseen = countOf( unseen )
+		numSuit = countOf( unseen & SUIT_MASK[ suit ] )
+		needs = [ countOf( BC.Hand[ other ] ) for other in range( 4 ) ]
+
+
+		# One void player takes his cards from the other suits and the others share the rest:
+
+		free = [ needs[ other ] for other in range( 1, 4 ) if other != seat ]
+
+		numDeals = comb( numUnseen - numSuit, needs[ seat ] ) * comb( numUnseen - needs[ seat ], free[0] ) * comb( numUnseen - needs[ seat ] - free[0], free[1] )
+
+		self.assertEqual( sampler.numDeals, numDeals )
+
+
+		def check( hands ) :
+
+			hands = [ int( hand ) for hand in hands ]
+
+			self.assertEqual( hands[0], BC.Hand[0] )
+			self.assertEqual( [ countOf( hand ) for hand in hands ], needs )
+			self.assertEqual( countOf( maskOf( card for hand in hands[ 1: ] for card in cardsOf( hand ) ) & unseen ), sum( needs[ 1: ] ) )		# Disjoint and unseen
+			self.assertFalse( hands[ seat ] & SUIT_MASK[ suit ] )
+
+		for ii in range( 50 ) :
+
+			check( sampler.sample( rng ) )
+
+		deals = sampler.sampleMany( 4000, 1 )
+
+		for hands in deals :
+
+			check( hands )
+
+		self.assertEqual( len( sampler.sampleMany( 0, 1 ) ), 0 )
+
+
+		# Every card of the suit is as likely to be held by each player who can hold it, and so is every card of the other suits:
+
+		inSuit = cardsOf( unseen & SUIT_MASK[ suit ] )[0]
+		outSuit = cardsOf( unseen & ~SUIT_MASK[ suit ] )[0]
+
+		other = [ other for other in range( 1, 4 ) if other != seat ][0]
+
+		def frequency( holder, card ) :
+
+			return sum( 1 for hands in deals if ( int( hands[ holder ] ) >> card ) & 1 ) / float( len( deals ) )
+
+		self.assertAlmostEqual( frequency( seat, outSuit ), needs[ seat ] / float( numUnseen - numSuit ), delta = 0.03 )
+		self.assertAlmostEqual( frequency( other, inSuit ), needs[ other ] / float( numUnseen - needs[ seat ] ), delta = 0.03 )
+		self.assertAlmostEqual( frequency( other, outSuit ), ( 1 - needs[ seat ] / float( numUnseen - numSuit ) ) * needs[ other ] / float( numUnseen - needs[ seat ] ), delta = 0.03 )
+
+
+
+	def testSamplerVoidGroups( self ) :
+
+		'''
+		Tests the sampler against every consistent deal of a position with several void groups, with and without NumPy.
+		'''
+
+		BC = Blackout( 8, rng = random.Random( 8 ) )
+		BC.numTricks = BC.maxTricks
+
+		BC.Deal()
+
+		for player in circGen( 8, BC.Leader ) :
+
+			BC.Bid( player, BC.legalBids( player )[0] )
+
+		rng = random.Random( 8 )
+
+		while countOf( BC.Hand[0] ) > 1 :		# Play to the last trick, when several players have shown voids
+
+			for player in circGen( 8, BC.Leader ) :
+
+				BC.Move( player, rng.choice( cardsOf( BC.legalMoves( player ) ) ) )
+
+			BC.evalTrick()
+
+		hidden = HandSampler( BC, 0 )
+
+		self.assertTrue( len( [ cards for cards in hidden.cards if cards ] ) >= 3 )		# Cards void for two different sets of players and cards void for nobody
+		self.assertTrue( hidden.numVoid >= 2 )
+
+
+		# Enumerate every deal of the unseen cards consistent with the voids:
+
+		def deals( seats, pool ) :
+
+			if not seats :
+
+				yield ()
+
+				return
+
+			seat = seats[0]
+
+			allowed = [ card for card in pool if not BC.isVoid( seat, card // NUM_RANKS ) ]
+
+			for cards in itertools.combinations( allowed, countOf( BC.Hand[ seat ] ) ) :
+
+				for rest in deals( seats[ 1: ], [ card for card in pool if card not in cards ] ) :
+
+					yield ( maskOf( cards ), ) + rest
+
+		consistent = set( deals( list( range( 1, 8 ) ), cardsOf( BC.unseen( 0 ) ) ) )
+
+		self.assertEqual( hidden.numDeals, len( consistent ) )
+
+
+		def chiSquare( samples ) :		# Of the counts of every consistent deal against the uniform distribution
+
+			counts = {}
+
+			for hands in samples :
+
+				hands = tuple( int( hand ) for hand in hands )
+
+				self.assertEqual( hands[0], BC.Hand[0] )
+				self.assertIn( hands[ 1: ], consistent )
+
+				counts[ hands[ 1: ] ] = counts.get( hands[ 1: ], 0 ) + 1
+
+			expected = len( samples ) / float( len( consistent ) )
+
+			return sum( ( counts.get( deal, 0 ) - expected ) ** 2 / expected for deal in consistent )
+
+		bound = len( consistent ) + 6 * ( 2.0 * len( consistent ) ) ** 0.5		# 6 standard deviations above the mean of the statistic
+
+		self.assertTrue( chiSquare( [ hidden.sample( rng ) for ii in range( 20000 ) ] ) < bound )
+
+		if sampler.numpy is not None :
+
+			self.assertTrue( chiSquare( hidden.sampleMany( 100000, 3 ) ) < bound )
+
+		with mock.patch.object( sampler, 'numpy', None ) :
+
+			deals = hidden.sampleMany( 500, 3 )
+
+			self.assertTrue( isinstance( deals, list ) )
+			self.assertEqual( deals, hidden.sampleMany( 500, random.Random( 3 ) ) )
+
+			chiSquare( deals )		# Only checks that the deals are consistent
+
+
+
+	def testSnapshot( self ) :
+
+		'''
+		Tests that toBytes()/fromBytes() round-trip the state of a game at every stage of play.
+		'''
+
+		def state( game ) :
+
+			return ( game.version, game.numPlayers, game.maxTricks, game.Round, game.Dealer, game.Bidder, game.Current, game.Leader, game.numTricks, game.TrumpCard, game.trump, game.precedence.trump, game.precedence.led, game.ledSuit, game.Hand, game.currentTrick, game.Bids, game.Tricks, game.Points )
+
+		def tracker( game ) :
+
+			return ( game.Played, game.Remaining, game.Voids )
+
+		def check( game ) :
+
+			data = game.toBytes()
+
+			self.assertEqual( len( data ), 24 + 10 * game.numPlayers + 3 * game.numRounds * game.numPlayers )
+
+			self.assertEqual( state( Blackout.fromBytes( data ) ), state( game ) )
+
+			self.assertEqual( tracker( Blackout.fromBytes( data ) ), tracker( game ) )
+
+			if previous :
+
+				self.assertEqual( game.version, Blackout.fromBytes( previous[0] ).version + 1 )
+
+			previous[:] = [ data ]
+
+		previous = []
+
+		BC = Blackout( 5, rng = random.Random( 8 ) )
+
+		check( BC )
+
+		self.assertEqual( len( BC.toBytes() ), 269 )
+
+		rng = random.Random( 4 )
+
+		while not BC.isOver() :
+
+			BC.Deal()
+
+			check( BC )
+
+			for ii in range( BC.numPlayers ) :
+
+				BC.Bid( BC.Bidder, rng.choice( BC.legalBids( BC.Bidder ) ) )
+
+				check( BC )
+
+			for ii in range( BC.numTricks ) :
+
+				for jj in range( BC.numPlayers ) :
+
+					BC.Move( BC.Current, rng.choice( cardsOf( BC.legalMoves( BC.Current ) ) ) )
+
+					check( BC )
+
+				BC.evalTrick()
+
+				check( BC )
+
+			BC.postRound()
+
+			check( BC )
+
+
+		data = BC.toBytes()
+
+		self.assertRaises( ValueError, Blackout.fromBytes, b'\x00' + data[ 1: ] )		# Unknown version
+		self.assertRaises( ValueError, Blackout.fromBytes, data[ :-1 ] )		# Truncated
+
+
+
+	def testEventLog( self ) :
+
+		'''
+		Tests that an EventLog replays every position of a game exactly, from checkpoints and from its serialized form.
+		'''
+
+		rng = random.Random( 6 )
+
+		log = EventLog( 4, 3, seed = 12, checkpointEvery = 2 )
+
+		BC = log.game
+
+		snapshots = [ BC.toBytes() ]		# The position after each event
+
+		while not BC.isOver() :
+
+			if BC.Round == 2 :
+
+				log.Deal( dealMany( 1, 4, BC.numTricks, BC.Dealer, 3 )[0][0] )		# An explicit deal
+
+			else :
+
+				log.Deal()
+
+			snapshots.append( BC.toBytes() )
+
+			for ii in range( BC.numPlayers ) :
+
+				self.assertFalse( log.Bid( BC.Bidder, -2 ) )		# Not recorded
+
+				log.Bid( BC.Bidder, rng.choice( BC.legalBids( BC.Bidder ) ) )
+
+				snapshots.append( BC.toBytes() )
+
+			for ii in range( BC.numTricks ) :
+
+				for jj in range( BC.numPlayers ) :
+
+					log.Move( BC.Current, rng.choice( cardsOf( BC.legalMoves( BC.Current ) ) ) )
+
+					snapshots.append( BC.toBytes() )
+
+				log.evalTrick()
+
+				snapshots.append( BC.toBytes() )
+
+			log.postRound()
+
+			snapshots.append( BC.toBytes() )
+
+
+		self.assertEqual( len( log ) + 1, len( snapshots ) )
+		self.assertEqual( len( log.checkpoints ), 3 )		# The start and after rounds 2 and 4
+
+		for count in range( len( snapshots ) ) :
+
+			self.assertEqual( log.replay( count ).toBytes(), snapshots[ count ] )
+
+
+		# The serialized log rebuilds the game, including the deals drawn from the seed:
+
+		data = log.toBytes()
+
+		self.assertEqual( EventLog.fromBytes( data ).game.toBytes(), snapshots[ -1 ] )
+		self.assertEqual( EventLog.fromBytes( data, checkpointEvery = 0 ).replay( 20 ).toBytes(), snapshots[ 20 ] )
+
+		self.assertRaises( ValueError, EventLog.fromBytes, b'\x09' + data[ 1: ] )		# Unknown version
+		self.assertRaises( ValueError, EventLog.fromBytes, data[ :2 ] + b'\x00' + data[ 3: ] )		# maxTricks 0
+		self.assertRaises( ValueError, EventLog.fromBytes, data[ :1 ] + b'\x00' + data[ 2: ] )		# No players
+		self.assertRaises( ValueError, log.replay, len( log ) + 1 )
+		self.assertRaises( ValueError, EventLog.fromBytes, data + b'\x07' )		# Unknown opcode
+
+		with self.assertRaises( ValueError ) as context :
+
+			EventLog.fromBytes( data + bytes( [ BID, 9, 0 ] ) )		# No such player: IllegalPlayerError
+
+		self.assertTrue( 'offset %d' % ( len( data ) - _LOG_HEADER.size ) in str( context.exception ) )
+
+		self.assertRaises( ValueError, EventLog.fromBytes, data + bytes( [ EVAL_TRICK ] ) )		# No trick to evaluate: GameStateError
+
+
+		# A corrupted explicit deal is reported at its offset instead of dealing a broken hand:
+
+		offset = [ offset for offset in log.offsets if log.events[ offset ] == DEAL_FROM ][0]
+
+		for index, card in [ ( 5, 60 ), ( 5, log.events[ offset + 6 ] ) ] :		# Out of the deck, and a card dealt twice
+
+			corrupt = bytearray( data )
+
+			corrupt[ _LOG_HEADER.size + offset + index ] = card
+
+			with self.assertRaises( ValueError ) as context :
+
+				EventLog.fromBytes( bytes( corrupt ) )
+
+			self.assertTrue( 'offset %d' % offset in str( context.exception ) )
+
+
+
+	def testArchive( self ) :
+
+		'''
+		Tests that finished games written to an archive are read back unchanged and queried correctly.
+		'''
+
+		import os
+		import shutil
+		import tempfile
+
+		from array import array
+
+		path = tempfile.mkdtemp()
+
+		try :
+
+			writer = ArchiveWriter( path, 4, 3 )
+
+			rng = random.Random( 9 )
+
+			games = []
+			deals = []
+
+			for ii in range( 6 ) :
+
+				game = Blackout( 4, 3, rng )
+				hands = []
+
+				while not game.isOver() :
+
+					game.Deal()
+
+					writer.recordDeal( ii, game )
+					hands.append( ( list( game.Hand ), game.TrumpCard.index, game.Dealer ) )
+
+					for player in circGen( 4, game.Leader ) :
+
+						game.Bid( player, simulate.randomBid( game, player, rng ) )
+
+					for trick in range( game.numTricks ) :
+
+						for player in circGen( 4, game.Leader ) :
+
+							game.Move( player, simulate.randomPlay( game, player, rng ) )
+
+						game.evalTrick()
+
+					game.postRound()
+
+				writer.append( ii, game )
+
+				games.append( game )
+				deals.append( hands )
+
+
+			self.assertRaises( ValueError, ArchiveWriter, path, 5, 3 )		# Another size of game
+
+			writer.recordDeal( 'abandoned', games[0] )		# The deals of a game that is dropped are forgotten
+			writer.drop( 'abandoned' )
+
+			self.assertEqual( writer._deals, {} )
+			self.assertRaises( ValueError, writer.append, 'abandoned', games[0] )
+
+			writer.recordDeal( 'short', games[0] )		# One round only
+
+			self.assertRaises( ValueError, writer.append, 'short', games[0] )
+			self.assertRaises( ValueError, writer.append, 'short', Blackout( 4, 3 ) )		# Not finished
+			self.assertRaises( ValueError, writer.append, 'short', Blackout( 5, 3 ) )		# Another size of game
+
+			writer.drop( 'short' )
+
+
+			archive = ArchiveReader( path )
+
+			self.assertEqual( len( archive ), 6 )
+
+			made = [ 0 ] * 4
+
+			for ii in range( 6 ) :
+
+				for r in range( games[ii].numRounds ) :
+
+					self.assertEqual( [ int( archive.hands[ ii, r, p ] ) for p in range( 4 ) ], deals[ii][r][0] )
+					self.assertEqual( archive.trumpCard[ ii, r ], deals[ii][r][1] )
+					self.assertEqual( archive.dealer[ ii, r ], deals[ii][r][2] )
+
+					for p in range( 4 ) :
+
+						k = r * 4 + p
+
+						self.assertEqual( ( archive.bids[ ii, r, p ], archive.tricks[ ii, r, p ], archive.points[ ii, r, p ] ), ( games[ii].Bids[k], games[ii].Tricks[k], games[ii].Points[k] ) )
+
+						if games[ii].Bids[k] == games[ii].Tricks[k] :
+
+							made[ ( p - deals[ii][r][2] ) % 4 ] += 1
+
+			for seat in range( 4 ) :
+
+				self.assertAlmostEqual( archive.bidAccuracyBySeat()[ seat ], made[ seat ] / 30.0 )
+
+			self.assertEqual( archive.bidAccuracyBySeat( chunk = 4 ), archive.bidAccuracyBySeat() )
+			self.assertEqual( int( archive.trumpSuits()[2][1] ), deals[2][1][1] // NUM_RANKS )
+
+			accuracy, trumps = archive.bidAccuracyBySeat(), [ [ int( suit ) for suit in row ] for row in archive.trumpSuits() ]
+
+			archive.close()
+
+
+			# The queries give the same results without NumPy:
+
+			with mock.patch.object( sys.modules[ ArchiveReader.__module__ ], 'numpy', None ) :
+
+				archive = ArchiveReader( path )
+
+				self.assertEqual( archive.bidAccuracyBySeat(), accuracy )
+				self.assertEqual( archive.trumpSuits(), trumps )
+
+				archive.close()
+
+
+			# A writer that crashed after writing some of the columns of a game: they are truncated on opening so the next game is aligned:
+
+			with open( os.path.join( path, 'hands' ), 'ab' ) as f :
+
+				f.write( b'\0' * 100 )
+
+			writer = ArchiveWriter( path, 4, 3 )
+
+			writer._deals[ 'crashed' ] = ( array( 'Q', [ h for r in range( 5 ) for h in deals[0][r][0] ] ), array( 'B', [ deals[0][r][1] for r in range( 5 ) ] ), array( 'B', [ deals[0][r][2] for r in range( 5 ) ] ) )
+
+			writer.append( 'crashed', games[0] )
+
+			archive = ArchiveReader( path )
+
+			self.assertEqual( len( archive ), 7 )
+			self.assertEqual( [ int( archive.hands[ 6, 4, p ] ) for p in range( 4 ) ], deals[0][4][0] )
+
+			archive.close()
+
+		finally :
+
+			shutil.rmtree( path )
+
+
+
+	def testRegistry( self ) :
+
+		'''
+		Tests that the game registry evicts games by LRU and TTL to SQLite and loads them back.
+		'''
+
+		import os
+		import tempfile
+		import threading
+
+		fd, path = tempfile.mkstemp()
+		os.close( fd )
+
+		now = [ 0.0 ]
+
+		registry = GameRegistry( path, capacity = 2, ttl = 10, interval = 0.01, clock = lambda : now[0] )
+
+		try :
+
+			games = {}
+
+			for gameId in [ 'a', 'b', 'c' ] :
+
+				games[ gameId ] = Blackout( 4, rng = random.Random( 1 ) )
+				games[ gameId ].Deal()
+
+				registry.put( gameId, games[ gameId ] )
+
+			self.assertEqual( len( registry ), 2 )		# 'a' was the least recently used
+			self.assertEqual( registry.evictions, 1 )
+
+			self.assertTrue( registry.get( 'b' ) is games[ 'b' ] )		# Served from memory
+			self.assertEqual( ( registry.hits, registry.loads ), ( 1, 0 ) )
+
+			registry.flush()
+
+			restored = registry.get( 'a' )		# Loaded back, evicting 'c'
+
+			self.assertEqual( restored.toBytes(), games[ 'a' ].toBytes() )
+			self.assertEqual( registry.loads, 1 )
+			self.assertTrue( registry.get( 'nothing' ) is None )
+
+
+			now[0] = 100.0		# Every game is now idle
+
+			registry.evictIdle()
+
+			self.assertEqual( len( registry ), 0 )
+
+			registry.flush()
+
+			self.assertEqual( registry.get( 'c' ).toBytes(), games[ 'c' ].toBytes() )
+
+			registry.remove( 'b' )
+
+			self.assertTrue( registry.get( 'b' ) is None )
+
+
+			# A game removed while the writer is between choosing its snapshot and writing it stays removed:
+
+			pending = registry._pending
+
+			raced = []
+
+			class Racing( dict ) :
+
+				def get( self, key, default = None ) :
+
+					value = dict.get( self, key, default )
+
+					if key == 'c' and registry._writer is threading.current_thread() and not raced :		# The writer is choosing the rows to write
+
+						raced.append( key )
+
+						registry.remove( 'c' )
+
+					return value
+
+			registry._pending = Racing( pending )
+
+			now[0] = 200.0
+
+			registry.evictIdle()		# Queues the snapshot of 'c'
+
+			registry.flush()
+
+			registry._pending = pending
+
+			self.assertTrue( registry.get( 'c' ) is None )
+			self.assertEqual( registry._db.execute( 'SELECT COUNT(*) FROM games WHERE id = ?', ( 'c', ) ).fetchone()[0], 0 )
+
+
+			# A game loaded back keeps its validation level and its own generator, or the shared one of the random module:
+
+			registry.put( 'd', Blackout( 4, rng = random.Random( 3 ), validation = TRUSTED ) )
+			registry.put( 'e', Blackout( 4 ) )
+
+			now[0] = 300.0
+
+			registry.evictIdle()
+			registry.flush()
+
+			restored = registry.get( 'd' )
+			twin = Blackout( 4, rng = random.Random( 3 ) )
+
+			restored.Deal()
+			twin.Deal()
+
+			self.assertEqual( ( restored.validation, restored.Hand ), ( TRUSTED, twin.Hand ) )
+			self.assertTrue( registry.get( 'e' ).rng is random )
+
+
+			# A write that fails is logged and retried, and flush() still returns:
+
+			registry._db.execute( "CREATE TRIGGER full BEFORE INSERT ON games BEGIN SELECT RAISE( ABORT, 'disk full' ); END" )
+			registry._db.commit()
+
+			with self.assertLogs( 'blackout.registry', 'ERROR' ) :
+
+				now[0] = 400.0
+
+				registry.evictIdle()
+				registry.flush()
+
+				self.assertTrue( 'd' in registry._pending and 'e' in registry._pending )
+
+				registry._db.execute( 'DROP TRIGGER full' )
+				registry._db.commit()
+
+			for ii in range( 500 ) :		# Until the next batch is retried
+
+				if 'd' not in registry._pending :
+
+					break
+
+				threading.Event().wait( 0.01 )
+
+			self.assertFalse( 'd' in registry._pending or 'e' in registry._pending )
+			self.assertEqual( registry.get( 'd' ).Hand, twin.Hand )
+
+			registry.close()
+
+
+			registry = GameRegistry( path, ttl = None )		# Every game was written out on close
+
+			self.assertEqual( registry.get( 'a' ).toBytes(), games[ 'a' ].toBytes() )
+			self.assertTrue( registry.get( 'c' ) is None )
+
+		finally :
+
+			registry.close()
+
+			os.remove( path )
+
+
+
+	def testServer( self ) :
+
+		'''
+		Tests the asyncio server: long-polled updates are pushed to every waiting client as soon as a table changes.
+		'''
+
+		import asyncio
+		import json
+
+		async def request( port, method, target ) :
+
+			reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+
+			writer.write( ( '%s %s HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n' % ( method, target ) ).encode() )
+
+			response = await reader.read()
+
+			writer.close()
+
+			return json.loads( response.split( b'\r\n\r\n', 1 )[1].decode() )
+
+		async def fetch( port, target, etag = None ) :		# Returns the status, ETag and body of a GET request
+
+			reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+
+			writer.write( ( 'GET %s HTTP/1.1\r\nConnection: close\r\n%s\r\n' % ( target, '' if etag is None else 'If-None-Match: %s\r\n' % etag ) ).encode() )
+
+			head, body = ( await reader.read() ).decode().split( '\r\n\r\n', 1 )
+
+			writer.close()
+
+			headers = dict( line.split( ': ', 1 ) for line in head.split( '\r\n' )[ 1: ] )
+
+			return int( head.split()[1] ), headers.get( 'ETag' ), json.loads( body ) if body else None
+
+		async def run() :
+
+			app = GameServer( timeout = 5.0 )
+
+			server = await app.serve( '127.0.0.1', 0 )
+
+			port = server.sockets[0].getsockname()[1]
+
+			try :
+
+				self.assertEqual( await request( port, 'POST', '/tables/t1?players=3&maxTricks=2' ), { 'version': 1 } )		# Dealt
+
+
+				# Every player takes his seat and gets the token of the seat, which only he can then see the hand of and act for:
+
+				seat = {}
+
+				for player in range( 3 ) :
+
+					seat[ player ] = 'player=%d&token=%s' % ( player, ( await request( port, 'POST', '/tables/t1/join?player=%d' % player ) )[ 'token' ] )
+
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1/join?player=1' ) )[0], b'409 Conflict' )		# Taken
+
+				for target in [ '/tables/t1?player=1', '/tables/t1?player=1&token=x', '/tables/t1?%s' % seat[2].replace( '=2', '=1', 1 ), '/tables/t1/changes?since=1&player=1' ] :
+
+					self.assertEqual( ( await app._route( 'GET', target ) )[0], b'403 Forbidden' )
+
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1/bid?player=1&token=x&bid=0' ) )[0], b'403 Forbidden' )
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1/move?player=1&card=0' ) )[0], b'403 Forbidden' )
+
+				self.assertFalse( 'hand' in await request( port, 'GET', '/tables/t1' ) )		# A spectator
+
+				state = await request( port, 'GET', '/tables/t1?%s' % seat[1] )
+
+				self.assertEqual( ( state[ 'round' ], state[ 'bidder' ], len( state[ 'hand' ] ) ), ( 1, 1, 1 ) )
+
+
+				# Two spectators wait for the next change:
+
+				waiting = [ asyncio.ensure_future( request( port, 'GET', '/tables/t1/updates?since=1' ) ) for ii in range( 2 ) ]
+
+				await asyncio.sleep( 0.05 )
+
+				self.assertFalse( any( future.done() for future in waiting ) )
+
+				self.assertEqual( await request( port, 'POST', '/tables/t1/bid?%s&bid=0' % seat[2] ), { 'ok': False } )		# Out of turn
+				self.assertEqual( await request( port, 'POST', '/tables/t1/bid?%s&bid=0' % seat[1] ), { 'ok': True } )
+
+				for update in await asyncio.gather( *waiting ) :
+
+					self.assertEqual( update, { 'version': 2, 'deltas': [ { 'type': 'bid', 'player': 1, 'bid': 0, 'version': 2 } ] } )
+
+
+				# Conditional requests get 304 or the full state, and the fields that changed have their own resource:
+
+				nonce = app.tables[ 't1' ].nonce
+
+				status, etag, state = await fetch( port, '/tables/t1?%s' % seat[2] )
+
+				self.assertEqual( ( status, etag, state[ 'bids' ] ), ( 200, '"%s-2"' % nonce, [ -1, 0, -1 ] ) )
+
+				self.assertEqual( await fetch( port, '/tables/t1?%s' % seat[2], etag ), ( 304, '"%s-2"' % nonce, None ) )
+
+				self.assertEqual( await request( port, 'POST', '/tables/t1/bid?%s&bid=1' % seat[2] ), { 'ok': True } )
+
+				status, etag, state = await fetch( port, '/tables/t1?%s' % seat[2], etag )
+
+				self.assertEqual( ( status, etag, state ), ( 200, '"%s-3"' % nonce, app.state( 't1', 2 ) ) )
+
+				status, etag, delta = await fetch( port, '/tables/t1/changes?since=2&%s' % seat[2] )
+
+				self.assertEqual( ( status, etag ), ( 200, None ) )
+				self.assertEqual( delta, { 'version': 3, 'since': 2, 'changes': { 'version': 3, 'bidder': 0, 'bids': [ -1, 0, 1 ] } } )
+
+				self.assertEqual( ( await fetch( port, '/tables/t1/changes?since=1000' ) )[2], { 'version': 3, 'reset': True } )		# Unknown version
+
+				fresh = app.createTable( 'fresh', 3, 2 )		# The changed fields are recorded at every version, and merged when asked for
+
+				self.assertTrue( app.bid( 'fresh', 1, 0 ) )
+
+				since = fresh.version
+
+				self.assertTrue( app.bid( 'fresh', 2, 0 ) )
+
+				self.assertEqual( ( await fetch( port, '/tables/fresh/changes?since=%d' % since ) )[2][ 'changes' ][ 'bids' ], [ -1, 0, 0 ] )
+
+				self.assertEqual( list( fresh._changes )[ -2: ], [ since, fresh.version ] )
+
+
+				# A table recreated under the same id starts again at version 1, but the ETags of the table it replaced do not match it:
+
+				_, stale, _ = await fetch( port, '/tables/fresh' )
+
+				app.removeTable( 'fresh' )
+
+				app.createTable( 'fresh', 3, 2 )
+
+				self.assertEqual( ( await fetch( port, '/tables/fresh', '"%s-1"' % fresh.nonce ) )[0], 200 )
+				self.assertNotEqual( ( await fetch( port, '/tables/fresh' ) )[1], stale )
+
+				status, body, headers = await app._route( 'GET', '/tables/t1', '%s-3' % nonce )
+
+				self.assertEqual( ( status, headers[ 'Cache-Control' ], headers[ 'Vary' ] ), ( b'304 Not Modified', 'no-cache', 'If-None-Match' ) )
+
+
+				for player in [ 0 ] :
+
+					bids = app.tables[ 't1' ].game.legalBids( player )
+
+					await request( port, 'POST', '/tables/t1/bid?%s&bid=%d' % ( seat[ player ], bids[0] ) )
+
+
+				# The last card of the trick also completes the round and deals the next one, all sent together:
+
+				for player in [ 1, 2, 0 ] :
+
+					card = cardsOf( app.tables[ 't1' ].game.legalMoves( player ) )[0]
+
+					waiter = asyncio.ensure_future( request( port, 'GET', '/tables/t1/updates?since=%d' % app.tables[ 't1' ].version ) )
+
+					await asyncio.sleep( 0.01 )
+
+					self.assertEqual( await request( port, 'POST', '/tables/t1/move?%s&card=%d' % ( seat[ player ], card ) ), { 'ok': True } )
+
+					update = await waiter
+
+				self.assertEqual( [ delta[ 'type' ] for delta in update[ 'deltas' ] ], [ 'move', 'trick', 'round', 'deal' ] )
+				self.assertEqual( update[ 'deltas' ][ -1 ][ 'round' ], 2 )
+
+
+				# A client that is up to date waits until the timeout and gets no deltas:
+
+				version = app.tables[ 't1' ].version
+
+				self.assertEqual( await app.updates( 't1', version, timeout = 0.01 ), json.dumps( { 'version': version, 'deltas': [] } ).encode() )
+
+				self.assertEqual( await request( port, 'GET', '/tables/none' ), {} )
+
+
+				# Bad arguments get 400 and an existing table is not replaced:
+
+				for target in [ '/tables/t2?players=60', '/tables/t2?players=1', '/tables/t2?players=0', '/tables/t2?players=4&maxTricks=14', '/tables/t2' ] :
+
+					self.assertEqual( ( await app._route( 'POST', target ) )[0], b'400 Bad Request' )
+
+				self.assertFalse( 't2' in app.tables )
+
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1?players=3' ) )[0], b'409 Conflict' )
+
+				for target in [ '/tables/t1?player=99', '/tables/t1?player=-1', '/tables/t1?player=x' ] :
+
+					self.assertEqual( ( await app._route( 'GET', target ) )[0], b'400 Bad Request' )
+
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1/bid?player=-1&bid=0' ) )[0], b'400 Bad Request' )
+				self.assertEqual( ( await app._route( 'POST', '/tables/t1/move?player=3&card=0' ) )[0], b'400 Bad Request' )
+
+				status, body, headers = await app._route( 'GET', '/metrics' )		# The instrumentation of the process running the games
+
+				self.assertEqual( ( status, headers[ 'Content-Type' ] ), ( b'200 OK', 'text/plain; version=0.0.4' ) )
+				self.assertTrue( body.startswith( b'# HELP blackout_call_duration_seconds' ) )
+
+			finally :
+
+				server.close()
+
+				await server.wait_closed()
+
+		asyncio.run( run() )
+
+
+		# The state kept up to date by the changes matches the state read from scratch, and the merged changes match the differences between the states:
+
+		app = GameServer()
+		rng = random.Random( 3 )
+
+		for numPlayers, maxTricks in ( ( 3, 3 ), ( 5, 2 ) ) :
+
+			table = app.createTable( 'played', numPlayers, maxTricks )
+			game = table.game
+
+			states = { table.version: table.state() }
+
+			while not game.isOver() :
+
+				if game.Bids[ game._base() + game.Bidder ] == -1 :
+
+					self.assertTrue( app.bid( 'played', game.Bidder, simulate.trumpBid( game, game.Bidder, rng ) ) )
+
+				else :
+
+					self.assertTrue( app.move( 'played', game.Current, simulate.greedyPlay( game, game.Current, rng ) ) )
+
+				self.assertEqual( table.state(), server._fullState( game ) )
+
+				states[ table.version ] = table.state()
+
+				for since in list( states )[ -6: ] :
+
+					for player in ( None, 1 ) :
+
+						old, new = server._view( states[ since ], player ), server._view( table.state(), player )
+
+						changes = table.changes( since, player )
+
+						self.assertEqual( dict( old, **changes ), new )		# A field changed and changed back may be sent again
+						self.assertTrue( all( key in changes for key in new if old[ key ] != new[ key ] ) )
+
+			app.removeTable( 'played' )
+
+
+	def testTimerWheel( self ) :
+
+		'''
+		Tests that the timer wheel fires every deadline once, on time, and never a cancelled one.
+		'''
+
+		rng = random.Random( 13 )
+
+		wheel = TimerWheel( tick = 0.1, size = 64, now = 0.0 )
+
+		deadlines = {}
+
+		for key in range( 20000 ) :
+
+			deadlines[ key ] = rng.uniform( 0.0, 30.0 )		# Many turns of the wheel
+
+			wheel.schedule( key, deadlines[ key ] )
+
+		for key in range( 0, 20000, 3 ) :
+
+			wheel.cancel( key )
+
+			del deadlines[ key ]
+
+		wheel.schedule( 1, 50.0 )		# Rescheduled
+		deadlines[ 1 ] = 50.0
+
+		self.assertEqual( len( wheel ), len( deadlines ) )
+
+		fired = set()
+		now = 0.0
+
+		while now < 60.0 :
+
+			now += rng.uniform( 0.0, 2.0 )		# Irregular ticks, sometimes skipping several slots
+
+			for key in wheel.expire( now ) :
+
+				self.assertFalse( key in fired )
+				self.assertTrue( deadlines[ key ] <= now < deadlines[ key ] + 2.2 )
+
+				fired.add( key )
+
+		self.assertEqual( fired, set( deadlines ) )
+		self.assertEqual( len( wheel ), 0 )
+
+
+		wheel.schedule( 'late', 0.0 )		# A deadline in the past fires on the next tick
+
+		self.assertEqual( wheel.expire( now + 0.1 ), [ 'late' ] )
+
+
+		# Players running out of time at a table have a bid or card chosen for them:
+
+		now = [ 0.0 ]
+
+		app = GameServer( turnTimeout = 10.0, clock = lambda : now[0] )
+
+		table = app.createTable( 't1', 3, 2 )
+
+		now[0] = 5.0
+
+		self.assertTrue( app.bid( 't1', 1, table.game.legalBids( 1 )[0] ) )		# Restarts the clock for player 2
+
+		now[0] = 12.0
+
+		self.assertEqual( app.expireTurns(), 0 )
+
+		now[0] = 15.5
+
+		self.assertEqual( app.expireTurns(), 1 )
+
+		self.assertNotEqual( table.game.Bids[2], -1 )
+
+		while not table.game.isOver() :
+
+			now[0] += 10.5
+
+			app.expireTurns()
+
+		self.assertFalse( 't1' in app.wheel )
+
+
+		# A failing policy is retried on the next timeout, and does not keep the other tables from being served:
+
+		def policy( game, player, rng ) :
+
+			if game is broken.game :
+
+				raise RuntimeError( 'ERROR: A broken policy.' )
+
+			return game.numTricks + 1		# Illegal
+
+		app = GameServer( turnTimeout = 10.0, autoBid = policy, clock = lambda : now[0] )
+
+		broken = app.createTable( 't2', 3, 2 )
+		illegal = app.createTable( 't3', 3, 2 )
+
+		now[0] += 10.5
+
+		logging.disable( logging.CRITICAL )
+
+		try :
+
+			self.assertEqual( app.expireTurns(), 2 )
+
+		finally :
+
+			logging.disable( logging.NOTSET )
+
+		self.assertTrue( 't2' in app.wheel and 't3' in app.wheel )		# Their clocks are restarted
+		self.assertEqual( ( broken.game.Bids[1], illegal.game.Bids[1] ), ( -1, -1 ) )
+
+		app.autoBid = simulate.trumpBid
+
+		now[0] += 10.5
+
+		self.assertEqual( app.expireTurns(), 2 )
+		self.assertNotEqual( broken.game.Bids[1], -1 )
+		self.assertNotEqual( illegal.game.Bids[1], -1 )
+
+
+		# Finished tables and idle ones are removed:
+
+		app = GameServer( clock = lambda : now[0], idleTimeout = 100.0, finishedTimeout = 20.0 )
+
+		done = app.createTable( 'done', 3, 1 )
+
+		app.createTable( 'idle', 3, 1 )
+
+		while not done.game.isOver() :
+
+			game = done.game
+
+			if game.Bids[ game._base() + game.Bidder ] == -1 :
+
+				self.assertTrue( app.bid( 'done', game.Bidder, simulate.trumpBid( game, game.Bidder, rng ) ) )
+
+			else :
+
+				self.assertTrue( app.move( 'done', game.Current, simulate.greedyPlay( game, game.Current, rng ) ) )
+
+		now[0] += 21.0
+
+		self.assertEqual( app.evictTables(), 1 )
+		self.assertEqual( list( app.tables ), [ 'idle' ] )
+
+		now[0] += 80.0
+
+		self.assertEqual( app.evictTables(), 1 )
+		self.assertEqual( app.tables, {} )
+
+
+
+	def testSupervisor( self ) :
+
+		'''
+		Tests routing actions to sharded worker processes and moving the shards when workers restart or die.
+		'''
+
+		supervisor = Supervisor( 2, numShards = 16 )
+
+		try :
+
+			ids = [ 'game-%d' % ii for ii in range( 40 ) ]
+
+			for gameId in ids :
+
+				supervisor.create( gameId, 4, 3, seed = gameId )
+
+			self.assertEqual( sum( supervisor.counts() ), 40 )
+
+			supervisor.execute( [ ( gameId, 'Deal', () ) for gameId in ids ] )
+
+			hands = supervisor.execute( [ ( gameId, 'hand', ( 1, ) ) for gameId in ids ] )
+
+			reference = Blackout( 4, 3, random.Random( ids[7] ) )		# The same seed deals the same cards
+			reference.Deal()
+
+			self.assertEqual( hands[7], reference.hand( 1 ) )
+
+			self.assertEqual( supervisor.execute( [ ( ids[0], 'Bid', ( 1, 0 ) ), ( ids[1], 'legalBids', ( 1, ) ) ] ), [ True, [ 0, 1 ] ] )
+
+			self.assertRaises( KeyError, supervisor.execute, [ ( 'nothing', 'scores', () ) ] )
+			self.assertRaises( ValueError, supervisor.execute, [ ( ids[0], '__class__', () ) ] )
+
+			live = supervisor.execute( [ ( ids[2], 'toBytes', () ) ] )
+
+			self.assertRaises( ValueError, supervisor.create, ids[2], 4, 3 )		# Creating an existing game keeps the live game
+			self.assertEqual( supervisor.execute( [ ( ids[2], 'toBytes', () ) ] ), live )
+			self.assertEqual( sum( supervisor.counts() ), 40 )
+
+			self.assertEqual( supervisor.execute( [ ( 'any', '_playGame', ( 4, 3, 5 ) ) ] )[0], simulate.playGame( 4, 3, simulate.trumpBid, simulate.greedyPlay, random.Random( 5 ) ).scores() )
+
+
+			# A restart keeps every game (and its generator) and spreads the shards evenly again:
+
+			fresh = [ gameId for gameId in ( 'fresh-%d' % ii for ii in range( 20 ) ) if supervisor.workerOf( gameId ) == 0 ][0]
+
+			supervisor.create( fresh, 4, 3, seed = fresh )
+
+			before = supervisor.execute( [ ( gameId, 'toBytes', () ) for gameId in ids ] )
+
+			supervisor.restartWorker( 0 )
+
+			self.assertEqual( supervisor.execute( [ ( gameId, 'toBytes', () ) for gameId in ids ] ), before )
+			self.assertEqual( sorted( supervisor.owner.count( index ) for index in range( 2 ) ), [ 8, 8 ] )
+
+			reference = Blackout( 4, 3, random.Random( fresh ) )
+			reference.Deal()
+
+			self.assertEqual( supervisor.execute( [ ( fresh, 'Deal', () ), ( fresh, 'hand', ( 1, ) ) ] )[1], reference.hand( 1 ) )
+
+			supervisor.drop( fresh )
+
+
+			# A worker that dies loses its games and is replaced:
+
+			lost = [ gameId for gameId in ids if supervisor.workerOf( gameId ) == 1 ]
+
+			kept = [ gameId for gameId in ids if gameId not in lost ]
+
+			supervisor._processes[1].terminate()
+			supervisor._processes[1].join()
+
+			self.assertRaises( WorkerError, supervisor.execute, [ ( gameId, 'toBytes', () ) for gameId in ids ] )		# The other worker's replies are still read ...
+			self.assertEqual( supervisor.execute( [ ( kept[0], 'toBytes', () ) ] ), [ before[ ids.index( kept[0] ) ] ] )		# ... so that none is mistaken for a later one
+
+			self.assertEqual( supervisor.check(), [ 1 ] )
+			self.assertEqual( sum( supervisor.counts() ), 40 - len( lost ) )
+
+			self.assertRaises( KeyError, supervisor.execute, [ ( lost[0], 'scores', () ) ] )
+
+
+			# A game keeps its validation level when its shard moves:
+
+			supervisor.create( fresh, 4, 3, seed = fresh, validation = OFF )
+
+			supervisor.restartWorker( supervisor.workerOf( fresh ) )
+
+			self.assertEqual( supervisor.execute( [ ( fresh, 'Bid', ( 0, 0 ) ) ] ), [ True ] )		# Out of turn and before the deal, unchecked at OFF
+
+
+			# A worker whose pipe has failed is still stopped by restartWorker() and close():
+
+			supervisor._conns[0].close()
+
+			supervisor.restartWorker( 0 )		# Its games are lost
+
+			self.assertFalse( None in supervisor.counts() )
+
+			supervisor._conns[1].close()
+
+		finally :
+
+			supervisor.close()
+
+
+
+	def testBenchmarks( self ) :
+
+		'''
+		Tests that the micro-benchmarks run and that comparing with a baseline flags the regressions only.
+		'''
+
+		results = benchmarks.microBenchmarks( 100, 1 )
+
+		self.assertEqual( sorted( results ), [ 'Bid', 'Card.__gt__', 'Card.beats', 'Deal', 'HandSampler.sample', 'HandSampler.sampleMany', 'Move', 'circGen', 'evalTrick', 'postRound' ] )
+		self.assertTrue( all( value > 0 for value in results.values() ) )
+
+		results = benchmarks.supervisorBenchmarks( 10, 1, ( 1, 2 ) )
+
+		self.assertEqual( sorted( results ), [ 'supervisor/1 workers', 'supervisor/2 workers' ] )
+		self.assertEqual( sorted( benchmarks.supervisorSpeedups( results ) ), [ 1, 2 ] )
+		self.assertEqual( benchmarks.supervisorSpeedups( results )[1], 1.0 )
+
+		baseline = { 'results': { 'Deal': 1.0, 'Move': 1.0, 'gone': 1.0 } }
+
+		self.assertEqual( benchmarks.compare( { 'results': { 'Deal': 1.05, 'Move': 1.5 } }, baseline ), [ ( 'Move', 1.0, 1.5 ) ] )
+
+
+
+	def testInstrument( self ) :
+
+		'''
+		Tests that the instrumentation counts calls and rejections while enabled and leaves the kernel untouched when disabled.
+		'''
+
+		import importlib
+		import sys
+		import types
+
+		original = Blackout.Move
+
+		instrument.reset()
+		instrument.enable()
+
+		try :
+
+			self.assertTrue( instrument.isEnabled() )
+
+			BC = Blackout( 3, rng = random.Random( 3 ) )
+
+			BC.Deal()
+
+			self.assertFalse( BC.Bid( 1, 5 ) )		# Rejected
+
+			for player in circGen( 3, BC.Leader ) :
+
+				BC.Bid( player, 0 )
+
+			self.assertFalse( BC.Move( 1, cardsOf( FULL_MASK & ~BC.Hand[1] )[0] ) )		# Rejected
+
+			for player in circGen( 3, BC.Leader ) :
+
+				BC.Move( player, BC.hand( player )[0] )
+
+			BC.evalTrick()
+			BC.postRound()
+
+		finally :
+
+			instrument.disable()
+
+		self.assertTrue( Blackout.Move is original )
+
+		BC.Deal()		# Not counted
+
+		data = instrument.snapshot()
+
+		self.assertEqual( [ ( data[ name ][ 'count' ], data[ name ][ 'rejected' ] ) for name in instrument.METHODS ], [ ( 1, 0 ), ( 4, 1 ), ( 4, 1 ), ( 1, 0 ), ( 1, 0 ) ] )
+		self.assertEqual( data[ 'Move' ][ 'buckets' ][ -1 ][1], 4 )		# Cumulative
+
+		text = instrument.prometheusText()
+
+		self.assertTrue( 'blackout_call_duration_seconds_count{method="Bid"} 4\n' in text )
+		self.assertTrue( 'blackout_call_duration_seconds_bucket{method="Deal",le="+Inf"} 1\n' in text )
+		self.assertTrue( 'blackout_rejected_total{method="Move"} 1\n' in text )
+
+		instrument.reset()
+
+		self.assertEqual( instrument.snapshot()[ 'Bid' ][ 'count' ], 0 )
+
+
+		# In the Django process the name 'blackout' is the project package, so the kernel is loaded under another name:
+
+		saved = dict( ( name, sys.modules[ name ] ) for name in ( 'blackout', 'instrument' ) )
+
+		sys.modules[ 'blackout' ] = types.ModuleType( 'blackout' )
+		sys.modules[ 'blackout' ].__path__ = []
+
+		del sys.modules[ 'instrument' ]
+
+		try :
+
+			shadowed = importlib.import_module( 'instrument' )
+
+			self.assertEqual( shadowed.Blackout.__module__, instrument.KERNEL )
+
+		finally :
+
+			sys.modules.update( saved )
+			sys.modules.pop( instrument.KERNEL, None )
+
+
+
+	def testBid( self ) :
+
+		'''
+		Tests the bidding order and the restriction on the dealer's bid.
+		'''
+
+		BC = Blackout( 3 )
+
+		BC.numTricks = 2
+
+		BC.Deal()
+
+		self.assertEqual( BC.legalBids( 1 ), [ 0, 1, 2 ] )
+
+		self.assertFalse( BC.Bid( 1, 3 ) )		# More than the number of tricks
+		self.assertTrue( BC.Bid( 1, 1 ) )
+
+		self.assertRaises( AssertionError, BC.Bid, 0, 0 )		# Dealer bidding out of turn
+
+		self.assertTrue( BC.Bid( 2, 0 ) )
+
+		self.assertEqual( BC.legalBids( 0 ), [ 0, 2 ] )		# The dealer may not make the total equal the number of tricks
+
+		self.assertFalse( BC.Bid( 0, 1 ) )
+		self.assertTrue( BC.Bid( 0, 2 ) )
+
+		self.assertEqual( [ BC.bids( ii ) for ii in range(3) ], [ [2], [1], [0] ] )
+
+
+
+	def testValidation( self ) :
+
+		'''
+		Tests the STRICT, TRUSTED and OFF validation levels and the typed exceptions.
+		'''
+
+		BC = Blackout( 3, rng = random.Random( 4 ) )
+
+		BC.numTricks = 2
+
+		BC.Deal()
+
+		self.assertRaises( OutOfTurnError, BC.Bid, 0, 0 )
+		self.assertRaises( IllegalPlayerError, BC.Bid, 7, 0 )
+		self.assertRaises( BlackoutError, BC.Bid, 2, 0 )
+		self.assertRaises( GameStateError, BC.evalTrick )
+
+		self.assertTrue( issubclass( BlackoutError, AssertionError ) )		# What the checks used to raise
+
+
+		BC.validation = TRUSTED		# Illegal bids are still refused but the turn order is not checked
+
+		self.assertRaises( IllegalPlayerError, BC.Bid, 7, 0 )		# The cheap checks of the arguments are kept
+		self.assertRaises( GameStateError, BC.evalTrick )
+
+		self.assertFalse( BC.Bid( 1, 3 ) )
+		self.assertTrue( BC.Bid( 1, 1 ) )
+		self.assertTrue( BC.Bid( 2, 0 ) )
+		self.assertFalse( BC.Bid( 0, 1 ) )		# The dealer's restriction
+		self.assertTrue( BC.Bid( 0, 0 ) )
+
+		player = BC.Current
+		held = BC.hand( player )
+		other = [ card for card in range( NUM_CARDS ) if card not in held ][0]
+
+		self.assertFalse( BC.Move( player, other ) )		# Not in the hand
+		self.assertRaises( IllegalCardError, BC.Move, player, NUM_CARDS )
+		self.assertRaises( IllegalPlayerError, BC.Move, -1, held[0] )
+		self.assertTrue( BC.Move( player, held[0] ) )
+
+		follower = BC.Current
+
+		if BC.legalMoves( follower ) != BC.Hand[ follower ] :		# Holds the suit led so must follow it
+
+			self.assertFalse( BC.Move( follower, cardsOf( BC.Hand[ follower ] & ~BC.legalMoves( follower ) )[0] ) )
+
+
+		# OFF accepts anything. The games played are the same as with STRICT when only legal bids and cards are played:
+
+		fast = simulate.playGame( 4, 4, simulate.randomBid, simulate.randomPlay, random.Random( 9 ) )
+		checked = simulate.playGame( 4, 4, simulate.randomBid, simulate.randomPlay, random.Random( 9 ), STRICT )
+
+		self.assertEqual( fast.validation, OFF )
+		self.assertEqual( fast.scores(), checked.scores() )
+		self.assertEqual( fast.toBytes(), checked.toBytes() )
+
+		BC = Blackout( 3, validation = OFF )
+
+		BC.numTricks = 2
+
+		BC.Deal()
+
+		self.assertTrue( BC.Bid( 1, 3 ) )
+
+		self.assertEqual( Blackout.fromBytes( BC.toBytes(), validation = TRUSTED ).validation, TRUSTED )
+
+
+
+	def testSimulate( self ) :
+
+		'''
+		Plays complete games through the simulator and checks that they are reproducible and consistently scored.
+		'''
+
+		from random import Random
+
+		game = simulate.playGame( 4, 3, simulate.trumpBid, simulate.greedyPlay, Random( 1 ) )
+
+		self.assertTrue( game.isOver() )
+		self.assertEqual( game.Round, 6 )
+		self.assertEqual( game.Dealer, 1 )		# The deal moved left every round
+
+		for rnd, numTricks in enumerate( [ 1, 2, 3, 2, 1 ] ) :
+
+			self.assertEqual( sum( game.tricks( ii )[ rnd ] for ii in range(4) ), numTricks )
+			self.assertNotEqual( sum( game.bids( ii )[ rnd ] for ii in range(4) ), numTricks )
+
+		for ii in range( 4 ) :
+
+			self.assertEqual( len( game.points( ii ) ), 5 )
+			self.assertEqual( sum( game.points( ii ) ), game.scores()[ ii ] )
+
+			for rnd in range( 5 ) :
+
+				self.assertEqual( game.points( ii )[ rnd ], game.tricks( ii )[ rnd ] + ( 10 if game.bids( ii )[ rnd ] == game.tricks( ii )[ rnd ] else 0 ) )
+
+		again = simulate.playGame( 4, 3, simulate.trumpBid, simulate.greedyPlay, Random( 1 ) )
+
+		self.assertEqual( again.scores(), game.scores() )
+
+		self.assertRaises( ValueError, simulate.playGame, 4, 3, lambda game, player, rng : game.numTricks + 1, simulate.greedyPlay, Random( 1 ), STRICT )		# An illegal bid
+
+
+		stats = simulate.simulate( 30, 4, 3, processes = 1, seed = 7, batchSize = 10 )
+
+		self.assertEqual( stats[ 'games' ], 30 )
+		self.assertEqual( len( stats[ 'bidAccuracy' ] ), 5 )
+		self.assertEqual( stats, simulate.simulate( 30, 4, 3, processes = 1, seed = 7, batchSize = 10 ) )
+		self.assertEqual( stats, simulate.simulate( 30, 4, 3, processes = 1, seed = 7, batchSize = 10, validation = STRICT ) )
+
+		self.assertRaises( ValueError, simulate.simulate, 0, 4, 3, processes = 1 )
+		self.assertRaises( ValueError, simulate.simulate, 5, 4, 3, lambda game, player, rng : game.numTricks + 1, processes = 1, validation = TRUSTED )		# The policy is checked
+
+
+
+	def testDoubleDummy( self ) :
+
+		'''
+		Tests the double-dummy solver against a plain minimax search of small deals.
+		'''
+
+		def minimax( hands, trump, leader, seat, table ) :
+
+			# The most tricks 'seat' can take against all the other players from the given position, found by trying every legal card.
+
+			numPlayers = len( hands )
+
+			if len( table ) == numPlayers :
+
+				winner = ( leader + trickWinner( table, trump ) ) % numPlayers
+
+				return ( winner == seat ) + minimax( hands, trump, winner, seat, [] )
+
+			if not table and not hands[ leader ] :		# The round is over
+
+				return 0
+
+			player = ( leader + len( table ) ) % numPlayers
+
+			legal = hands[ player ] & SUIT_MASK[ table[0] // NUM_RANKS ] if table else 0
+
+			values = []
+
+			for card in cardsOf( legal or hands[ player ] ) :
+
+				rest = list( hands )
+				rest[ player ] ^= 1 << card
+
+				values.append( minimax( rest, trump, leader, seat, table + [ card ] ) )
+
+			return max( values ) if player == seat else min( values )
+
+
+		for deal in range( 12 ) :
+
+			numPlayers = 3 + deal % 2
+			numTricks = 1 + deal % 4
+
+			shuffled, hands, trump = dealMany( 1, numPlayers, numTricks, seed = deal )
+
+			hands = [ int( hand ) for hand in hands[0] ]
+			trump = NO_SUIT if deal % 5 == 0 else int( trump[0] ) // NUM_RANKS
+
+			solver = DoubleDummy( hands, trump, 1 )
+
+			self.assertEqual( solver.allMaxTricks(), [ minimax( hands, trump, 1, seat, [] ) for seat in range( numPlayers ) ] )
+
+
+		for deal in range( 6 ) :		# More players, so that the transposition table entries stand for many positions
+
+			numPlayers = 5 + deal % 3
+			numTricks = 3 if numPlayers == 5 else 2
+
+			shuffled, hands, trump = dealMany( 1, numPlayers, numTricks, seed = 100 + deal )
+
+			hands = [ int( hand ) for hand in hands[0] ]
+			trump = int( trump[0] ) // NUM_RANKS
+
+			solver = DoubleDummy( hands, trump, deal % numPlayers )
+
+			self.assertEqual( solver.allMaxTricks(), [ minimax( hands, trump, deal % numPlayers, seat, [] ) for seat in range( numPlayers ) ] )
+
+
+		# Mid-trick positions from a game and the best move:
+
+		BC = Blackout( 3, rng = __import__( 'random' ).Random( 3 ) )
+
+		BC.numTricks = 3
+
+		BC.Deal()
+
+		card = cardsOf( BC.legalMoves( 1 ) )[0]
+
+		BC.Move( 1, card )
+
+		solver = DoubleDummy.fromGame( BC )
+
+		self.assertEqual( solver.table, [ card ] )
+
+		best, tricks = solver.bestMove()
+
+		self.assertTrue( BC.legalMoves( 2 ) >> best & 1 )
+		self.assertEqual( tricks, solver.maxTricks( 2 ) )
+		self.assertEqual( tricks, minimax( BC.Hand, BC.precedence.trumpIndex, 1, 2, [ card ] ) )
+
+
+		# A search that reaches its limit gives a lower bound, and resumes with higher limits:
+
+		shuffled, hands, trump = dealMany( 1, 4, 6, seed = 5 )
+
+		hands = [ int( hand ) for hand in hands[0] ]
+
+		expected = DoubleDummy( hands, int( trump[0] ) // NUM_RANKS, 0 ).allMaxTricks()
+
+		solver = DoubleDummy( hands, int( trump[0] ) // NUM_RANKS, 0, maxNodes = 20 )
+
+		with self.assertRaises( SearchLimitError ) as context :
+
+			solver.maxTricks( 0 )
+
+		self.assertTrue( context.exception.lower <= expected[0] )
+		self.assertEqual( solver.hands, hands )
+
+		solver.maxNodes = None
+
+		self.assertEqual( solver.allMaxTricks(), expected )
+
+
+		# The transposition tables are cleared when full, which does not change the answers:
+
+		solver = DoubleDummy( hands, int( trump[0] ) // NUM_RANKS, 0, maxEntries = 8 )
+
+		self.assertEqual( solver.allMaxTricks(), expected )
+		self.assertTrue( all( sum( len( entries ) for table in tables for bucket in table.values() for entries in bucket.values() ) <= 8 for tables in solver._tables ) )
+
+
+		# The owners in the transposition table entries do not overlap at tables of more than 8 players:
+
+		hands = [ 0 ] * 10
+
+		hands[1], hands[0] = 1 << 0, 1 << 1
+
+		layouts, key = DoubleDummy( hands, NO_SUIT, 0 )._position( 0 )
+
+		first = layouts[0][1]
+
+		hands[0], hands[1], hands[8] = 1 << 0, 0, 1 << 1
+
+		layouts, key = DoubleDummy( hands, NO_SUIT, 0 )._position( 0 )
+
+		self.assertNotEqual( layouts[0][1], first )
+
+
+
+	def testBidAdvisor( self ) :
+
+		'''
+		Tests the bid advisor: its distributions, the dealer restriction and the LRU cache of canonical hands.
+		'''
+
+		advisor = BidAdvisor( samples = 50, cacheSize = 2 )
+
+		BC = Blackout( 4, rng = random.Random( 11 ) )
+
+		BC.numTricks = 3
+		BC.Dealer = 3
+		BC.Leader = BC.Bidder = BC.Current = 0
+
+		BC.Deal()
+
+		advice = advisor.advise( BC, 0 )
+
+		self.assertEqual( len( advice[ 'distribution' ] ), 4 )
+		self.assertAlmostEqual( sum( advice[ 'distribution' ] ), 1.0 )
+		self.assertTrue( advice[ 'bid' ] in BC.legalBids( 0 ) )
+
+
+		# The dealer is never advised to make the total equal the number of tricks:
+
+		for player in range( 3 ) :
+
+			BC.Bid( player, 1 )
+
+		self.assertNotEqual( advisor.advise( BC, 3 )[ 'bid' ], 0 )
+
+
+		# Relabelling the non-trump suits gives the same signature and hits the cache:
+
+		trump = BC.trump.index
+		a, b = [ suit for suit in range( NUM_SUITS ) if suit != trump ][ :2 ]
+
+		hand = BC.Hand[0]
+		swapped = hand & ~( SUIT_MASK[a] | SUIT_MASK[b] )
+		swapped |= ( ( hand & SUIT_MASK[a] ) >> ( a * NUM_RANKS ) ) << ( b * NUM_RANKS )
+		swapped |= ( ( hand & SUIT_MASK[b] ) >> ( b * NUM_RANKS ) ) << ( a * NUM_RANKS )
+
+		self.assertEqual( signature( swapped, BC.TrumpCard.index, 4, 0 ), signature( hand, BC.TrumpCard.index, 4, 0 ) )
+
+		hits = advisor.hits
+
+		self.assertEqual( advisor.distribution( swapped, BC.TrumpCard.index, 4, 0 ), advice[ 'distribution' ] )
+		self.assertEqual( advisor.hits, hits + 1 )
+
+
+		# The cache is bounded:
+
+		advisor.distribution( BC.Hand[1], BC.TrumpCard.index, 4, 1 )
+		advisor.distribution( BC.Hand[2], BC.TrumpCard.index, 4, 2 )
+
+		self.assertEqual( len( advisor._cache ), 2 )
+
+
+
+	def testBidTable( self ) :
+
+		'''
+		Tests the hand classes and the building and lookup of an offline bid table.
+		'''
+
+		import os
+		import tempfile
+
+		rng = random.Random( 5 )
+
+		for ii in range( 200 ) :
+
+			hand = maskOf( rng.sample( range( NUM_CARDS ), 7 ) )
+			trump = rng.randrange( NUM_SUITS )
+
+			self.assertTrue( 0 <= handClass( hand, trump ) < NUM_CLASSES )
+
+			a, b = [ suit for suit in range( NUM_SUITS ) if suit != trump ][ :2 ]		# Swapping two side suits does not change the class
+
+			swapped = hand & ~( SUIT_MASK[a] | SUIT_MASK[b] )
+			swapped |= ( ( hand & SUIT_MASK[a] ) >> ( a * NUM_RANKS ) ) << ( b * NUM_RANKS )
+			swapped |= ( ( hand & SUIT_MASK[b] ) >> ( b * NUM_RANKS ) ) << ( a * NUM_RANKS )
+
+			self.assertEqual( handClass( swapped, trump ), handClass( hand, trump ) )
+
+		self.assertNotEqual( handClass( maskOf( [ 12 ] ), 0 ), handClass( maskOf( [ 0 ] ), 0 ) )		# Ace of trumps vs the 2 of trumps
+
+
+		fd, path = tempfile.mkstemp()
+		os.close( fd )
+
+		try :
+
+			buildBidTable( path, 3, 2, deals = 500, minSamples = 1 )
+
+			table = BidTable( path )
+
+			self.assertEqual( ( table.numPlayers, table.maxTricks ), ( 3, 2 ) )
+
+			expected = table.expected( maskOf( [ 12 ] ), 0, 1, 0 )		# Leading the ace of trumps always wins
+
+			self.assertEqual( expected, 1.0 )
+
+			self.assertEqual( table.expected( maskOf( [ 11, 12 ] ), 0, 1, 0 ), None )		# Two cards never occur in a round of one trick
+
+
+			BC = Blackout( 3, 2, rng = random.Random( 2 ) )
+			BC.numTricks = 2
+
+			BC.Deal()
+
+			advice = table.advise( BC, BC.Bidder )
+
+			if advice is not None :
+
+				self.assertTrue( 0.0 <= advice[ 'expected' ] <= 2.0 )
+				self.assertTrue( advice[ 'bid' ] in BC.legalBids( BC.Bidder ) )
+
+			BC.numTricks = 3		# More tricks than the table was built for
+
+			self.assertRaises( ValueError, table.advise, BC, BC.Bidder )
+
+			table.close()
+
+
+			with open( path, 'r+b' ) as f :		# Corrupt the magic
+
+				f.write( b'XXXX' )
+
+			self.assertRaises( ValueError, BidTable, path )
+
+		finally :
+
+			os.remove( path )
+
+
+
 	def test_circInc( self ) :
 
 		'''
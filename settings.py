@@ -121,6 +121,15 @@ INSTALLED_APPS = (
     # 'django.contrib.admindocs',
 )
 
+# Record call counts and latency histograms of the Blackout kernel, served at /metrics/
+# (see scripts/instrument.py). Costs nothing when off.
+BLACKOUT_INSTRUMENTATION = False
+
+# The game server (scripts/server.py) hosting the live tables. In production the front end web
+# server routes /tables/ to it directly (see README.md); the development server forwards them to
+# it (see views.tables).
+BLACKOUT_GAME_SERVER = 'http://127.0.0.1:8001'
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error.
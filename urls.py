@@ -1,5 +1,7 @@
 from django.conf.urls.defaults import patterns, include, url
 
+from blackout import views
+
 # Uncomment the next two lines to enable the admin:
 # from django.contrib import admin
 # admin.autodiscover()
@@ -9,6 +11,15 @@ urlpatterns = patterns('',
     # url(r'^$', 'blackout.views.home', name='home'),
     # url(r'^blackout/', include('blackout.foo.urls')),
 
+    # The live tables (/tables/...) are served by the asyncio long-poll server in scripts/server.py
+    # running as its own process (python scripts/server.py --port 8001). In production the front
+    # end web server routes /tables/ to it directly (see README.md); this route only forwards them
+    # from the development server (see BLACKOUT_GAME_SERVER in settings.py).
+    url(r'^tables/(?P<path>.*)$', views.tables, name='tables'),
+
+    # Metrics of the Blackout kernel (see BLACKOUT_INSTRUMENTATION in settings.py):
+    url(r'^metrics/$', views.metrics, name='metrics'),
+
     # Uncomment the admin/doc line below to enable admin documentation:
     # url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
 
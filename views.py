@@ -0,0 +1,67 @@
+import os
+import sys
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:     # Python 2
+    from urllib2 import Request, urlopen, HTTPError
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+# The kernel lives in scripts/ as plain Python modules which import each other by name.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+import instrument
+
+# Instrument the Blackout kernel for the whole process (see scripts/instrument.py). It costs
+# nothing while BLACKOUT_INSTRUMENTATION is off. The tables themselves are played in the game
+# server process (scripts/server.py --instrument), which serves its own /metrics.
+if getattr(settings, 'BLACKOUT_INSTRUMENTATION', False):
+    instrument.enable()
+
+
+def metrics(request):
+    """
+    Latency histograms and rejected bids/moves of the Blackout kernel in this process, in the
+    Prometheus text format.
+    """
+    return HttpResponse(instrument.prometheusText(), content_type='text/plain; version=0.0.4')
+
+
+@csrf_exempt
+def tables(request, path):
+    """
+    Forwards a request for the live tables to the game server (BLACKOUT_GAME_SERVER in
+    settings.py), for the development server only: every parked long poll holds a thread here.
+    In production the front end web server routes /tables/ to the game server itself (see
+    README.md).
+    """
+    url = '%s/tables/%s' % (settings.BLACKOUT_GAME_SERVER.rstrip('/'), path)
+
+    if request.META.get('QUERY_STRING'):
+        url += '?' + request.META['QUERY_STRING']
+
+    forwarded = Request(url, data=b'' if request.method == 'POST' else None)   # The arguments are in the query
+    forwarded.get_method = lambda: request.method
+
+    if 'HTTP_IF_NONE_MATCH' in request.META:
+        forwarded.add_header('If-None-Match', request.META['HTTP_IF_NONE_MATCH'])
+
+    try:
+        answer = urlopen(forwarded)
+    except HTTPError as error:      # 304, 400, 403, 404 and 409 are answers of the game server too
+        answer = error
+
+    headers = answer.info()
+
+    response = HttpResponse(answer.read(), status=answer.code,
+                            content_type=headers.get('Content-Type', 'application/json'))
+
+    for header in ('ETag', 'Cache-Control', 'Vary'):
+        if headers.get(header):
+            response[header] = headers.get(header)
+
+    return response